@@ -0,0 +1,396 @@
+# api_client.py
+# 服务器模式（config.API_URL）下访问 api_server.py 的客户端。
+# 界面代码不变：database.connect() 返回 RemoteSession，repositories.open_repository() 返回本模块中
+# 方法与本地仓库相同的远程仓库（只实现界面用到的方法）。
+# HTTP连接保持长连接并放回连接池复用；GET的结果按ETag缓存，数据没有变化时服务器只返回304。
+import http.client
+import json
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlencode
+import config
+import inventory
+import query_stats
+import repositories
+
+# ETag缓存保留的响应数
+ETAG_CACHE_SIZE = 256
+# 可以安全重发的请求方法（重发不会重复修改数据）
+IDEMPOTENT_METHODS = ("GET", "PUT", "DELETE")
+
+
+class ApiError(Exception):
+    """服务器返回错误或无法连接服务器，status 为HTTP状态码（连接失败时为None）"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiClient:
+    """到服务器的HTTP客户端，可以在多个线程中同时使用"""
+
+    def __init__(self, url, token=None, timeout=None, max_idle=None, keepalive=None):
+        parts = urlsplit(url)
+        if parts.scheme != "http" or not parts.hostname:
+            raise ValueError(f"服务器地址无效: {url}")
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.token = token
+        self.timeout = config.API_TIMEOUT if timeout is None else timeout
+        self.max_idle = config.API_POOL_MAX_IDLE if max_idle is None else max_idle
+        self.keepalive = config.API_KEEPALIVE if keepalive is None else keepalive
+        self._idle = []             # [(连接, 归还时间)]，后归还的先取出
+        self._cache = OrderedDict() # 地址 -> (ETag, 结果)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "connections": 0, "not_modified": 0, "retries": 0}
+
+    def _acquire(self):
+        """取出空闲连接，返回 (连接, 是否为复用的连接)"""
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, released = self._idle.pop()
+                if now - released < self.keepalive:
+                    return conn, True
+                conn.close()
+            self.stats["connections"] += 1
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def close(self):
+        """关闭全部空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+    def _send(self, method, url, payload, headers, session):
+        """发送请求并读完响应，返回 (状态码, ETag, 响应体)"""
+        for attempt in (0, 1):
+            conn, reused = self._acquire()
+            if session is not None:
+                session._attach(conn)
+            try:
+                conn.request(method, url, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if session is not None and session.interrupted:
+                    raise ApiError("查询已取消")
+                # 复用的长连接可能已被服务器关闭（例如服务器重启），可以安全重发的请求自动重试一次
+                if reused and attempt == 0 and method in IDEMPOTENT_METHODS and not isinstance(e, socket.timeout):
+                    with self._lock:
+                        self.stats["retries"] += 1
+                    continue
+                raise ApiError(f"无法连接服务器 {self.host}:{self.port}: {e}")
+            finally:
+                if session is not None:
+                    session._detach()
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return response.status, response.getheader("ETag"), data
+
+    def request(self, method, path, params=None, body=None, session=None):
+        """发送请求，返回服务器返回的JSON；服务器返回错误时抛出 ApiError（库存不足为 InsufficientStock）"""
+        params = {name: value for name, value in sorted((params or {}).items()) if value not in (None, "")}
+        url = self.prefix + path + ("?" + urlencode(params) if params else "")
+        # 服务器的语句统计中记为这里发起请求的界面方法（HTTP头只能用ASCII）
+        headers = {"Accept": "application/json",
+                   "X-Call-Site": query_stats.call_site().encode("ascii", "replace").decode("ascii")}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        cached = None
+        if method == "GET":
+            with self._lock:
+                cached = self._cache.get(url)
+            if cached is not None:
+                headers["If-None-Match"] = cached[0]
+        payload = None
+        if body is not None:
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            headers["Content-Type"] = "application/json; charset=utf-8"
+
+        status, etag, data = self._send(method, url, payload, headers, session)
+        with self._lock:
+            self.stats["requests"] += 1
+            if status == 304 and cached is not None:
+                self.stats["not_modified"] += 1
+                self._cache.move_to_end(url)
+                return cached[1]
+
+        result = json.loads(data.decode("utf-8")) if data else None
+        if status >= 400:
+            raise self._error(status, result)
+        if method == "GET" and etag:
+            with self._lock:
+                self._cache[url] = (etag, result)
+                self._cache.move_to_end(url)
+                while len(self._cache) > ETAG_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _error(status, result):
+        """把服务器返回的错误还原为异常"""
+        if not isinstance(result, dict):
+            return ApiError(f"服务器错误（{status}）", status)
+        if result.get("type") == "InsufficientStock":
+            return inventory.InsufficientStock(result["medicine"], result["requested"], result["available"])
+        return ApiError(result.get("error") or f"服务器错误（{status}）", status)
+
+    def check(self):
+        """检查服务器是否可用"""
+        return self.request("GET", "/api/health")
+
+
+class RemoteSession:
+    """服务器模式下代替数据库连接
+
+    每次调用仓库方法都是一个独立的请求，写操作由服务器的写队列各自执行并提交，
+    所以 commit()/rollback() 不做任何事；interrupt() 关闭正在等待响应的连接，用于取消查询。
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.interrupted = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _attach(self, conn):
+        with self._lock:
+            self._conn = conn
+
+    def _detach(self):
+        with self._lock:
+            self._conn = None
+
+    def interrupt(self):
+        with self._lock:
+            self.interrupted = True
+            sock = self._conn.sock if self._conn is not None else None
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def request(self, method, path, params=None, body=None):
+        if self.interrupted:
+            raise ApiError("查询已取消")
+        return self.client.request(method, path, params, body, session=self)
+
+    def get(self, path, **params):
+        return self.request("GET", path, params)
+
+    def get_all(self, path, **params):
+        """读取列表的全部页，返回行的列表"""
+        params["limit"] = config.API_MAX_PAGE_SIZE
+        rows = []
+        while True:
+            page = self.get(path, **params)
+            rows.extend(tuple(row) for row in page["items"])
+            if not page["next"]:
+                return rows
+            params["after"] = page["next"]
+
+    def post(self, path, body):
+        return self.request("POST", path, body=body)
+
+    def put(self, path, body):
+        return self.request("PUT", path, body=body)
+
+    def delete(self, path):
+        return self.request("DELETE", path)
+
+    def visits(self, name, *args):
+        """就诊数量统计 rollups.<name>(*args) 的结果"""
+        return self.get_all(f"/api/stats/{name}", n=args[0] if args else None)
+
+    def open_repository(self, cls):
+        return REMOTE_REPOSITORIES[cls](self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RemoteRepository:
+    def __init__(self, session):
+        self.session = session
+
+
+class RemotePatientRepository(RemoteRepository):
+    def search(self, keyword, criteria=None):
+        return self.session.get_all("/api/patients", keyword=keyword, **(criteria or {}))
+
+    def list(self, criteria=None):
+        return self.session.get_all("/api/patients", **(criteria or {}))
+
+    def page(self, after_id=None, limit=repositories.PAGE_SIZE, criteria=None):
+        after = None if after_id is None else json.dumps(after_id)
+        page = self.session.get("/api/patients", after=after, limit=limit, **(criteria or {}))
+        return [tuple(row) for row in page["items"]]
+
+    def count(self, criteria=None):
+        return self.session.get("/api/patients/count", **(criteria or {}))["count"]
+
+    def id_at(self, position, criteria=None):
+        return self.session.get("/api/patients/position", position=position, **(criteria or {}))["id"]
+
+    def get_history(self, patient_id):
+        return self.session.get(f"/api/patients/{patient_id}/history")["history"]
+
+    def find_by_name_phone(self, name, phone):
+        patient = self.session.get("/api/patients/lookup", name=name, phone=phone)["patient"]
+        return tuple(patient) if patient else None
+
+    def update(self, patient_id, name, gender, age, phone, history):
+        self.session.put(f"/api/patients/{patient_id}",
+                         {"name": name, "gender": gender, "age": age, "phone": phone, "history": history})
+
+    def delete(self, patient_id):
+        self.session.delete(f"/api/patients/{patient_id}")
+
+
+class RemoteRecordRepository(RemoteRepository):
+    def list(self, patient_id=None):
+        return self.session.get_all("/api/records", patient_id=patient_id)
+
+    def page(self, after=None, limit=repositories.PAGE_SIZE):
+        after = None if after is None else json.dumps(list(after), ensure_ascii=False)
+        page = self.session.get("/api/records", after=after, limit=limit)
+        return [tuple(row) for row in page["items"]]
+
+    def find(self, name="", phone="", date="", keyword=""):
+        return self.session.get_all("/api/records", name=name, phone=phone, date=date, keyword=keyword)
+
+    def add_visit(self, patient, record, items):
+        body = {"patient": patient, "record": record, "items": [list(item) for item in items]}
+        return self.session.post("/api/visits", body)["record_id"]
+
+
+class RemotePrescriptionRepository(RemoteRepository):
+    def list(self, record_id=None):
+        return self.session.get_all("/api/prescriptions", record_id=record_id)
+
+    def page(self, after=None, limit=repositories.PAGE_SIZE):
+        after = None if after is None else json.dumps(list(after), ensure_ascii=False)
+        page = self.session.get("/api/prescriptions", after=after, limit=limit)
+        return [tuple(row) for row in page["items"]]
+
+    def find(self, patient_name="", record_id="", date=""):
+        return self.session.get_all("/api/prescriptions", patient_name=patient_name, record_id=record_id, date=date)
+
+    def for_record(self, record_id):
+        return self.session.get_all(f"/api/records/{record_id}/prescriptions")
+
+
+class RemoteMedicineRepository(RemoteRepository):
+    def list(self):
+        return self.session.get_all("/api/medicines")
+
+    def find(self, name="", usage=""):
+        return self.session.get_all("/api/medicines", name=name, usage=usage)
+
+    def get_by_name(self, name):
+        medicine = self.session.get("/api/medicines/lookup", name=name)["medicine"]
+        return tuple(medicine) if medicine else None
+
+    def exists(self, name):
+        return self.get_by_name(name) is not None
+
+    def save(self, name, stock, unit, usage):
+        body = {"name": name, "stock": stock, "unit": unit, "usage": usage}
+        return self.session.post("/api/medicines", body)["created"]
+
+    def delete(self, medicine_id):
+        self.session.delete(f"/api/medicines/{medicine_id}")
+
+    def autocomplete_entries(self):
+        return self.session.get_all("/api/medicines/autocomplete")
+
+
+class RemoteFavoriteRepository(RemoteRepository):
+    def folders(self):
+        return self.session.get_all("/api/folders")
+
+    def find_folders(self, folder_name=""):
+        return self.session.get_all("/api/folders/search", name=folder_name)
+
+    def folder_names(self):
+        return self.session.get_all("/api/folders/names")
+
+    def folder_id(self, name):
+        return self.session.get("/api/folders/lookup", name=name)["id"]
+
+    def create_folder(self, name):
+        return self.session.post("/api/folders", {"name": name})["id"]
+
+    def delete_folder(self, folder_id):
+        self.session.delete(f"/api/folders/{folder_id}")
+
+    def favorites(self):
+        return self.session.get_all("/api/favorites")
+
+    def favorites_in_folder(self, folder_id):
+        return self.session.get_all("/api/favorites", folder_id=folder_id)
+
+    def add(self, folder_id, record_id, patient_name, prescription_data):
+        body = {"folder_id": folder_id, "record_id": record_id, "patient_name": patient_name,
+                "prescription_data": prescription_data}
+        return self.session.post("/api/favorites", body)["id"]
+
+    def add_to_new_folder(self, folder_name, record_id, patient_name, prescription_data):
+        favorite = {"record_id": record_id, "patient_name": patient_name, "prescription_data": prescription_data}
+        return self.session.post("/api/folders", {"name": folder_name, "favorite": favorite})["id"]
+
+    def delete(self, favorite_id):
+        self.session.delete(f"/api/favorites/{favorite_id}")
+
+
+# 本地仓库 -> 远程仓库
+REMOTE_REPOSITORIES = {
+    repositories.PatientRepository: RemotePatientRepository,
+    repositories.RecordRepository: RemoteRecordRepository,
+    repositories.PrescriptionRepository: RemotePrescriptionRepository,
+    repositories.MedicineRepository: RemoteMedicineRepository,
+    repositories.FavoriteRepository: RemoteFavoriteRepository,
+}
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """返回按 config.API_URL 创建的客户端（全局共用一个）"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ApiClient(config.API_URL, token=config.API_TOKEN)
+        return _client
+
+def open_session():
+    return RemoteSession(get_client())
+
+def close_client():
+    """程序退出时关闭空闲连接"""
+    with _client_lock:
+        if _client is not None:
+            _client.close()
@@ -0,0 +1,487 @@
+# api_server.py
+# 局域网HTTP/JSON服务：多台电脑共用诊所数据时，由一台电脑运行本服务独占数据库，
+# 其他电脑把 config.API_URL 设为该服务器地址，通过 api_client.py 访问（界面代码不变，见 database.connect）。
+#     python api_server.py                      按 config.API_HOST / API_PORT 监听（默认只允许本机访问）
+#     python api_server.py --host 0.0.0.0       供局域网内其他电脑访问，需先设置 config.API_TOKEN
+#     python api_server.py --port 9000 --db D:/clinic.db
+#
+# 列表接口返回 {"items": [...], "next": 下一页游标或null}，下一页请求带 after=游标；
+# 按主键排序的列表（全部患者、全部病历、全部处方）用keyset游标，带查询条件的列表按偏移量分页。
+# GET接口返回弱ETag（由涉及的表的数据版本号组成，见 migrations 第9版），
+# 请求带 If-None-Match 且数据没有变化时直接返回304，不再执行查询。
+# 写接口交给写队列（见 write_queue.py），各终端同时提交的写合并提交，不再争抢数据库锁；
+# 库存不足返回409，其余错误返回 {"error": 说明}。GET /api/metrics 返回写队列、连接池和SQL语句的统计。
+import argparse
+import ipaddress
+import json
+import logging
+import re
+import secrets
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import config
+import database
+import inventory
+import query_stats
+import rollups
+import write_queue
+from repositories import (PatientRepository, RecordRepository, PrescriptionRepository, MedicineRepository,
+                          FavoriteRepository)
+
+logger = logging.getLogger(__name__)
+
+# 服务启动时生成，写入ETag：服务器重启（例如恢复了备份）后客户端的缓存全部失效
+BOOT_TOKEN = secrets.token_hex(4)
+
+# 患者的查询条件参数
+PATIENT_CRITERIA = ("name", "phone", "age")
+
+# 各数据的表，ETag由这些表的数据版本号组成
+PATIENT_TABLES = ("patients",)
+RECORD_TABLES = ("medical_records", "patients")
+PRESCRIPTION_TABLES = ("prescriptions", "medical_records", "patients")
+MEDICINE_TABLES = ("medicines",)
+FAVORITE_TABLES = ("favorite_folders", "favorite_prescriptions")
+
+# (方法, 路径正则, 处理函数, ETag涉及的表, 是否为写操作)
+ROUTES = []
+
+
+class HttpError(Exception):
+    """返回给客户端的错误"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    """解析后的请求：路径中的参数、查询参数和JSON请求体"""
+
+    def __init__(self, args, query, body):
+        self.args = args
+        self.query = query
+        self.body = body
+
+    def text(self, name):
+        return self.query.get(name, "")
+
+    def number(self, name, default=None):
+        value = self.query.get(name, "")
+        if not value:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise HttpError(400, f"参数 {name} 必须是整数")
+
+    def limit(self):
+        limit = self.number("limit", config.API_PAGE_SIZE)
+        if limit < 1:
+            raise HttpError(400, "参数 limit 必须大于0")
+        return min(limit, config.API_MAX_PAGE_SIZE)
+
+    def cursor(self):
+        """keyset游标，为上一页最后一行的排序键（JSON）"""
+        after = self.query.get("after")
+        if not after:
+            return None
+        try:
+            return json.loads(after)
+        except ValueError:
+            raise HttpError(400, "参数 after 无效")
+
+    def field(self, name):
+        if not isinstance(self.body, dict) or name not in self.body:
+            raise HttpError(400, f"缺少字段 {name}")
+        return self.body[name]
+
+
+def route(method, pattern, tables=(), write=False):
+    """注册接口，处理函数形如 handler(conn, request)，写接口由写队列执行"""
+    def register(handler):
+        ROUTES.append((method, re.compile(f"^{pattern}$"), handler, tables, write))
+        return handler
+    return register
+
+def find_route(method, path):
+    """返回 (处理函数, 路径参数, 涉及的表, 是否为写操作)"""
+    allowed = False
+    for route_method, pattern, handler, tables, write in ROUTES:
+        match = pattern.match(path)
+        if match:
+            if route_method == method:
+                return handler, [int(arg) if arg.isdigit() else arg for arg in match.groups()], tables, write
+            allowed = True
+    if allowed:
+        raise HttpError(405, "不支持的请求方法")
+    raise HttpError(404, "接口不存在")
+
+def compute_etag(conn, tables):
+    """由表的数据版本号计算弱ETag；统计接口按日期统计，所以也包含当天日期（UTC，与SQLite一致）"""
+    marks = ",".join("?" * len(tables))
+    versions = dict(conn.execute(f"SELECT name, version FROM data_versions WHERE name IN ({marks})", tables).fetchall())
+    today = datetime.now(timezone.utc).strftime("%Y%m%d")
+    return f'W/"{BOOT_TOKEN}-{today}-{".".join(str(versions.get(t, 0)) for t in tables)}"'
+
+def keyset_page(rows, limit, key):
+    """rows 为按 limit + 1 读取的结果，多出的一行说明还有下一页"""
+    items = rows[:limit]
+    next_cursor = json.dumps(key(items[-1]), ensure_ascii=False) if len(rows) > limit else None
+    return {"items": items, "next": next_cursor}
+
+def offset_page(rows, request):
+    """按偏移量分页，游标为下一页的起始位置"""
+    offset = request.cursor() or 0
+    if not isinstance(offset, int) or offset < 0:
+        raise HttpError(400, "参数 after 无效")
+    end = offset + request.limit()
+    return {"items": rows[offset:end], "next": str(end) if end < len(rows) else None}
+
+def patient_criteria(request):
+    return {name: request.text(name) for name in PATIENT_CRITERIA}
+
+
+# ---- 患者 ----
+
+@route("GET", "/api/health")
+def health(conn, request):
+    return {"status": "ok"}
+
+@route("GET", "/api/metrics")
+def metrics(conn, request):
+    return {"writes": write_queue.get_write_stats(), "pool": database.get_pool_stats(),
+            "queries": query_stats.top_statements()}
+
+@route("GET", "/api/patients", PATIENT_TABLES)
+def list_patients(conn, request):
+    patients = PatientRepository(conn)
+    criteria = patient_criteria(request)
+    if request.text("keyword"):
+        return offset_page(patients.search(request.text("keyword"), criteria), request)
+    limit = request.limit()
+    return keyset_page(patients.page(request.cursor(), limit + 1, criteria), limit, lambda row: row[0])
+
+@route("GET", "/api/patients/count", PATIENT_TABLES)
+def count_patients(conn, request):
+    return {"count": PatientRepository(conn).count(patient_criteria(request))}
+
+@route("GET", "/api/patients/position", PATIENT_TABLES)
+def patient_at(conn, request):
+    return {"id": PatientRepository(conn).id_at(request.number("position", 0), patient_criteria(request))}
+
+@route("GET", "/api/patients/lookup", PATIENT_TABLES)
+def lookup_patient(conn, request):
+    return {"patient": PatientRepository(conn).find_by_name_phone(request.text("name"), request.text("phone"))}
+
+@route("GET", r"/api/patients/(\d+)/history", PATIENT_TABLES)
+def patient_history(conn, request):
+    return {"history": PatientRepository(conn).get_history(request.args[0])}
+
+@route("PUT", r"/api/patients/(\d+)", write=True)
+def update_patient(conn, request):
+    PatientRepository(conn).update(request.args[0], request.field("name"), request.field("gender"),
+                                   request.field("age"), request.field("phone"), request.field("history"))
+    return {}
+
+@route("DELETE", r"/api/patients/(\d+)", write=True)
+def delete_patient(conn, request):
+    PatientRepository(conn).delete(request.args[0])
+    return {}
+
+
+# ---- 病历和处方 ----
+
+@route("GET", "/api/records", RECORD_TABLES)
+def list_records(conn, request):
+    records = RecordRepository(conn)
+    if request.text("patient_id"):
+        return offset_page(records.list(request.number("patient_id")), request)
+    filters = [request.text(name) for name in ("name", "phone", "date", "keyword")]
+    if any(filters):
+        return offset_page(records.find(*filters), request)
+    limit = request.limit()
+    return keyset_page(records.page(request.cursor(), limit + 1), limit, lambda row: [row[2], row[0]])
+
+@route("GET", r"/api/records/(\d+)/prescriptions", ("prescriptions",))
+def record_prescriptions(conn, request):
+    return {"items": PrescriptionRepository(conn).for_record(request.args[0]), "next": None}
+
+@route("POST", "/api/visits", write=True)
+def add_visit(conn, request):
+    record_id = RecordRepository(conn).add_visit(request.field("patient"), request.field("record"),
+                                                 request.field("items"))
+    return {"record_id": record_id}
+
+@route("GET", "/api/prescriptions", PRESCRIPTION_TABLES)
+def list_prescriptions(conn, request):
+    prescriptions = PrescriptionRepository(conn)
+    filters = [request.text(name) for name in ("patient_name", "record_id", "date")]
+    if any(filters):
+        return offset_page(prescriptions.find(*filters), request)
+    limit = request.limit()
+    return keyset_page(prescriptions.page(request.cursor(), limit + 1), limit, lambda row: [row[4], row[6]])
+
+
+# ---- 药品 ----
+
+@route("GET", "/api/medicines", MEDICINE_TABLES)
+def list_medicines(conn, request):
+    medicines = MedicineRepository(conn)
+    if request.text("name") or request.text("usage"):
+        return offset_page(medicines.find(request.text("name"), request.text("usage")), request)
+    return offset_page(medicines.list(), request)
+
+@route("GET", "/api/medicines/lookup", MEDICINE_TABLES)
+def lookup_medicine(conn, request):
+    return {"medicine": MedicineRepository(conn).get_by_name(request.text("name"))}
+
+@route("GET", "/api/medicines/autocomplete", ("medicines", "prescriptions"))
+def medicine_autocomplete(conn, request):
+    return offset_page(MedicineRepository(conn).autocomplete_entries(), request)
+
+@route("POST", "/api/medicines", write=True)
+def save_medicine(conn, request):
+    created = MedicineRepository(conn).save(request.field("name"), request.field("stock"), request.field("unit"),
+                                            request.field("usage"))
+    return {"created": created}
+
+@route("DELETE", r"/api/medicines/(\d+)", write=True)
+def delete_medicine(conn, request):
+    MedicineRepository(conn).delete(request.args[0])
+    return {}
+
+
+# ---- 收藏夹 ----
+
+@route("GET", "/api/folders", FAVORITE_TABLES)
+def list_folders(conn, request):
+    return offset_page(FavoriteRepository(conn).folders(), request)
+
+@route("GET", "/api/folders/search", FAVORITE_TABLES)
+def search_folders(conn, request):
+    return offset_page(FavoriteRepository(conn).find_folders(request.text("name")), request)
+
+@route("GET", "/api/folders/names", ("favorite_folders",))
+def folder_names(conn, request):
+    return offset_page(FavoriteRepository(conn).folder_names(), request)
+
+@route("GET", "/api/folders/lookup", ("favorite_folders",))
+def lookup_folder(conn, request):
+    return {"id": FavoriteRepository(conn).folder_id(request.text("name"))}
+
+@route("POST", "/api/folders", write=True)
+def create_folder(conn, request):
+    """新建收藏夹；请求中带 favorite 时同时把处方收藏到其中，返回收藏的ID"""
+    favorites = FavoriteRepository(conn)
+    favorite = request.body.get("favorite") if isinstance(request.body, dict) else None
+    if favorite is None:
+        return {"id": favorites.create_folder(request.field("name"))}
+    favorite_id = favorites.add_to_new_folder(request.field("name"), favorite.get("record_id"),
+                                              favorite.get("patient_name"), favorite.get("prescription_data"))
+    return {"id": favorite_id}
+
+@route("DELETE", r"/api/folders/(\d+)", write=True)
+def delete_folder(conn, request):
+    FavoriteRepository(conn).delete_folder(request.args[0])
+    return {}
+
+@route("GET", "/api/favorites", FAVORITE_TABLES)
+def list_favorites(conn, request):
+    favorites = FavoriteRepository(conn)
+    if request.text("folder_id"):
+        return offset_page(favorites.favorites_in_folder(request.number("folder_id")), request)
+    return offset_page(favorites.favorites(), request)
+
+@route("POST", "/api/favorites", write=True)
+def add_favorite(conn, request):
+    favorite_id = FavoriteRepository(conn).add(request.field("folder_id"), request.field("record_id"),
+                                               request.field("patient_name"), request.field("prescription_data"))
+    return {"id": favorite_id}
+
+@route("DELETE", r"/api/favorites/(\d+)", write=True)
+def delete_favorite(conn, request):
+    FavoriteRepository(conn).delete(request.args[0])
+    return {}
+
+
+# ---- 统计 ----
+
+# 统计图表可用的汇总查询
+STATS = {
+    "daily_visits": rollups.daily_visits,
+    "monthly_visits": rollups.monthly_visits,
+    "yearly_visits": rollups.yearly_visits,
+}
+
+@route("GET", "/api/stats/(daily_visits|monthly_visits|yearly_visits)", ("medical_records",))
+def visit_stats(conn, request):
+    # 汇总表由 rollups 自行读取
+    fetch = STATS[request.args[0]]
+    count = request.number("n")
+    return {"items": fetch() if count is None else fetch(count), "next": None}
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """处理一个客户端连接上的请求（HTTP/1.1长连接）"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "DoctorSystem"
+    # 空闲的长连接超过该秒数由服务器关闭，比客户端复用连接的时限长，客户端不会用到已关闭的连接
+    timeout = config.API_KEEPALIVE * 2
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        try:
+            # 先读完请求体，出错时连接上的下一个请求才能正常解析
+            body = self.read_body()
+            self.check_token()
+            status, data, etag = self.handle_api(method, body)
+        except HttpError as e:
+            status, data, etag = e.status, {"error": str(e)}, None
+        except inventory.InsufficientStock as e:
+            status, etag = 409, None
+            data = {"error": str(e), "type": "InsufficientStock",
+                    "medicine": e.medicine, "requested": e.requested, "available": e.available}
+        except Exception as e:
+            logger.exception("处理请求失败: %s %s", method, self.path)
+            status, data, etag = 500, {"error": str(e)}, None
+        try:
+            self.send_json(status, data, etag)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端取消了查询（见 api_client.RemoteSession.interrupt）
+            self.close_connection = True
+
+    def read_body(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > config.API_MAX_BODY:
+            # 不读取请求体，连接上后续的数据无法解析，回复后关闭连接
+            self.close_connection = True
+            if length < 0:
+                raise HttpError(400, "Content-Length 无效")
+            raise HttpError(413, f"请求体超过 {config.API_MAX_BODY} 字节")
+        if not length:
+            return None
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw.decode("utf-8"))
+        except ValueError:
+            raise HttpError(400, "请求体不是有效的JSON")
+
+    def check_token(self):
+        if not config.API_TOKEN:
+            return
+        expected = f"Bearer {config.API_TOKEN}"
+        if not secrets.compare_digest(self.headers.get("Authorization", ""), expected):
+            raise HttpError(401, "访问令牌无效")
+
+    def handle_api(self, method, body):
+        """执行接口，返回 (状态码, 数据, ETag)；数据为None表示304"""
+        parts = urlsplit(self.path)
+        handler, args, tables, write = find_route(method, parts.path)
+        query = {name: values[0] for name, values in parse_qs(parts.query, keep_blank_values=True).items()}
+        request = Request(args, query, body)
+        # 语句统计中记为客户端发起请求的位置（见 api_client.ApiClient.request）
+        site = self.headers.get("X-Call-Site") or handler.__name__
+
+        with query_stats.call_context(site):
+            if write:
+                return 200, write_queue.execute(handler, request), None
+
+            with database.connection() as conn:
+                etag = None
+                if tables:
+                    # 先读版本号再查询：期间数据有变化时ETag比数据旧，下次请求会重新查询
+                    etag = compute_etag(conn, tables)
+                    if etag in self.headers.get("If-None-Match", ""):
+                        return 304, None, etag
+                return 200, handler(conn, request), etag
+
+    def send_json(self, status, data, etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if data is None:
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+def is_loopback(host):
+    """监听地址是否只允许本机访问"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def check_host(host):
+    """未设置访问令牌时只允许监听本机地址，否则局域网内的任何电脑都可以读写患者数据"""
+    if not config.API_TOKEN and not is_loopback(host):
+        raise ValueError(f"监听 {host} 需要先在 config.py 中设置 API_TOKEN（或改为只监听 127.0.0.1）")
+
+def create_server(host=None, port=None):
+    """创建服务（尚未开始处理请求），每个客户端连接由一个线程处理"""
+    host = config.API_HOST if host is None else host
+    port = config.API_PORT if port is None else port
+    check_host(host)
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="局域网内多台电脑共用诊所数据的HTTP服务")
+    parser.add_argument("--host", default=config.API_HOST, help="监听地址")
+    parser.add_argument("--port", type=int, default=config.API_PORT, help="监听端口")
+    parser.add_argument("--db", help="数据库文件，默认为 config.DB_FILE")
+    args = parser.parse_args(argv)
+    try:
+        check_host(args.host)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.db:
+        config.DB_FILE = args.db
+    database.init_db()
+    database.start_checkpointer()
+
+    server = create_server(args.host, args.port)
+    logger.info("服务已启动: http://%s:%s ，数据库 %s", args.host, server.server_address[1], config.DB_FILE)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        write_queue.stop_write_queue()
+        database.stop_checkpointer()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# autocomplete.py
+# 自动完成：在内存中为药品名称建立有序前缀数组（二分查找）和二元组倒排索引（子串匹配），
+# 结果按处方中的使用次数排序；药品新增或删除后调用 invalidate_medicine_index() 重建
+import bisect
+import threading
+from database import connect
+from repositories import MedicineRepository, open_repository
+
+# 下拉框最多显示的候选数
+AUTOCOMPLETE_LIMIT = 20
+# 按键后等待的毫秒数，连续输入时只在停顿后查询一次
+AUTOCOMPLETE_DELAY = 150
+
+
+class AutocompleteIndex:
+    """名称自动完成索引
+
+    entries 为 [(名称, 使用次数, 额外的匹配键...)]，额外的匹配键一般是拼音首字母和全拼。
+    前缀匹配在按键排序的数组上二分查找；前缀匹配不足时用二元组（单字时用单字）
+    倒排索引找出包含输入文字的名称。
+    """
+
+    def __init__(self, entries):
+        # 按使用次数从高到低、名称从短到长排列，候选的编号即为排名
+        entries = sorted(entries, key=lambda e: (-e[1], len(e[0]), e[0]))
+        self.names = [e[0] for e in entries]
+
+        keys = []
+        self._grams = {}
+        for rank, entry in enumerate(entries):
+            name = entry[0].lower()
+            for key in {name, *(k for k in entry[2:] if k)}:
+                keys.append((key, rank))
+            for gram in self._ngrams(name):
+                self._grams.setdefault(gram, set()).add(rank)
+        keys.sort()
+        self._keys = [k for k, _ in keys]
+        self._ranks = [r for _, r in keys]
+
+    @staticmethod
+    def _ngrams(text):
+        if len(text) < 2:
+            return set(text)
+        return {text[i:i + 2] for i in range(len(text) - 1)} | set(text)
+
+    def prefix_matches(self, prefix):
+        """返回名称或匹配键以 prefix 开头的候选编号"""
+        start = bisect.bisect_left(self._keys, prefix)
+        # 所有以 prefix 开头的键都排在 prefix + 最大字符 之前
+        end = bisect.bisect_left(self._keys, prefix + "\U0010ffff", start)
+        return set(self._ranks[start:end])
+
+    def substring_matches(self, text):
+        """返回名称中包含 text 的候选编号"""
+        grams = [text] if len(text) == 1 else [text[i:i + 2] for i in range(len(text) - 1)]
+        candidates = None
+        for gram in grams:
+            ranks = self._grams.get(gram)
+            if not ranks:
+                return set()
+            candidates = set(ranks) if candidates is None else candidates & ranks
+        # 二元组都出现不代表连续出现，最后再确认一次
+        return {r for r in candidates if text in self.names[r].lower()}
+
+    def complete(self, text, limit=AUTOCOMPLETE_LIMIT):
+        """返回最多 limit 个候选：先是前缀匹配，再是子串匹配，各自按使用次数排序"""
+        text = text.strip().lower()
+        if not text:
+            return self.names[:limit]
+        prefix = sorted(self.prefix_matches(text))
+        results = [self.names[r] for r in prefix[:limit]]
+        if len(results) < limit:
+            seen = set(prefix)
+            substring = sorted(self.substring_matches(text) - seen)
+            results.extend(self.names[r] for r in substring[:limit - len(results)])
+        return results
+
+
+_medicine_index = None
+_medicine_lock = threading.Lock()
+
+def load_medicine_entries():
+    """读取药品名称、处方使用次数和拼音"""
+    conn = connect()
+    try:
+        return open_repository(MedicineRepository, conn).autocomplete_entries()
+    finally:
+        conn.close()
+
+def get_medicine_index():
+    """返回药品自动完成索引，失效后第一次调用时重建"""
+    global _medicine_index
+    with _medicine_lock:
+        if _medicine_index is None:
+            _medicine_index = AutocompleteIndex(load_medicine_entries())
+        return _medicine_index
+
+def invalidate_medicine_index():
+    """药品或处方变化后使索引失效"""
+    global _medicine_index
+    with _medicine_lock:
+        _medicine_index = None
+
+
+class Debouncer:
+    """延迟执行：在 delay 毫秒内重复调用时只执行最后一次"""
+
+    def __init__(self, widget, delay, callback):
+        self.widget = widget
+        self.delay = delay
+        self.callback = callback
+        self._after_id = None
+
+    def __call__(self, *args):
+        self.cancel()
+        self._after_id = self.widget.after(self.delay, self._fire, *args)
+
+    def _fire(self, *args):
+        self._after_id = None
+        self.callback(*args)
+
+    def cancel(self):
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
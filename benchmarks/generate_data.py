@@ -0,0 +1,314 @@
+# benchmarks/generate_data.py
+# 生成模拟的诊所数据库，用于性能测试和分析：患者、病历、处方和药品目录，
+# 中药名称取自常用饮片，处方用药频率服从Zipf分布（少数常用药占大部分处方）。
+# 同样的参数和随机种子总是生成同样的数据（日期相对于固定的 --end-date，而不是今天）。
+# 数据库通过 init_db 建立，全文索引、汇总表等触发器维护的数据与程序写入的一致。
+#
+# 用法：
+#     python benchmarks/generate_data.py --scale 1k                 1千条病历
+#     python benchmarks/generate_data.py --scale 100k --seed 7
+#     python benchmarks/generate_data.py --scale 1m --output /tmp/clinic_1m.db
+#     python benchmarks/generate_data.py --records 5000 --visits-per-patient 2 --prescriptions-per-visit 10
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+# 仓库根目录（被测模块所在目录）
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+
+# 数据规模：名称 -> 病历数
+SCALES = {
+    "1k": 1_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+}
+
+# 默认输出目录
+DATA_DIR = os.path.join(ROOT, "benchmarks", "data")
+
+# 每批写入的行数
+BATCH_SIZE = 10_000
+
+# 常用中药饮片：(名称, 常用剂量下限g, 上限g, 用法)
+HERBS = [
+    ("甘草", 3, 10, "水煎服"), ("黄芪", 10, 30, "水煎服"), ("当归", 6, 12, "水煎服"),
+    ("白术", 6, 12, "水煎服"), ("茯苓", 10, 15, "水煎服"), ("党参", 10, 30, "水煎服"),
+    ("白芍", 6, 15, "水煎服"), ("川芎", 3, 10, "水煎服"), ("熟地黄", 10, 30, "水煎服"),
+    ("柴胡", 3, 10, "水煎服"), ("陈皮", 3, 10, "水煎服"), ("半夏", 3, 10, "水煎服"),
+    ("生姜", 3, 10, "水煎服"), ("大枣", 6, 15, "水煎服"), ("桂枝", 3, 10, "水煎服"),
+    ("麻黄", 2, 10, "先煎"), ("杏仁", 5, 10, "后下"), ("桔梗", 3, 10, "水煎服"),
+    ("黄芩", 3, 10, "水煎服"), ("黄连", 2, 5, "水煎服"), ("黄柏", 3, 12, "水煎服"),
+    ("栀子", 6, 10, "水煎服"), ("连翘", 6, 15, "水煎服"), ("金银花", 6, 15, "水煎服"),
+    ("板蓝根", 9, 15, "水煎服"), ("薄荷", 3, 6, "后下"), ("荆芥", 5, 10, "水煎服"),
+    ("防风", 5, 10, "水煎服"), ("羌活", 3, 10, "水煎服"), ("独活", 3, 10, "水煎服"),
+    ("葛根", 10, 15, "水煎服"), ("升麻", 3, 10, "水煎服"), ("知母", 6, 12, "水煎服"),
+    ("石膏", 15, 60, "先煎"), ("天花粉", 10, 15, "水煎服"), ("生地黄", 10, 15, "水煎服"),
+    ("玄参", 10, 15, "水煎服"), ("牡丹皮", 6, 12, "水煎服"), ("赤芍", 6, 12, "水煎服"),
+    ("麦冬", 6, 12, "水煎服"), ("天冬", 6, 12, "水煎服"), ("沙参", 10, 15, "水煎服"),
+    ("玉竹", 6, 12, "水煎服"), ("百合", 6, 12, "水煎服"), ("枸杞子", 6, 12, "水煎服"),
+    ("山药", 15, 30, "水煎服"), ("山茱萸", 6, 12, "水煎服"), ("泽泻", 6, 10, "水煎服"),
+    ("猪苓", 6, 12, "水煎服"), ("薏苡仁", 10, 30, "水煎服"), ("车前子", 9, 15, "包煎"),
+    ("木通", 3, 6, "水煎服"), ("滑石", 10, 20, "包煎"), ("苍术", 3, 9, "水煎服"),
+    ("厚朴", 3, 10, "水煎服"), ("枳实", 3, 10, "水煎服"), ("枳壳", 3, 10, "水煎服"),
+    ("木香", 3, 6, "后下"), ("香附", 6, 10, "水煎服"), ("砂仁", 3, 6, "后下"),
+    ("豆蔻", 3, 6, "后下"), ("藿香", 5, 10, "水煎服"), ("佩兰", 5, 10, "水煎服"),
+    ("神曲", 6, 15, "水煎服"), ("山楂", 9, 12, "水煎服"), ("麦芽", 10, 15, "水煎服"),
+    ("鸡内金", 3, 10, "水煎服"), ("莱菔子", 5, 12, "水煎服"), ("大黄", 3, 15, "后下"),
+    ("芒硝", 6, 12, "冲服"), ("火麻仁", 10, 15, "水煎服"), ("桃仁", 5, 10, "水煎服"),
+    ("红花", 3, 10, "水煎服"), ("丹参", 10, 15, "水煎服"), ("益母草", 9, 30, "水煎服"),
+    ("牛膝", 5, 12, "水煎服"), ("延胡索", 3, 10, "水煎服"), ("郁金", 3, 10, "水煎服"),
+    ("三七", 3, 9, "研末冲服"), ("蒲黄", 5, 10, "包煎"), ("艾叶", 3, 9, "水煎服"),
+    ("酸枣仁", 10, 15, "水煎服"), ("远志", 3, 10, "水煎服"), ("柏子仁", 3, 10, "水煎服"),
+    ("合欢皮", 6, 12, "水煎服"), ("龙骨", 15, 30, "先煎"), ("牡蛎", 9, 30, "先煎"),
+    ("天麻", 3, 10, "水煎服"), ("钩藤", 3, 12, "后下"), ("石决明", 6, 20, "先煎"),
+    ("菊花", 5, 10, "水煎服"), ("桑叶", 5, 10, "水煎服"), ("蝉蜕", 3, 6, "水煎服"),
+    ("牛蒡子", 6, 12, "水煎服"), ("桑白皮", 6, 12, "水煎服"), ("紫苏叶", 5, 10, "水煎服"),
+    ("紫菀", 5, 10, "水煎服"), ("款冬花", 5, 10, "水煎服"), ("百部", 3, 9, "水煎服"),
+    ("川贝母", 3, 10, "研末冲服"), ("浙贝母", 5, 10, "水煎服"), ("瓜蒌", 9, 15, "水煎服"),
+    ("五味子", 2, 6, "水煎服"), ("乌梅", 6, 12, "水煎服"), ("杜仲", 6, 10, "水煎服"),
+    ("续断", 9, 15, "水煎服"), ("菟丝子", 6, 12, "水煎服"), ("淫羊藿", 6, 10, "水煎服"),
+    ("巴戟天", 3, 10, "水煎服"), ("肉桂", 1, 5, "后下"), ("附子", 3, 15, "先煎"),
+    ("干姜", 3, 10, "水煎服"), ("吴茱萸", 2, 5, "水煎服"), ("小茴香", 3, 6, "水煎服"),
+    ("阿胶", 3, 9, "烊化"), ("何首乌", 6, 12, "水煎服"), ("女贞子", 6, 12, "水煎服"),
+    ("墨旱莲", 6, 12, "水煎服"), ("桑寄生", 9, 15, "水煎服"), ("威灵仙", 6, 10, "水煎服"),
+    ("秦艽", 3, 10, "水煎服"), ("木瓜", 6, 9, "水煎服"), ("白芷", 3, 10, "水煎服"),
+    ("细辛", 1, 3, "水煎服"), ("苦参", 4, 9, "水煎服"), ("白鲜皮", 5, 10, "水煎服"),
+    ("地肤子", 9, 15, "水煎服"), ("蒲公英", 10, 15, "水煎服"), ("紫花地丁", 15, 30, "水煎服"),
+]
+
+# 炮制方法，药品目录比 HERBS 大时用于生成更多品种
+PROCESSING = ["炙", "炒", "生", "酒", "醋", "盐", "姜", "焦"]
+
+# 中成药：(名称, 单位, 用法)
+PATENT_MEDICINES = [
+    ("六味地黄丸", "盒", "口服"), ("逍遥丸", "盒", "口服"), ("藿香正气水", "盒", "口服"),
+    ("连花清瘟胶囊", "盒", "口服"), ("板蓝根颗粒", "包", "冲服"), ("小柴胡颗粒", "包", "冲服"),
+    ("复方丹参滴丸", "瓶", "含服"), ("云南白药", "瓶", "外用"), ("阿莫西林", "盒", "口服"),
+    ("暖贴", "贴", "热敷"),
+]
+
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢姜崔钟谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武戴莫孔向汤"
+GIVEN_NAMES = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华玉兰萍红鹏辉建国文亮斌宇浩凯俊帅云莉晨欣怡佳琪梓涵子轩雨婷嘉欣思远志强海燕秀英淑珍"
+
+HISTORIES = ["", "", "", "高血压", "糖尿病", "慢性胃炎", "过敏性鼻炎", "腰椎间盘突出", "失眠多年", "慢性支气管炎",
+             "青霉素过敏", "甲状腺结节", "颈椎病", "痛风", "慢性咽炎", "月经不调", "偏头痛"]
+
+# 望闻问切和辨证模板
+WANG = ["面色萎黄", "面色潮红", "面色苍白", "舌淡苔白", "舌红少苔", "舌红苔黄腻", "舌淡胖有齿痕", "舌暗有瘀点"]
+WEN = ["语声低微", "声音嘶哑", "咳声重浊", "呼吸气粗", "口气臭秽", "无明显异常"]
+WEN2 = ["咳嗽三天，咳白痰", "头痛两周，遇风加重", "失眠多梦，心悸", "胃脘胀痛，食后加重", "腰膝酸软，夜尿频多",
+        "月经先期，量多色红", "口干口苦，大便秘结", "恶寒发热，无汗身痛", "乏力纳差，便溏", "胸胁胀满，情志不舒"]
+QIE = ["脉浮紧", "脉浮数", "脉弦", "脉弦细", "脉细数", "脉沉细", "脉滑数", "脉沉迟", "脉涩", "脉濡缓"]
+SYNDROMES = [
+    ("风寒感冒", "疏风散寒", "荆防败毒散"), ("风热感冒", "疏风清热", "银翘散"), ("肝郁气滞", "疏肝理气", "柴胡疏肝散"),
+    ("脾胃虚弱", "健脾益气", "四君子汤"), ("心脾两虚", "补益心脾", "归脾汤"), ("肾阴虚", "滋补肾阴", "六味地黄汤"),
+    ("肾阳虚", "温补肾阳", "金匮肾气丸"), ("痰湿阻肺", "燥湿化痰", "二陈汤"), ("血瘀证", "活血化瘀", "血府逐瘀汤"),
+    ("湿热下注", "清热利湿", "八正散"), ("气血两虚", "气血双补", "八珍汤"), ("肝阳上亢", "平肝潜阳", "天麻钩藤饮"),
+]
+
+
+def build_catalogue(size, rng):
+    """生成药品目录 [(名称, 单位, 用法, 剂量下限, 剂量上限), ...]"""
+    catalogue = [(name, "克", usage, low, high) for name, low, high, usage in HERBS]
+    catalogue += [(name, unit, usage, 1, 1) for name, unit, usage in PATENT_MEDICINES]
+    # 需要更多品种时按炮制方法生成（"炙甘草"、"炒白术"等）
+    variants = [(prefix + name, "克", usage, low, high)
+                for prefix in PROCESSING for name, low, high, usage in HERBS]
+    rng.shuffle(variants)
+    catalogue += variants[:max(0, size - len(catalogue))]
+    return catalogue[:size]
+
+def zipf_cumulative_weights(n, exponent):
+    """第k常用的药品权重为 1/k^exponent，返回累计权重"""
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+def pick_distinct(rng, population, cumulative, count):
+    """按累计权重抽取 count 个不同的元素"""
+    total = cumulative[-1]
+    chosen = []
+    seen = set()
+    while len(chosen) < count:
+        index = bisect.bisect_left(cumulative, rng.random() * total)
+        index = min(index, len(population) - 1)
+        if index not in seen:
+            seen.add(index)
+            chosen.append(population[index])
+    return chosen
+
+def random_phone(rng):
+    return "1" + rng.choice("3456789") + "".join(rng.choice("0123456789") for _ in range(9))
+
+def random_name(rng):
+    return rng.choice(SURNAMES) + "".join(rng.choice(GIVEN_NAMES) for _ in range(rng.choice((1, 2, 2))))
+
+def format_dosage(rng, grams, unit):
+    """生成剂量文字，混合"10g"、"10克"、"三钱"等常见写法"""
+    if unit != "克":
+        return f"{grams}{unit}" if rng.random() < 0.5 else str(grams)
+    roll = rng.random()
+    if roll < 0.6:
+        return f"{grams}g"
+    if roll < 0.9:
+        return f"{grams}克"
+    if roll < 0.95 and grams % 3 == 0 and grams // 3 in (1, 2, 3, 4, 5):
+        return "一二三四五"[grams // 3 - 1] + "钱"
+    return "适量" if roll > 0.99 else f"{grams}-{grams + 5}g"
+
+def generate_patients(rng, count):
+    # patients.phone 有 UNIQUE 约束，大规模数据中随机号码会重复
+    phones = set()
+    for _ in range(count):
+        phone = random_phone(rng)
+        while phone in phones:
+            phone = random_phone(rng)
+        phones.add(phone)
+        yield (random_name(rng), rng.choice(("男", "女")), rng.randint(1, 95), phone, rng.choice(HISTORIES))
+
+def generate_records(rng, count, patients, start, days):
+    """病历按日期先后生成（ID越大日期越新，与实际录入一致）"""
+    offsets = sorted(rng.randrange(days) for _ in range(count))
+    for offset in offsets:
+        syndrome, method, formula = rng.choice(SYNDROMES)
+        yield (
+            rng.randint(1, patients),
+            (start + timedelta(days=offset)).isoformat(),
+            rng.choice(WANG), rng.choice(WEN), rng.choice(WEN2), rng.choice(QIE),
+            syndrome, f"{method}，方用{formula}加减",
+        )
+
+def generate_prescriptions(rng, records, per_visit, catalogue, cumulative):
+    from dosage import parse_dosage
+    low = max(1, per_visit // 2)
+    high = max(low, per_visit * 3 // 2)
+    for record_id in range(1, records + 1):
+        count = min(rng.randint(low, high), len(catalogue))
+        for name, unit, usage, dose_low, dose_high in pick_distinct(rng, catalogue, cumulative, count):
+            dosage = format_dosage(rng, rng.randint(dose_low, dose_high), unit)
+            quantity, dosage_unit = parse_dosage(dosage)
+            yield (record_id, name, dosage, usage, quantity, dosage_unit)
+
+def insert_batches(conn, sql, rows, label, total):
+    """分批写入，每批一个事务，返回写入的行数"""
+    written = 0
+    started = time.perf_counter()
+    while True:
+        batch = list(itertools.islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        with conn:
+            conn.executemany(sql, batch)
+        written += len(batch)
+        elapsed = time.perf_counter() - started
+        print(f"\r  {label}: {written}/{total} ({written / elapsed:,.0f} 行/秒)", end="", flush=True)
+    print()
+    return written
+
+def generate(output, records, visits_per_patient=5, prescriptions_per_visit=6, medicines=150,
+             zipf_exponent=1.1, days=3 * 365, end_date=date(2025, 12, 31), seed=42):
+    """生成数据库，返回各表行数"""
+    if os.path.exists(output):
+        raise FileExistsError(f"{output} 已存在，使用 --force 覆盖")
+    rng = random.Random(seed)
+    patients = max(1, round(records / visits_per_patient))
+
+    # 通过程序自身的迁移建表，触发器会维护全文索引和汇总表
+    config.DB_FILE = output
+    from database import init_db
+    init_db()
+
+    import inventory
+    import pinyin_index
+
+    conn = sqlite3.connect(output)
+    # 生成的数据可以随时重新生成，不需要每次提交都刷盘
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -200000")
+    try:
+        catalogue = build_catalogue(medicines, rng)
+        # 用药频率按在目录中的排名计算，先打乱使常用药不总是排在前面的那几味
+        ranked = catalogue[:]
+        rng.shuffle(ranked)
+        cumulative = zipf_cumulative_weights(len(ranked), zipf_exponent)
+
+        print(f"生成 {output}: {patients} 位患者，{records} 条病历，{len(catalogue)} 种药品")
+        with conn:
+            for name, unit, usage, _, _ in catalogue:
+                stock = 100000 if unit == "克" else 500
+                medicine_id = conn.execute(
+                    "INSERT INTO medicines (name, stock, unit, usage, price) VALUES (?, ?, ?, ?, ?)",
+                    (name, stock, unit, usage, round(rng.uniform(0.05, 2.0), 2))
+                ).lastrowid
+                inventory.record_movement(conn, medicine_id, name, stock, stock, inventory.REASON_INITIAL)
+
+        insert_batches(conn, "INSERT INTO patients (name, gender, age, phone, history) VALUES (?, ?, ?, ?, ?)",
+                       generate_patients(rng, patients), "患者", patients)
+        start = end_date - timedelta(days=days - 1)
+        insert_batches(conn, """
+            INSERT INTO medical_records (patient_id, date, wang, wen, wen2, qie, diagnosis, treatment)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, generate_records(rng, records, patients, start, days), "病历", records)
+        expected = records * prescriptions_per_visit
+        insert_batches(conn, """
+            INSERT INTO prescriptions (record_id, medicine, dosage, usage, dosage_qty, dosage_unit)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, generate_prescriptions(rng, records, prescriptions_per_visit, ranked, cumulative), "处方", f"~{expected}")
+
+        print("  建立拼音索引...")
+        with conn:
+            pinyin_index.sync_name_index(conn)
+        conn.execute("ANALYZE")
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ("patients", "medical_records", "prescriptions", "medicines")}
+    finally:
+        conn.close()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="生成模拟的诊所数据库")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="1k", help="病历数量级")
+    parser.add_argument("--records", type=int, help="病历数（覆盖 --scale）")
+    parser.add_argument("--visits-per-patient", type=float, default=5, help="每位患者的平均就诊次数")
+    parser.add_argument("--prescriptions-per-visit", type=int, default=6, help="每次就诊的平均处方药品数")
+    parser.add_argument("--medicines", type=int, default=150, help="药品目录的品种数")
+    parser.add_argument("--zipf", type=float, default=1.1, help="用药频率Zipf分布的指数，越大越集中")
+    parser.add_argument("--days", type=int, default=3 * 365, help="病历日期跨越的天数")
+    parser.add_argument("--end-date", default="2025-12-31", help="最后一天的日期（YYYY-MM-DD）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--output", help="输出的数据库文件（默认 benchmarks/data/clinic_<规模>.db）")
+    parser.add_argument("--force", action="store_true", help="覆盖已存在的文件")
+    args = parser.parse_args()
+
+    records = args.records if args.records is not None else SCALES[args.scale]
+    output = args.output or os.path.join(DATA_DIR, f"clinic_{args.scale if args.records is None else records}.db")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    if args.force:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(output + suffix):
+                os.remove(output + suffix)
+
+    started = time.perf_counter()
+    try:
+        counts = generate(
+            output, records, args.visits_per_patient, args.prescriptions_per_visit, args.medicines,
+            args.zipf, args.days, date.fromisoformat(args.end_date), args.seed,
+        )
+    except FileExistsError as e:
+        print(e)
+        return 1
+    for table, count in counts.items():
+        print(f"  {table}: {count} 行")
+    print(f"完成，用时 {time.perf_counter() - started:.1f} 秒，文件大小 {os.path.getsize(output) / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
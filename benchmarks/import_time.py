@@ -0,0 +1,101 @@
+# benchmarks/import_time.py
+# 导入耗时分析：用 python -X importtime 导入指定模块，汇总总耗时和最慢的模块，
+# 用于检查启动路径上是否又引入了耗时的依赖（matplotlib、reportlab、pypinyin等）
+#
+# 用法：
+#     python benchmarks/import_time.py                    分析启动时导入的 main
+#     python benchmarks/import_time.py patient data_visualization --top 15
+#     python benchmarks/import_time.py --repeat 5 --json import_time.json
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# 仓库根目录（被测模块所在目录）
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 默认分析的模块：启动时导入的 main
+DEFAULT_MODULES = ["main"]
+
+def run_importtime(module):
+    """在新进程中导入模块，返回 (是否成功, [(自身耗时us, 累计耗时us, 层级, 模块名)], 错误信息)"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    entries = []
+    errors = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # 标题行
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(parts[0]), int(parts[1]), depth, name.strip()))
+    return process.returncode == 0, entries, "\n".join(errors[-5:])
+
+def summarize(entries, top=10):
+    """汇总一次导入的结果"""
+    # 层级最浅的模块是直接导入的，累计耗时之和即为总耗时
+    min_depth = min((e[2] for e in entries), default=0)
+    total = sum(e[1] for e in entries if e[2] == min_depth)
+    by_cumulative = sorted(entries, key=lambda e: e[1], reverse=True)[:top]
+    by_self = sorted(entries, key=lambda e: e[0], reverse=True)[:top]
+    return {
+        "total_ms": total / 1000,
+        "modules": len(entries),
+        "top_cumulative": [{"module": e[3], "cumulative_ms": e[1] / 1000} for e in by_cumulative],
+        "top_self": [{"module": e[3], "self_ms": e[0] / 1000} for e in by_self],
+    }
+
+def profile(module, repeat=3, top=10):
+    """多次导入取总耗时最短的一次（排除磁盘缓存等干扰）"""
+    best = None
+    for _ in range(repeat):
+        ok, entries, error = run_importtime(module)
+        if not ok:
+            return {"module": module, "error": error}
+        summary = summarize(entries, top)
+        if best is None or summary["total_ms"] < best["total_ms"]:
+            best = summary
+    best["module"] = module
+    return best
+
+def print_report(report):
+    if "error" in report:
+        print(f"== {report['module']}: 导入失败")
+        print(report["error"])
+        print()
+        return
+    print(f"== {report['module']}: 总耗时 {report['total_ms']:.1f} ms，共导入 {report['modules']} 个模块")
+    print("  累计耗时最长:")
+    for item in report["top_cumulative"]:
+        print(f"    {item['cumulative_ms']:9.1f} ms  {item['module']}")
+    print("  自身耗时最长:")
+    for item in report["top_self"]:
+        print(f"    {item['self_ms']:9.1f} ms  {item['module']}")
+    print()
+
+def main():
+    parser = argparse.ArgumentParser(description="汇总 python -X importtime 的导入耗时")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="要分析的模块")
+    parser.add_argument("--repeat", type=int, default=3, help="每个模块导入的次数，取最快的一次")
+    parser.add_argument("--top", type=int, default=10, help="列出最慢的模块数量")
+    parser.add_argument("--json", help="把结果保存为JSON文件")
+    args = parser.parse_args()
+
+    reports = [profile(module, args.repeat, args.top) for module in args.modules]
+    for report in reports:
+        print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version, "reports": reports}, f, ensure_ascii=False, indent=2)
+    return 1 if any("error" in r for r in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+# benchmarks/run_benchmarks.py
+# 数据访问性能测试：不打开界面，直接调用各窗口使用的查询函数和导出流水线，
+# 在不同规模的数据库上统计耗时分位数和Python内存峰值，结果保存为JSON以便在不同提交之间比较。
+# 数据库由 generate_data.py 生成，指定的规模不存在时自动生成。
+#
+# 用法：
+#     python benchmarks/run_benchmarks.py                               在1k数据库上运行全部测试
+#     python benchmarks/run_benchmarks.py --scale 1k 100k --json bench.json
+#     python benchmarks/run_benchmarks.py --db /tmp/clinic_1m.db -k patients records --repeat 50
+#     python benchmarks/run_benchmarks.py --scale 100k --compare bench.json
+import argparse
+import json
+import math
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime
+
+# 仓库根目录（被测模块所在目录）
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+
+# 一项测试：名称、函数 func(conn, sample)、是否为读取全部数据的重负载测试
+Benchmark = namedtuple("Benchmark", "name func heavy")
+
+# 统计的分位数
+PERCENTILES = (50, 90, 99)
+
+# 比较结果时，p50 变化超过该比例才标记
+COMPARE_THRESHOLD = 0.10
+
+
+def collect_sample(conn):
+    """从数据库中选出测试用的查询条件（总是取同样的行，结果可重复）"""
+    patient = conn.execute("""
+        SELECT p.id, p.name, p.phone FROM patients p
+        WHERE EXISTS (SELECT 1 FROM medical_records mr WHERE mr.patient_id = p.id)
+        ORDER BY p.id LIMIT 1
+    """).fetchone() or (0, "", "")
+    record = conn.execute("SELECT id, date FROM medical_records ORDER BY id LIMIT 1 OFFSET ("
+                          "SELECT COUNT(*) / 2 FROM medical_records)").fetchone() or (0, "")
+    medicine = conn.execute("""
+        SELECT medicine FROM prescriptions GROUP BY medicine ORDER BY COUNT(*) DESC LIMIT 1
+    """).fetchone() or ("",)
+    folder = conn.execute("SELECT id FROM favorite_folders ORDER BY id LIMIT 1").fetchone() or (0,)
+    return {
+        "patient_id": patient[0],
+        "name": patient[1],
+        "surname": patient[1][:1],
+        "phone": patient[2],
+        "phone_suffix": patient[2][-4:],
+        "record_id": record[0],
+        "date": record[1],
+        "medicine": medicine[0],
+        "folder_id": folder[0],
+        "keyword": "感冒",
+        "pinyin": "zh",
+    }
+
+def patient_criteria(**values):
+    criteria = {"name": "", "phone": "", "age": "", "keyword": ""}
+    criteria.update(values)
+    return criteria
+
+def record_criteria(**values):
+    criteria = {"name": "", "phone": "", "date": "", "keyword": ""}
+    criteria.update(values)
+    return criteria
+
+def page_first(conn, sample):
+    """打开患者列表时读取第一页"""
+    import patient
+    pager = patient.create_patient_pager()
+    pager.store(pager.load(conn, [0]))
+    return pager.get_rows(0, patient.PATIENT_PAGE_SIZE)
+
+def page_deep(conn, sample):
+    """跳到患者列表中间位置读取一页（拖动滚动条）"""
+    import patient
+    pager = patient.create_patient_pager()
+    pager.store(pager.load(conn, []))
+    middle = pager.total // 2
+    pager.store(pager.load(conn, pager.missing_pages(middle, patient.PATIENT_PAGE_SIZE)))
+    return pager.get_rows(middle, patient.PATIENT_PAGE_SIZE)
+
+def export_to_temp(fmt):
+    """导出全部患者到临时文件，返回文件大小"""
+    def run(conn, sample):
+        import export_data
+        fd, path = tempfile.mkstemp(suffix="." + fmt)
+        os.close(fd)
+        try:
+            export_data.export_to_file(path, fmt)
+            return os.path.getsize(path)
+        finally:
+            os.remove(path)
+    return run
+
+def build_benchmarks():
+    """全部测试项，按窗口分组命名"""
+    import patient
+    import medical_record
+    import prescription
+    import medicine
+    import favorite
+    import rollups
+    from repositories import RecordRepository
+
+    return [
+        Benchmark("patients.first_page", page_first, False),
+        Benchmark("patients.deep_page", page_deep, False),
+        Benchmark("patients.filter_name", lambda conn, s: patient.live_search_patients(
+            conn, patient_criteria(name=s["surname"]))[0], False),
+        Benchmark("patients.filter_pinyin", lambda conn, s: patient.live_search_patients(
+            conn, patient_criteria(name=s["pinyin"]))[0], False),
+        Benchmark("patients.filter_phone", lambda conn, s: patient.live_search_patients(
+            conn, patient_criteria(phone=s["phone_suffix"]))[0], False),
+        Benchmark("patients.keyword", lambda conn, s: patient.live_search_patients(
+            conn, patient_criteria(keyword="高血压"))[0], False),
+        Benchmark("patients.history", lambda conn, s: patient.find_patient_history(conn, s["name"], s["phone"]), False),
+        Benchmark("records.all", lambda conn, s: medical_record.query_records(conn), True),
+        Benchmark("records.first_page", lambda conn, s: RecordRepository(conn).page(), False),
+        Benchmark("records.patient", lambda conn, s: medical_record.query_records(conn, s["patient_id"]), False),
+        Benchmark("records.filter_name", lambda conn, s: medical_record.live_search_records(
+            conn, record_criteria(name=s["name"]))[0], False),
+        Benchmark("records.filter_date", lambda conn, s: medical_record.live_search_records(
+            conn, record_criteria(date=s["date"]))[0], False),
+        Benchmark("records.keyword", lambda conn, s: medical_record.live_search_records(
+            conn, record_criteria(keyword=s["keyword"]))[0], False),
+        Benchmark("prescriptions.all", lambda conn, s: prescription.query_prescriptions(conn), True),
+        Benchmark("prescriptions.record", lambda conn, s: prescription.query_prescriptions(conn, s["record_id"]), False),
+        Benchmark("prescriptions.filter_name", lambda conn, s: prescription.find_prescriptions(
+            conn, patient_name=s["name"]), False),
+        Benchmark("prescriptions.filter_date", lambda conn, s: prescription.find_prescriptions(
+            conn, date=s["date"]), False),
+        Benchmark("medicines.all", lambda conn, s: medicine.query_medicines(conn), False),
+        Benchmark("medicines.filter_name", lambda conn, s: medicine.find_medicines(conn, name=s["medicine"]), False),
+        Benchmark("medicines.filter_pinyin", lambda conn, s: medicine.find_medicines(conn, name=s["pinyin"]), False),
+        Benchmark("favorites.folders", lambda conn, s: favorite.query_folders(conn), False),
+        Benchmark("favorites.all", lambda conn, s: favorite.query_favorites(conn), False),
+        Benchmark("favorites.folder", lambda conn, s: favorite.query_favorites_by_folder(conn, s["folder_id"]), False),
+        Benchmark("charts.daily", lambda conn, s: rollups.daily_visits(30), False),
+        Benchmark("charts.monthly", lambda conn, s: rollups.monthly_visits(12), False),
+        Benchmark("charts.yearly", lambda conn, s: rollups.yearly_visits(), False),
+        Benchmark("export.csv", export_to_temp("csv"), True),
+        Benchmark("export.jsonl", export_to_temp("jsonl"), True),
+        Benchmark("export.json", export_to_temp("json"), True),
+        Benchmark("export.txt", export_to_temp("txt"), True),
+    ]
+
+def select_benchmarks(benchmarks, keywords):
+    """按名称中包含的关键词筛选（类似 pytest -k）"""
+    if not keywords:
+        return benchmarks
+    return [b for b in benchmarks if any(k in b.name for k in keywords)]
+
+def percentile(sorted_values, p):
+    """最近秩法计算分位数"""
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+def result_size(result):
+    """结果的大小：查询为行数，导出为文件字节数"""
+    try:
+        return len(result)
+    except TypeError:
+        return result if isinstance(result, int) else None
+
+def measure(benchmark, conn, sample, repeat, warmup=1):
+    """运行一项测试：先预热，再计时 repeat 次，最后在 tracemalloc 下运行一次统计内存峰值
+
+    tracemalloc 只统计Python对象的内存，SQLite自身的页缓存不在其中；
+    它会明显拖慢运行，所以不和计时放在同一次运行中。
+    """
+    for _ in range(warmup):
+        result = benchmark.func(conn, sample)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = benchmark.func(conn, sample)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    try:
+        benchmark.func(conn, sample)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    stats = {
+        "runs": repeat,
+        "size": result_size(result),
+        "min_ms": timings[0],
+        "mean_ms": sum(timings) / len(timings),
+        "max_ms": timings[-1],
+        "peak_kb": peak / 1024,
+    }
+    for p in PERCENTILES:
+        stats[f"p{p}_ms"] = percentile(timings, p)
+    return stats
+
+def table_counts(conn):
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("patients", "medical_records", "prescriptions", "medicines", "favorite_prescriptions")}
+
+def run_database(path, benchmarks, repeat, heavy_repeat):
+    """在一个数据库上运行测试，返回该数据库的报告"""
+    from database import init_db, get_connection, get_pool
+    config.DB_FILE = path
+    init_db()
+    conn = get_connection()
+    try:
+        counts = table_counts(conn)
+        sample = collect_sample(conn)
+        print(f"== {path}: " + "，".join(f"{table} {count}" for table, count in counts.items()))
+        results = {}
+        for benchmark in benchmarks:
+            runs = min(repeat, heavy_repeat) if benchmark.heavy else repeat
+            try:
+                stats = measure(benchmark, conn, sample, runs)
+            except Exception as e:
+                results[benchmark.name] = {"error": f"{type(e).__name__}: {e}"}
+                print(f"  {benchmark.name:28} 失败: {e}")
+                continue
+            results[benchmark.name] = stats
+            print_result(benchmark.name, stats)
+    finally:
+        conn.close()
+        get_pool(path).close_idle()
+    print()
+    return {"path": path, "counts": counts, "sample": sample, "results": results}
+
+def print_result(name, stats, baseline=None):
+    line = (f"  {name:28} p50 {stats['p50_ms']:9.2f}  p90 {stats['p90_ms']:9.2f}  p99 {stats['p99_ms']:9.2f} ms"
+            f"  峰值 {stats['peak_kb']:9.1f} KB  结果 {stats['size']}")
+    if baseline and "p50_ms" in baseline and baseline["p50_ms"] > 0:
+        change = stats["p50_ms"] / baseline["p50_ms"] - 1
+        mark = "" if abs(change) < COMPARE_THRESHOLD else (" 变慢" if change > 0 else " 变快")
+        line += f"  ({change:+.0%}{mark})"
+    print(line)
+
+def print_comparison(report, baseline):
+    """与之前保存的结果比较 p50（按数据库文件名对应）"""
+    previous = {os.path.basename(db["path"]): db["results"] for db in baseline.get("databases", [])}
+    print(f"与 {baseline.get('commit') or '基准'} 比较:")
+    for db in report["databases"]:
+        old_results = previous.get(os.path.basename(db["path"]))
+        if old_results is None:
+            print(f"== {db['path']}: 基准中没有该数据库")
+            continue
+        print(f"== {db['path']}")
+        for name, stats in db["results"].items():
+            if "error" not in stats:
+                print_result(name, stats, old_results.get(name))
+        print()
+
+def git_commit():
+    try:
+        process = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return process.stdout.strip() or None
+
+def resolve_databases(args):
+    """--db 指定的文件，以及 --scale 对应的生成数据（不存在时生成）"""
+    import generate_data
+    paths = list(args.db)
+    for scale in args.scale or ([] if args.db else ["1k"]):
+        path = os.path.join(generate_data.DATA_DIR, f"clinic_{scale}.db")
+        if not os.path.exists(path):
+            os.makedirs(generate_data.DATA_DIR, exist_ok=True)
+            generate_data.generate(path, generate_data.SCALES[scale])
+        paths.append(path)
+    return paths
+
+def main():
+    import generate_data
+    parser = argparse.ArgumentParser(description="不打开界面测试数据访问的性能")
+    parser.add_argument("--db", nargs="*", default=[], help="要测试的数据库文件")
+    parser.add_argument("--scale", nargs="*", choices=sorted(generate_data.SCALES), help="测试生成的数据库（默认1k）")
+    parser.add_argument("-k", dest="keywords", nargs="*", default=[], help="只运行名称中包含这些关键词的测试")
+    parser.add_argument("--repeat", type=int, default=20, help="每项测试计时的次数")
+    parser.add_argument("--heavy-repeat", type=int, default=3, help="读取全部数据的测试（全表查询、导出）的计时次数")
+    parser.add_argument("--json", help="把结果保存为JSON文件")
+    parser.add_argument("--compare", help="与之前保存的JSON结果比较")
+    parser.add_argument("--list", action="store_true", help="只列出测试项")
+    args = parser.parse_args()
+
+    benchmarks = select_benchmarks(build_benchmarks(), args.keywords)
+    if args.list:
+        for benchmark in benchmarks:
+            print(benchmark.name + (" (重负载)" if benchmark.heavy else ""))
+        return 0
+    if not benchmarks:
+        print("没有匹配的测试")
+        return 1
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": sys.version,
+        "sqlite": sqlite3.sqlite_version,
+        "repeat": args.repeat,
+        "heavy_repeat": args.heavy_repeat,
+        "databases": [run_database(path, benchmarks, args.repeat, args.heavy_repeat)
+                      for path in resolve_databases(args)],
+    }
+    if baseline is not None:
+        print_comparison(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    failed = any("error" in stats for db in report["databases"] for stats in db["results"].values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
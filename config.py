@@ -6,4 +6,93 @@ USERNAME = "doctor"
 PASSWORD = "123456"
 
 # 数据库文件路径
-DB_FILE = "clinic.db"
\ No newline at end of file
+DB_FILE = "clinic.db"
+
+# 数据库连接池配置
+# 每个线程最多保留的空闲连接数
+DB_POOL_MAX_IDLE = 4
+# 空闲连接超过该秒数后，再次取出时先做健康检查
+DB_POOL_HEALTH_CHECK_INTERVAL = 30
+# 额外的PRAGMA，会覆盖存储配置档中的同名项
+DB_PRAGMAS = {}
+
+# 存储配置档：journal_mode 在初始化时设置一次（保存在数据库文件中），
+# 其余PRAGMA在每个新连接建立时执行
+DB_PROFILE = "desktop"
+DB_PROFILES = {
+    # 本地磁盘：WAL模式，读写互不阻塞
+    "desktop": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -16000,      # 约16MB页缓存
+        "mmap_size": 134217728,    # 128MB内存映射
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 1000,
+    },
+    # 老旧机器：减少内存占用
+    "low_memory": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "FILE",
+        "wal_autocheckpoint": 1000,
+    },
+    # 网络共享盘：WAL依赖共享内存，不能用于网络文件系统
+    "network_share": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 10000,
+        "cache_size": -8000,
+        "mmap_size": 0,
+        "temp_store": "MEMORY",
+    },
+}
+
+# 遇到 SQLITE_BUSY 时的重试次数和初始退避时间（秒，每次翻倍）
+DB_BUSY_RETRIES = 5
+DB_BUSY_BACKOFF = 0.05
+
+# 后台执行界面查询的线程数
+DB_WORKERS = 2
+
+# WAL检查点间隔（秒），0表示不启动后台检查点
+DB_CHECKPOINT_INTERVAL = 300
+
+# 写队列（见 write_queue.py）一次组提交最多合并的写操作数
+DB_WRITE_BATCH_MAX = 64
+
+# SQL执行统计（见 query_stats.py，诊断窗口中查看），关闭后连接池使用不带统计的连接
+DB_QUERY_STATS = True
+# 单次执行（含读取结果）超过该毫秒数的语句写入慢查询日志，并附上执行计划
+DB_SLOW_QUERY_MS = 200
+DB_SLOW_QUERY_LOG = "slow_queries.log"
+DB_SLOW_QUERY_LOG_BYTES = 1024 * 1024
+DB_SLOW_QUERY_LOG_BACKUPS = 3
+DB_SLOW_QUERY_EXPLAIN = True
+# 慢查询日志是否记录参数（参数中可能有患者姓名、电话等信息，默认不记录）
+DB_SLOW_QUERY_PARAMS = False
+
+# 多台电脑共用一个数据库时，由一台电脑运行 api_server.py 独占数据库，
+# 其他电脑把 API_URL 设为该服务器地址（如 "http://192.168.1.10:8765"）。
+# 为None时为单机模式，直接读写本机的 DB_FILE。
+# 服务器不可用时不会自动改用本机数据库，以免两边数据不一致。
+API_URL = None
+# 服务器监听的地址和端口；默认只允许本机访问，局域网共用时改为 "0.0.0.0" 并设置 API_TOKEN
+API_HOST = "127.0.0.1"
+API_PORT = 8765
+# 访问令牌：设置后客户端必须携带相同的令牌（服务器和客户端配置相同的值）。
+# 未设置令牌时服务器拒绝监听本机以外的地址
+API_TOKEN = None
+# 请求体的最大字节数，超过时返回413
+API_MAX_BODY = 1024 * 1024
+# 请求超时（秒）
+API_TIMEOUT = 30
+# 列表接口默认每页条数和允许的最大条数
+API_PAGE_SIZE = 500
+API_MAX_PAGE_SIZE = 5000
+# 客户端保留的空闲长连接数，空闲超过该秒数的连接不再复用（服务器会先关闭它）
+API_POOL_MAX_IDLE = 4
+API_KEEPALIVE = 30
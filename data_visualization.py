@@ -1,15 +1,75 @@
 # data_visualization.py
 import tkinter as tk
 from tkinter import ttk
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from datetime import datetime, timedelta
-from database import get_connection
-from collections import defaultdict
-import matplotlib
-matplotlib.use('TkAgg')  # 使用Tkinter后端
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']  # 设置中文字体
-plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+from datetime import datetime, timedelta, timezone
+import threading
+import rollups
+import db_executor
+from collections import defaultdict, OrderedDict
+
+# matplotlib导入很慢，第一次打开数据可视化窗口时才导入（见 load_matplotlib）
+plt = None
+FigureCanvasTkAgg = None
+
+def load_matplotlib():
+    """导入matplotlib并设置Tkinter后端和中文字体"""
+    global plt, FigureCanvasTkAgg
+    if plt is None:
+        import matplotlib
+        matplotlib.use('TkAgg')  # 使用Tkinter后端
+        import matplotlib.pyplot as pyplot
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg as canvas_class
+        pyplot.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']  # 设置中文字体
+        pyplot.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+        plt, FigureCanvasTkAgg = pyplot, canvas_class
+    return plt
+
+# 图表类型 -> (读取数据的函数, 参数)，参数即统计范围
+CHART_SERIES = {
+    "每日患者数量": (rollups.daily_visits, (30,)),
+    "每月患者数量": (rollups.monthly_visits, (12,)),
+    "每年患者数量": (rollups.yearly_visits, ()),
+    "月度趋势图": (rollups.monthly_visits, (12,)),
+    "年度趋势图": (rollups.yearly_visits, ()),
+}
+
+# 缓存的统计结果数量
+SERIES_CACHE_SIZE = 32
+
+_series_cache = OrderedDict()
+_series_lock = threading.Lock()
+
+def load_chart_series(chart_type):
+    """读取图表数据，结果按 (图表类型, 统计范围, 日期, 数据版本) 缓存
+
+    病历有任何修改时数据版本号都会变化，旧的缓存自然失效；
+    统计范围相对于今天计算，所以日期也是缓存键的一部分。
+    """
+    fetch, args = CHART_SERIES[chart_type]
+    # SQLite的 date('now') 使用UTC日期
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    key = (fetch.__name__, args, today, rollups.data_version())
+    with _series_lock:
+        if key in _series_cache:
+            _series_cache.move_to_end(key)
+            return _series_cache[key]
+    results = fetch(*args)
+    with _series_lock:
+        _series_cache[key] = results
+        while len(_series_cache) > SERIES_CACHE_SIZE:
+            _series_cache.popitem(last=False)
+    return results
+
+def fetch_chart_series(conn, chart_type):
+    """供后台执行器调用的 load_chart_series（汇总数据由 rollups 自行读取）
+
+    服务器模式下 conn 为 api_client.RemoteSession，由服务器读取汇总数据，是否变化由ETag判断。
+    """
+    visits = getattr(conn, "visits", None)
+    if visits is not None:
+        fetch, args = CHART_SERIES[chart_type]
+        return visits(fetch.__name__, *args)
+    return load_chart_series(chart_type)
 
 class DataVisualizationWindow:
     def __init__(self, master):
@@ -44,12 +104,19 @@ class DataVisualizationWindow:
         
         # 更新按钮
         ttk.Button(control_frame, text="更新图表", command=self.update_chart).pack(side="left", padx=5)
+        # 切换图表类型时直接更新（有缓存时不需要查询数据库）
+        self.chart_type.bind("<<ComboboxSelected>>", lambda e: self.update_chart())
+        
+        # 加载状态
+        self.status_label = ttk.Label(control_frame, text="")
+        self.status_label.pack(side="left", padx=10)
         
         # 图表显示区域
         chart_frame = ttk.Frame(main_frame)
         chart_frame.pack(fill="both", expand=True, padx=5, pady=5)
         
         # 创建matplotlib图形
+        load_matplotlib()
         self.fig, self.ax = plt.subplots(figsize=(10, 6))
         self.canvas = FigureCanvasTkAgg(self.fig, master=chart_frame)
         self.canvas.get_tk_widget().pack(fill="both", expand=True)
@@ -74,42 +141,41 @@ class DataVisualizationWindow:
         gc.collect()
     
     def update_chart(self):
-        """更新图表"""
+        """更新图表：在后台线程读取数据，读取完成后在界面线程中绘制"""
         chart_type = self.chart_type.get()
+        self.status_label.config(text="正在加载...")
+        
+        def on_done(results):
+            self.status_label.config(text="")
+            self.draw_chart(chart_type, results)
+        
+        def on_error(error):
+            self.status_label.config(text=f"加载失败: {error}")
         
+        # 只有最新一次请求的结果会被绘制
+        db_executor.submit(self.status_label, fetch_chart_series, chart_type,
+                           key=(self, "chart"), on_done=on_done, on_error=on_error)
+    
+    def draw_chart(self, chart_type, results):
+        """绘制图表（必须在界面线程中调用）"""
         # 清除当前图形
         self.ax.clear()
         
         if chart_type == "每日患者数量":
-            self.plot_daily_patients()
+            self.plot_daily_patients(results)
         elif chart_type == "每月患者数量":
-            self.plot_monthly_patients()
+            self.plot_monthly_patients(results)
         elif chart_type == "每年患者数量":
-            self.plot_yearly_patients()
+            self.plot_yearly_patients(results)
         elif chart_type == "月度趋势图":
-            self.plot_monthly_trend()
+            self.plot_monthly_trend(results)
         elif chart_type == "年度趋势图":
-            self.plot_yearly_trend()
+            self.plot_yearly_trend(results)
         
         self.canvas.draw()
     
-    def plot_daily_patients(self):
+    def plot_daily_patients(self, results):
         """绘制每日患者数量图"""
-        # 获取最近30天的数据
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # 获取最近30天的患者访问数据
-        cursor.execute("""
-            SELECT date, COUNT(*) as patient_count
-            FROM medical_records
-            WHERE date >= date('now', '-30 days')
-            GROUP BY date
-            ORDER BY date
-        """)
-        results = cursor.fetchall()
-        conn.close()
-        
         if results:
             dates = [item[0] for item in results]
             counts = [item[1] for item in results]
@@ -127,22 +193,8 @@ class DataVisualizationWindow:
         
         self.fig.tight_layout()
     
-    def plot_monthly_patients(self):
+    def plot_monthly_patients(self, results):
         """绘制每月患者数量图"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # 获取最近12个月的数据
-        cursor.execute("""
-            SELECT strftime('%Y-%m', date) as month, COUNT(*) as patient_count
-            FROM medical_records
-            WHERE date >= date('now', '-12 months')
-            GROUP BY strftime('%Y-%m', date)
-            ORDER BY month
-        """)
-        results = cursor.fetchall()
-        conn.close()
-        
         if results:
             months = [item[0] for item in results]
             counts = [item[1] for item in results]
@@ -159,21 +211,8 @@ class DataVisualizationWindow:
         
         self.fig.tight_layout()
     
-    def plot_yearly_patients(self):
+    def plot_yearly_patients(self, results):
         """绘制每年患者数量图"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # 获取所有年份的数据
-        cursor.execute("""
-            SELECT strftime('%Y', date) as year, COUNT(*) as patient_count
-            FROM medical_records
-            GROUP BY strftime('%Y', date)
-            ORDER BY year
-        """)
-        results = cursor.fetchall()
-        conn.close()
-        
         if results:
             years = [item[0] for item in results]
             counts = [item[1] for item in results]
@@ -187,22 +226,8 @@ class DataVisualizationWindow:
                         transform=self.ax.transAxes, fontsize=14)
             self.ax.set_title("年度患者数量")
     
-    def plot_monthly_trend(self):
+    def plot_monthly_trend(self, results):
         """绘制月度趋势图"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # 获取最近12个月的数据
-        cursor.execute("""
-            SELECT strftime('%Y-%m', date) as month, COUNT(*) as patient_count
-            FROM medical_records
-            WHERE date >= date('now', '-12 months')
-            GROUP BY strftime('%Y-%m', date)
-            ORDER BY month
-        """)
-        results = cursor.fetchall()
-        conn.close()
-        
         if results:
             months = [item[0] for item in results]
             counts = [item[1] for item in results]
@@ -220,21 +245,8 @@ class DataVisualizationWindow:
         
         self.fig.tight_layout()
     
-    def plot_yearly_trend(self):
+    def plot_yearly_trend(self, results):
         """绘制年度趋势图"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # 获取所有年份的数据
-        cursor.execute("""
-            SELECT strftime('%Y', date) as year, COUNT(*) as patient_count
-            FROM medical_records
-            GROUP BY strftime('%Y', date)
-            ORDER BY year
-        """)
-        results = cursor.fetchall()
-        conn.close()
-        
         if results:
             years = [item[0] for item in results]
             counts = [item[1] for item in results]
@@ -1,82 +1,365 @@
 # database.py
 import sqlite3
 import os
-from config import DB_FILE
+import threading
+import time
+import functools
+import random
+import logging
+from contextlib import contextmanager
+import config
+import query_stats
+from migrations import migrate, is_up_to_date
+
+logger = logging.getLogger(__name__)
+
+# 只能在数据库级别设置一次的PRAGMA，不在每个连接上执行
+DATABASE_PRAGMAS = ("journal_mode",)
+
+def get_storage_profile(name=None):
+    """返回存储配置档（合并 config.DB_PRAGMAS 覆盖项）"""
+    profile = dict(config.DB_PROFILES[name or config.DB_PROFILE])
+    profile.update(config.DB_PRAGMAS)
+    return profile
+
+def get_connection_pragmas(profile=None):
+    """返回每个连接需要执行的PRAGMA，busy_timeout排在最前"""
+    profile = get_storage_profile() if profile is None else profile
+    pragmas = {k: v for k, v in profile.items() if k not in DATABASE_PRAGMAS}
+    if "busy_timeout" in pragmas:
+        pragmas = {"busy_timeout": pragmas.pop("busy_timeout"), **pragmas}
+    return pragmas
+
+def is_busy_error(error):
+    """判断异常是否为 SQLITE_BUSY / SQLITE_LOCKED"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    name = getattr(error, "sqlite_errorname", "")
+    if name:
+        return name.startswith("SQLITE_BUSY") or name.startswith("SQLITE_LOCKED")
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+def retry_on_busy(func=None, retries=None, backoff=None):
+    """装饰器：遇到数据库忙时按指数退避重试"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            max_retries = config.DB_BUSY_RETRIES if retries is None else retries
+            delay = config.DB_BUSY_BACKOFF if backoff is None else backoff
+            attempt = 0
+            while True:
+                try:
+                    return fn(*args, **kwargs)
+                except sqlite3.OperationalError as e:
+                    if not is_busy_error(e) or attempt >= max_retries:
+                        raise
+                    attempt += 1
+                    # 加入随机抖动，避免多个终端同时重试
+                    time.sleep(delay * (2 ** (attempt - 1)) * (1 + random.random()))
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+def tune_storage(conn, profile=None):
+    """设置数据库级别的存储参数（WAL等），返回实际的journal_mode"""
+    profile = get_storage_profile() if profile is None else profile
+    if "busy_timeout" in profile:
+        conn.execute(f"PRAGMA busy_timeout = {profile['busy_timeout']}")
+    journal_mode = profile.get("journal_mode")
+    current = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if journal_mode and current.lower() != journal_mode.lower():
+        current = retry_on_busy(lambda: conn.execute(f"PRAGMA journal_mode = {journal_mode}").fetchone()[0])()
+    return current
 
 def init_db():
-    """初始化数据库，创建必要表"""
+    """初始化数据库，执行未应用的结构迁移，返回本次应用的版本号列表"""
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # 创建患者表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS patients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            gender TEXT,
-            age INTEGER,
-            phone TEXT,
-            history TEXT
-        )
-        ''')
-        
-        # 创建病历表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS medical_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER NOT NULL,
-            date TEXT NOT NULL,
-            wang TEXT,        -- 望诊
-            wen TEXT,         -- 闻诊
-            wen2 TEXT,        -- 问诊
-            qie TEXT,         -- 切诊
-            diagnosis TEXT,
-            treatment TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients(id)
-        )
-        ''')
-        
-        # 创建处方表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS prescriptions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            record_id INTEGER NOT NULL,
-            medicine TEXT NOT NULL,
-            dosage TEXT,
-            usage TEXT,
-            FOREIGN KEY (record_id) REFERENCES medical_records(id)
-        )
-        ''')
-        
-        # 创建药品表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS medicines (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            stock INTEGER DEFAULT 0,
-            unit TEXT DEFAULT '包',
-            usage TEXT DEFAULT ''
-        )
-        ''')
-        
-        # 检查是否已有usage列，如果没有则添加
+        conn = sqlite3.connect(config.DB_FILE)
         try:
-            cursor.execute("PRAGMA table_info(medicines)")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'usage' not in columns:
-                cursor.execute("ALTER TABLE medicines ADD COLUMN usage TEXT DEFAULT ''")
-                print("已为medicines表添加usage列")
-        except Exception as e:
-            print(f"检查或添加usage列时出错: {e}")
-        
-        conn.commit()
-        conn.close()
-        print("数据库初始化成功")
+            # 启用WAL等存储参数，读写不再互相阻塞
+            tune_storage(conn)
+            applied = []
+            # 结构指纹一致时不执行任何DDL，也不获取写锁，多个终端同时启动不会互相等待
+            if is_up_to_date(conn):
+                logger.debug("数据库结构已是最新")
+            else:
+                # 建表、补充列和索引都由迁移完成，只有确实需要迁移时才获取写锁
+                applied = retry_on_busy(migrate)(conn)
+                logger.info("数据库初始化成功")
+            # 安装pypinyin之前生成的拼音索引没有全拼，在这里重新生成（没有pypinyin时不访问数据库）
+            from pinyin_index import refresh_stale_index
+            retry_on_busy(refresh_stale_index)(conn)
+        finally:
+            conn.close()
+        return applied
     except Exception as e:
-        print(f"数据库初始化失败: {e}")
+        logger.error("数据库初始化失败: %s", e)
         raise
 
+
+class PooledConnection(sqlite3.Connection):
+    """连接池中的连接，close()时归还连接池而不是真正关闭"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def dispose(self):
+        """真正关闭底层连接"""
+        self.pool = None
+        super().close()
+
+
+class InstrumentedConnection(PooledConnection):
+    """记录每条语句耗时、行数和调用位置的连接（见 query_stats.py），config.DB_QUERY_STATS 为 True 时使用"""
+
+    def cursor(self, factory=query_stats.InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ConnectionPool:
+    """按线程缓存的SQLite连接池
+
+    每个线程保存自己的空闲连接列表（sqlite3连接不能跨线程使用），
+    get_connection() 优先复用空闲连接，用完 close() 后归还。
+    """
+
+    def __init__(self, db_file, max_idle=None, pragmas=None, health_check_interval=None):
+        self.db_file = db_file
+        self.max_idle = config.DB_POOL_MAX_IDLE if max_idle is None else max_idle
+        self.pragmas = dict(get_connection_pragmas() if pragmas is None else pragmas)
+        if health_check_interval is None:
+            health_check_interval = config.DB_POOL_HEALTH_CHECK_INTERVAL
+        self.health_check_interval = health_check_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,            # 复用空闲连接
+            "misses": 0,          # 新建连接
+            "releases": 0,        # 归还连接
+            "discards": 0,        # 超出空闲上限被关闭
+            "health_failures": 0, # 健康检查失败被丢弃
+            "in_use": 0,
+        }
+
+    def _idle(self):
+        idle = getattr(self._local, "idle", None)
+        if idle is None:
+            idle = self._local.idle = []
+        return idle
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self._stats[key] += delta
+
+    @retry_on_busy
+    def _create(self):
+        factory = InstrumentedConnection if config.DB_QUERY_STATS else PooledConnection
+        conn = sqlite3.connect(self.db_file, factory=factory)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        conn.pool = self
+        return conn
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """从连接池取出一个连接"""
+        idle = self._idle()
+        while idle:
+            conn = idle.pop()
+            if time.monotonic() - conn.last_used > self.health_check_interval and not self._is_healthy(conn):
+                self._count("health_failures")
+                conn.dispose()
+                continue
+            self._count("hits")
+            self._count("in_use")
+            return conn
+        self._count("misses")
+        conn = self._create()
+        self._count("in_use")
+        return conn
+
+    def release(self, conn):
+        """归还连接，未提交的事务会被回滚"""
+        self._count("in_use", -1)
+        self._count("releases")
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._count("health_failures")
+            conn.dispose()
+            return
+        idle = self._idle()
+        if len(idle) >= self.max_idle:
+            self._count("discards")
+            conn.dispose()
+            return
+        conn.last_used = time.monotonic()
+        idle.append(conn)
+
+    def health_check(self):
+        """检查当前线程的空闲连接，丢弃失效连接，返回检查结果"""
+        idle = self._idle()
+        healthy = []
+        failed = 0
+        for conn in idle:
+            if self._is_healthy(conn):
+                healthy.append(conn)
+            else:
+                failed += 1
+                conn.dispose()
+        idle[:] = healthy
+        if failed:
+            self._count("health_failures", failed)
+        return {"db_file": self.db_file, "idle": len(healthy), "failed": failed}
+
+    def close_idle(self):
+        """关闭当前线程的所有空闲连接"""
+        idle = self._idle()
+        while idle:
+            idle.pop().dispose()
+
+    def get_stats(self):
+        """返回连接池统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_file=None):
+    """获取指定数据库文件的连接池（默认使用 config.DB_FILE）"""
+    db_file = os.path.abspath(db_file or config.DB_FILE)
+    with _pools_lock:
+        pool = _pools.get(db_file)
+        if pool is None:
+            pool = _pools[db_file] = ConnectionPool(db_file)
+        return pool
+
 def get_connection():
-    """获取数据库连接"""
-    return sqlite3.connect(DB_FILE)
\ No newline at end of file
+    """获取数据库连接（来自连接池，close()即归还）"""
+    return get_pool().acquire()
+
+def connect():
+    """打开数据源：单机模式为连接池中的连接，服务器模式（config.API_URL）为到服务器的会话
+
+    两者都用 close() 归还，界面通过 repositories.open_repository() 取得对应的仓库。
+    """
+    if config.API_URL:
+        from api_client import open_session
+        return open_session()
+    return get_connection()
+
+@contextmanager
+def connection():
+    """以上下文管理器方式使用连接，退出时自动归还"""
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+@contextmanager
+def transaction():
+    """在一个事务中执行，正常退出提交，异常时回滚"""
+    conn = get_connection()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def get_pool_stats():
+    """返回当前数据库连接池的统计信息"""
+    return get_pool().get_stats()
+
+def run_in_transaction(func, *args, **kwargs):
+    """在一个事务中执行 func(conn, ...)，遇到数据库忙时整体重试"""
+    @retry_on_busy
+    def attempt():
+        with transaction() as conn:
+            return func(conn, *args, **kwargs)
+    return attempt()
+
+def checkpoint(mode="PASSIVE"):
+    """执行一次WAL检查点，返回 (busy, log页数, 已检查点页数)"""
+    with connection() as conn:
+        return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+
+
+class WalCheckpointer:
+    """后台定期执行WAL检查点，防止WAL文件无限增长拖慢读取"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="wal-checkpoint", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                checkpoint("PASSIVE")
+            except sqlite3.Error as e:
+                logger.warning("WAL检查点失败: %s", e)
+        get_pool().close_idle()
+
+    def stop(self):
+        """停止后台线程，并尝试截断WAL文件"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        try:
+            checkpoint("TRUNCATE")
+        except sqlite3.Error as e:
+            logger.warning("WAL检查点失败: %s", e)
+
+
+_checkpointer = None
+
+def start_checkpointer(interval=None):
+    """启动后台WAL检查点线程"""
+    global _checkpointer
+    if _checkpointer is None:
+        _checkpointer = WalCheckpointer(config.DB_CHECKPOINT_INTERVAL if interval is None else interval)
+        _checkpointer.start()
+    return _checkpointer
+
+def stop_checkpointer():
+    """停止后台WAL检查点线程"""
+    global _checkpointer
+    if _checkpointer is not None:
+        _checkpointer.stop()
+        _checkpointer = None
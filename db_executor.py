@@ -0,0 +1,185 @@
+# db_executor.py
+# 后台数据库执行器：窗口中的查询提交到线程池执行，不再阻塞界面线程。
+# 查询函数形如 func(conn, *args)，conn 是工作线程从连接池取出的自己的连接
+# （服务器模式下为到服务器的会话，见 database.connect）；
+# 结果放入队列，由界面线程用 after() 轮询取回后调用回调（回调中可以直接操作控件）。
+# 带 key 提交的请求会取消同一 key 尚未完成的旧请求（例如输入了新的查询条件），
+# 正在执行的旧查询用 interrupt() 中断，旧结果不会再交给回调。
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import tkinter as tk
+import config
+import query_stats
+from database import connect
+
+logger = logging.getLogger(__name__)
+
+# 界面线程检查查询结果的间隔（毫秒）
+POLL_INTERVAL = 30
+
+
+class DbRequest:
+    """一次提交的查询，回调只会在界面线程中调用"""
+
+    def __init__(self, func, args, key, widget, on_done, on_error):
+        self.func = func
+        self.args = args
+        self.key = key
+        self.widget = widget
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+        self.finished = False
+        self.site = query_stats.call_site()     # 语句统计中记为提交查询的位置
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """取消请求：尚未开始的不再执行，正在执行的查询被中断，结果都不会交给回调"""
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    def run(self):
+        """在工作线程中执行查询"""
+        with self._lock:
+            if self.cancelled:
+                return None
+            conn = self._conn = connect()
+        try:
+            with query_stats.call_context(self.site):
+                return self.func(conn, *self.args)
+        finally:
+            with self._lock:
+                self._conn = None
+            conn.close()
+
+
+class DbExecutor:
+    """数据库查询线程池
+
+    submit/cancel 只能在界面线程中调用。
+    """
+
+    def __init__(self, max_workers=None, poll_interval=POLL_INTERVAL):
+        max_workers = config.DB_WORKERS if max_workers is None else max_workers
+        self.poll_interval = poll_interval
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-worker")
+        self._results = queue.Queue()
+        self._pending = {}       # key -> 最新的请求
+        self._outstanding = 0    # 已提交、结果尚未取回的请求数
+        self._root = None
+        self._polling = False
+
+    def submit(self, widget, func, *args, key=None, on_done=None, on_error=None):
+        """提交查询 func(conn, *args)，完成后在界面线程中调用 on_done(结果) 或 on_error(异常)
+
+        widget 被销毁后回调不会再被调用；同一 key 再次提交相同的查询时复用尚未完成的请求。
+        """
+        if key is not None:
+            previous = self._pending.get(key)
+            if previous is not None and not previous.cancelled:
+                if previous.func is func and previous.args == args:
+                    # 合并重复的请求，只更新回调
+                    previous.widget, previous.on_done, previous.on_error = widget, on_done, on_error
+                    return previous
+                previous.cancel()
+        request = DbRequest(func, args, key, widget, on_done, on_error)
+        if key is not None:
+            self._pending[key] = request
+        self._outstanding += 1
+        self._pool.submit(self._execute, request)
+        if self._root is None:
+            self._root = widget.nametowidget(".")
+        self._schedule_poll()
+        return request
+
+    def cancel(self, key):
+        """取消 key 对应的未完成请求"""
+        request = self._pending.pop(key, None)
+        if request is not None:
+            request.cancel()
+
+    def _execute(self, request):
+        # 每个请求都会放回一个结果（包括已取消的），界面线程据此统计未完成的数量
+        try:
+            self._results.put((request, request.run(), None))
+        except Exception as e:
+            self._results.put((request, None, e))
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self._root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        """取回已完成的查询并调用回调"""
+        self._polling = False
+        while True:
+            try:
+                request, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._outstanding -= 1
+            request.finished = True
+            if request.key is not None and self._pending.get(request.key) is request:
+                del self._pending[request.key]
+            if request.cancelled or not _widget_exists(request.widget):
+                continue
+            try:
+                if error is None:
+                    if request.on_done is not None:
+                        request.on_done(result)
+                elif request.on_error is not None:
+                    request.on_error(error)
+                else:
+                    logger.error("数据库查询失败: %s", error)
+            except Exception:
+                logger.exception("处理查询结果失败")
+        if self._outstanding > 0:
+            self._schedule_poll()
+
+    def shutdown(self):
+        """取消所有未完成的请求并停止线程池"""
+        for request in list(self._pending.values()):
+            request.cancel()
+        self._pending.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _widget_exists(widget):
+    try:
+        return bool(widget.winfo_exists())
+    except tk.TclError:
+        return False
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """获取全局的数据库执行器"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = DbExecutor()
+        return _executor
+
+def submit(widget, func, *args, key=None, on_done=None, on_error=None):
+    """向全局执行器提交查询（见 DbExecutor.submit）"""
+    return get_executor().submit(widget, func, *args, key=key, on_done=on_done, on_error=on_error)
+
+def cancel(key):
+    """取消全局执行器中 key 对应的未完成请求"""
+    get_executor().cancel(key)
+
+def shutdown_executor():
+    """退出程序前停止全局执行器"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
@@ -0,0 +1,157 @@
+# diagnostics.py
+# 诊断界面：按总耗时列出最耗时的SQL语句（见 query_stats.py），以及连接池和写队列的统计。
+# 服务器模式下显示服务器上的统计（GET /api/metrics）。
+import tkinter as tk
+from tkinter import ttk, messagebox
+import config
+import database
+import db_executor
+import query_stats
+import write_queue
+
+# 列出的语句数
+TOP_STATEMENTS = 100
+
+def load_diagnostics(conn):
+    """读取统计：本地模式为本进程的统计，服务器模式为服务器上的统计"""
+    if config.API_URL:
+        return conn.get("/api/metrics")
+    return {"writes": write_queue.get_write_stats(), "pool": database.get_pool_stats(),
+            "queries": query_stats.top_statements(TOP_STATEMENTS)}
+
+def explain_statement(conn, sql):
+    """用语句最近一次执行的参数查看执行计划"""
+    return query_stats.explain(conn, sql, query_stats.statement_params(sql))
+
+class DiagnosticsWindow:
+    def __init__(self, master):
+        self.master = master
+        self.statements = {}     # 列表行ID -> 语句统计
+
+        self.create_summary()
+        self.create_statement_list()
+        self.create_detail()
+
+        self.load_statistics()
+
+    def create_summary(self):
+        """创建连接池、写队列统计和操作按钮"""
+        summary_frame = ttk.LabelFrame(self.master, text="概况")
+        summary_frame.pack(fill="x", padx=10, pady=5)
+
+        self.summary_label = ttk.Label(summary_frame, text="正在读取统计...", justify="left")
+        self.summary_label.pack(side="left", padx=5, pady=5)
+
+        btn_frame = ttk.Frame(summary_frame)
+        btn_frame.pack(side="right", padx=5, pady=5)
+        ttk.Button(btn_frame, text="刷新", command=self.load_statistics).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="执行计划", command=self.show_plan).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="清空统计", command=self.reset_statistics).pack(side="left", padx=5)
+
+    def create_statement_list(self):
+        """创建语句统计列表"""
+        list_frame = ttk.LabelFrame(self.master, text="SQL语句（按总耗时排序）")
+        list_frame.pack(fill="both", expand=True, padx=10, pady=5)
+
+        columns = ("total", "calls", "avg", "max", "rows", "errors", "site", "sql")
+        self.tree = ttk.Treeview(list_frame, columns=columns, show="headings", style="Custom.Treeview")
+        column_titles = {"total": "总耗时(ms)", "calls": "次数", "avg": "平均(ms)", "max": "最长(ms)",
+                         "rows": "行数", "errors": "出错", "site": "调用位置", "sql": "SQL"}
+        column_widths = {"total": 90, "calls": 60, "avg": 80, "max": 80, "rows": 70, "errors": 50,
+                         "site": 240, "sql": 500}
+        for col in columns:
+            self.tree.heading(col, text=column_titles[col], anchor="w")
+            self.tree.column(col, width=column_widths[col], stretch=(col == "sql"))
+
+        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        self.tree.bind("<<TreeviewSelect>>", self.show_detail)
+
+    def create_detail(self):
+        """创建选中语句的详细信息"""
+        detail_frame = ttk.LabelFrame(self.master, text="详细信息")
+        detail_frame.pack(fill="x", padx=10, pady=5)
+
+        self.detail_text = tk.Text(detail_frame, height=10, wrap="word")
+        self.detail_text.pack(fill="both", expand=True, padx=5, pady=5)
+        self.detail_text.config(state="disabled")
+
+    def load_statistics(self):
+        """读取统计（在后台读取，完成后显示）"""
+        db_executor.submit(self.tree, load_diagnostics, key=(self, "statistics"),
+                           on_done=self.show_statistics, on_error=self.show_query_error)
+
+    def show_query_error(self, error):
+        """显示读取失败的信息"""
+        messagebox.showerror("错误", f"读取统计失败: {error}")
+
+    def show_statistics(self, metrics):
+        """显示统计"""
+        pool, writes = metrics["pool"], metrics["writes"]
+        lines = [
+            f"连接池: 复用 {pool['hits']} 次，新建 {pool['misses']} 次，使用中 {pool['in_use']} 个",
+            f"写队列: 排队 {writes['queue_depth']} 个，{writes['batches']} 批共 {writes['operations']} 个写操作，"
+            f"失败 {writes['failed']} 个，每批提交 p50 {writes['commit_ms']['p50']:.1f} ms / "
+            f"p90 {writes['commit_ms']['p90']:.1f} ms",
+            f"慢查询: 超过 {config.DB_SLOW_QUERY_MS} ms 的语句记录在 {config.DB_SLOW_QUERY_LOG}",
+        ]
+        if config.API_URL:
+            lines.append(f"以上为服务器 {config.API_URL} 上的统计")
+        self.summary_label.config(text="\n".join(lines))
+
+        self.tree.delete(*self.tree.get_children())
+        self.statements = {}
+        for index, statement in enumerate(metrics.get("queries", [])):
+            sites = statement["sites"]
+            row_id = self.tree.insert("", "end", values=(
+                f"{statement['total_ms']:.1f}", statement["calls"], f"{statement['avg_ms']:.2f}",
+                f"{statement['max_ms']:.1f}", statement["rows"], statement["errors"],
+                sites[0][0] if sites else "", statement["sql"],
+            ), tags=("evenrow" if index % 2 == 0 else "oddrow",))
+            self.statements[row_id] = statement
+
+    def selected_statement(self):
+        selection = self.tree.selection()
+        return self.statements.get(selection[0]) if selection else None
+
+    def show_detail(self, event=None, plan=None):
+        """显示选中语句的完整SQL、各调用位置和执行计划"""
+        statement = self.selected_statement()
+        if statement is None:
+            return
+        lines = [statement["sql"], "", "调用位置:"]
+        lines.extend(f"  {site}（{count} 次）" for site, count in statement["sites"])
+        plan = plan or statement.get("plan")
+        if plan:
+            lines.extend(["", "执行计划:"])
+            lines.extend("  " + line for line in plan)
+        self.detail_text.config(state="normal")
+        self.detail_text.delete("1.0", "end")
+        self.detail_text.insert("1.0", "\n".join(lines))
+        self.detail_text.config(state="disabled")
+
+    def show_plan(self):
+        """查看选中语句的执行计划"""
+        statement = self.selected_statement()
+        if statement is None:
+            messagebox.showwarning("警告", "请先选择一条语句")
+            return
+        if config.API_URL:
+            # 服务器上只保存了慢查询的执行计划
+            if not statement.get("plan"):
+                messagebox.showinfo("提示", "服务器模式下只能查看慢查询的执行计划，请在运行服务器的电脑上查看")
+            return
+        db_executor.submit(self.tree, explain_statement, statement["sql"], key=(self, "plan"),
+                           on_done=lambda plan: self.show_detail(plan=plan or ["（该语句没有执行计划）"]),
+                           on_error=lambda error: messagebox.showerror("错误", f"获取执行计划失败: {error}"))
+
+    def reset_statistics(self):
+        """清空语句统计"""
+        if config.API_URL:
+            messagebox.showinfo("提示", "服务器上的统计请在服务器上清空（重启服务器）")
+            return
+        query_stats.reset()
+        self.load_statistics()
@@ -0,0 +1,178 @@
+# dosage.py
+# 剂量解析：把处方中自由填写的剂量（"10g"、"三钱"、"10-15克"、"适量"）解析为数量和单位，
+# 写入处方时保存到 prescriptions.dosage_qty / dosage_unit，统计用量时直接在SQL中求和
+import re
+from database import get_connection
+
+# 单位别名 -> (标准单位, 换算系数)，钱、两按现代习惯折算为克
+UNITS = {
+    "克": ("克", 1), "g": ("克", 1), "G": ("克", 1), "gram": ("克", 1),
+    "毫克": ("克", 0.001), "mg": ("克", 0.001),
+    "千克": ("克", 1000), "kg": ("克", 1000), "公斤": ("克", 1000),
+    "钱": ("克", 3),
+    "两": ("克", 30),
+    "包": ("包", 1), "袋": ("袋", 1), "粒": ("粒", 1), "片": ("片", 1),
+    "丸": ("丸", 1), "贴": ("贴", 1), "支": ("支", 1), "盒": ("盒", 1),
+    "瓶": ("瓶", 1), "剂": ("剂", 1), "枚": ("枚", 1), "条": ("条", 1),
+    "ml": ("毫升", 1), "毫升": ("毫升", 1),
+}
+
+# 不定量的写法，数量为None
+UNMEASURED = ("适量", "少许", "酌量", "酌情", "若干")
+
+_CHINESE_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5,
+                   "六": 6, "七": 7, "八": 8, "九": 9}
+_CHINESE_PLACES = {"十": 10, "百": 100, "千": 1000}
+
+# 未识别的单位中出现这些字时，说明数字没有解析完整（如"一万克"），整个剂量视为无法识别
+_NUMERAL_CHARS = set(_CHINESE_DIGITS) | set(_CHINESE_PLACES) | {"万", "亿", "半"}
+
+_NUMBER = r"(?:\d+(?:\.\d+)?|\.\d+|[零〇一二两三四五六七八九十百千半]+)"
+_DOSAGE_RE = re.compile(
+    rf"^\s*(?P<low>{_NUMBER})\s*(?:(?:-|~|～|—|－|至|到)\s*(?P<high>{_NUMBER}))?\s*(?P<unit>[^\d\s]*)\s*$"
+)
+
+# 剂量后面括号中的备注，如"10g（后下）"
+_NOTE_RE = re.compile(r"[（(][^）)]*[）)]")
+
+# 回填已有处方时每批处理的行数
+BACKFILL_BATCH_SIZE = 1000
+
+def _chinese_integer(text):
+    """把不超过万的中文整数（三、十二、一百零五、两千）转为数值，无法识别时返回None"""
+    total = 0
+    digit = None
+    last_place = 10000
+    for index, char in enumerate(text):
+        if char in _CHINESE_PLACES:
+            place = _CHINESE_PLACES[char]
+            # 位数必须从高到低；只有开头的"十"可以省略"一"（"十二"）
+            if place >= last_place or (digit is None and (char != "十" or index > 0)):
+                return None
+            total += (1 if digit is None else digit) * place
+            digit = None
+            last_place = place
+        elif _CHINESE_DIGITS.get(char) == 0:
+            # "一百零五"中的"零"只占位
+            if digit is not None:
+                return None
+        elif char in _CHINESE_DIGITS:
+            if digit is not None:
+                return None
+            digit = _CHINESE_DIGITS[char]
+        else:
+            return None
+    return float(total + (digit or 0))
+
+def _to_number(text):
+    """把阿拉伯数字或中文数字（一、十二、一百二十、半、一半）转为数值"""
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    if text == "半":
+        return 0.5
+    if text.endswith("半"):
+        whole = _to_number(text[:-1])
+        return None if whole is None else whole + 0.5
+    return _chinese_integer(text)
+
+def is_unmeasured(text):
+    """剂量是否为"适量"等不定量的写法"""
+    return any(word in str(text or "") for word in UNMEASURED)
+
+def parse_dosage(text):
+    """解析剂量，返回 (数量, 单位)
+
+    范围（"10-15g"）取上限；"适量"等不定量返回 (None, None)；
+    没有单位时单位为None（即药品自身的单位）；无法识别时返回 (None, None)。
+    """
+    text = _NOTE_RE.sub("", str(text or "")).strip()
+    if not text or is_unmeasured(text):
+        return None, None
+    match = _DOSAGE_RE.match(text)
+    if not match:
+        return None, None
+    number = match.group("high") or match.group("low")
+    unit = match.group("unit") or None
+    if unit is None and len(number) > 1 and number.endswith("两"):
+        # "一两"中的"两"是单位，"两包"中的"两"是数字
+        number, unit = number[:-1], "两"
+    elif unit is None and len(number) > 2 and number.endswith("两半"):
+        # "一两半"即1.5两
+        number, unit = number[:-2] + "半", "两"
+    half = 0
+    if unit is not None and len(unit) > 1 and unit.endswith("半"):
+        # "1两半"、"3钱半"：单位后的"半"为半个单位
+        unit, half = unit[:-1], 0.5
+    quantity = _to_number(number)
+    if quantity is None:
+        return None, None
+    quantity += half
+    if unit is not None:
+        if unit not in UNITS and unit.lower() not in UNITS:
+            if _NUMERAL_CHARS & set(unit):
+                return None, None
+            return quantity, unit
+        unit, factor = UNITS.get(unit) or UNITS[unit.lower()]
+        quantity = quantity * factor
+    return quantity, unit
+
+def stock_quantity(quantity, unit, stock_unit):
+    """把 parse_dosage 解析出的数量换算为库存单位（药品表中的 unit）的数量
+
+    剂量没有单位时即为库存单位；单位相同或都是重量单位（克、钱、两等）时换算；
+    其他情况（例如按粒计库存的药品开了"500mg"）无法换算，返回None。
+    """
+    if quantity is None:
+        return None
+    if unit is None:
+        return quantity
+    stock_unit = (stock_unit or "").strip()
+    standard, factor = UNITS.get(stock_unit) or UNITS.get(stock_unit.lower()) or (stock_unit, 1)
+    if standard != unit:
+        return None
+    return quantity / factor
+
+def backfill(conn, batch_size=BACKFILL_BATCH_SIZE):
+    """为尚未解析的处方补充数量和单位，按ID分批处理，返回处理的行数"""
+    last_id = 0
+    total = 0
+    while True:
+        rows = conn.execute("""
+            SELECT id, dosage FROM prescriptions
+            WHERE id > ? AND dosage_qty IS NULL AND dosage_unit IS NULL
+            ORDER BY id LIMIT ?
+        """, (last_id, batch_size)).fetchall()
+        if not rows:
+            return total
+        conn.executemany(
+            "UPDATE prescriptions SET dosage_qty = ?, dosage_unit = ? WHERE id = ?",
+            [parse_dosage(dosage) + (prescription_id,) for prescription_id, dosage in rows]
+        )
+        last_id = rows[-1][0]
+        total += len(rows)
+
+def consumption(start_date=None, end_date=None):
+    """按药品和单位统计处方用量，返回 [(药品, 单位, 总量, 处方数), ...]，按总量降序"""
+    conditions = ["pr.dosage_qty IS NOT NULL"]
+    params = []
+    if start_date:
+        conditions.append("mr.date >= ?")
+        params.append(start_date)
+    if end_date:
+        conditions.append("mr.date <= ?")
+        params.append(end_date)
+    conn = get_connection()
+    try:
+        return conn.execute(f"""
+            SELECT pr.medicine, COALESCE(pr.dosage_unit, m.unit), SUM(pr.dosage_qty), COUNT(*)
+            FROM prescriptions pr
+            JOIN medical_records mr ON pr.record_id = mr.id
+            LEFT JOIN medicines m ON m.name = pr.medicine
+            WHERE {' AND '.join(conditions)}
+            GROUP BY pr.medicine, COALESCE(pr.dosage_unit, m.unit)
+            ORDER BY SUM(pr.dosage_qty) DESC
+        """, params).fetchall()
+    finally:
+        conn.close()
@@ -0,0 +1,319 @@
+# export_data.py
+# 导出数据流水线：按患者顺序流式读取患者、病历和处方，逐个患者写入文件，
+# 内存占用只与单个患者的数据量有关，与数据库大小无关
+import csv
+import json
+from database import get_connection
+
+# 每次从游标取出的行数
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_QUERY = """
+    SELECT p.id, p.name, p.gender, p.age, p.phone, p.history,
+           mr.id, mr.date, mr.wang, mr.wen, mr.wen2, mr.qie, mr.diagnosis, mr.treatment,
+           pr.id, pr.medicine, pr.dosage, pr.usage
+    FROM patients p
+    LEFT JOIN medical_records mr ON p.id = mr.patient_id
+    LEFT JOIN prescriptions pr ON pr.record_id = mr.id
+    {where}
+    ORDER BY p.id, mr.date {order}, mr.id {order}, pr.id
+"""
+
+CSV_HEADER = ['患者ID', '姓名', '性别', '年龄', '电话', '病史', '病历ID', '病历日期', '望诊', '闻诊', '问诊', '切诊', '诊断', '治疗方案', '药品', '剂量', '用法']
+
+def iter_export_rows(conn, patient_id=None, newest_first=False, batch_size=EXPORT_BATCH_SIZE):
+    """按患者、病历日期、处方顺序逐行返回导出查询结果，每次从游标取 batch_size 行"""
+    where = "" if patient_id is None else "WHERE p.id = ?"
+    params = () if patient_id is None else (patient_id,)
+    order = "DESC" if newest_first else "ASC"
+    cursor = conn.cursor()
+    try:
+        cursor.execute(EXPORT_QUERY.format(where=where, order=order), params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+def iter_patient_records(patient_id=None, newest_first=False, batch_size=EXPORT_BATCH_SIZE):
+    """逐个返回患者字典
+
+    每个患者包含 records 列表，每条病历包含 prescriptions 列表。
+    查询结果已按患者排序，遇到下一个患者时才返回上一个，内存中只保留一个患者。
+    """
+    conn = get_connection()
+    try:
+        current = None
+        record = None
+        for row in iter_export_rows(conn, patient_id, newest_first, batch_size):
+            if current is None or current['id'] != row[0]:
+                if current is not None:
+                    yield current
+                current = {
+                    'id': row[0],
+                    'name': row[1],
+                    'gender': row[2],
+                    'age': row[3],
+                    'phone': row[4],
+                    'history': row[5],
+                    'records': []
+                }
+                record = None
+
+            if row[6] is None:  # 没有病历记录
+                continue
+            if record is None or record['id'] != row[6]:
+                record = {
+                    'id': row[6],
+                    'date': row[7],
+                    'wang': row[8],
+                    'wen': row[9],
+                    'wen2': row[10],
+                    'qie': row[11],
+                    'diagnosis': row[12],
+                    'treatment': row[13],
+                    'prescriptions': []
+                }
+                current['records'].append(record)
+
+            if row[14] is not None:  # 有处方
+                record['prescriptions'].append({
+                    'medicine': row[15],
+                    'dosage': row[16],
+                    'usage': row[17]
+                })
+        if current is not None:
+            yield current
+    finally:
+        conn.close()
+
+def load_patient_records(patient_id=None, newest_first=False):
+    """加载患者及其病历和处方到列表（适合单个患者等小数据量）"""
+    return list(iter_patient_records(patient_id, newest_first))
+
+def write_txt_patient(f, data):
+    """以文本格式写入一个患者的信息、病历和处方"""
+    f.write(f"患者ID: {data['id']}\n")
+    f.write(f"姓名: {data['name']}\n")
+    f.write(f"性别: {data['gender']}\n")
+    f.write(f"年龄: {data['age']}\n")
+    f.write(f"电话: {data['phone']}\n")
+    f.write(f"病史: {data['history'] if data['history'] else '无'}\n")
+    f.write("-" * 50 + "\n")
+
+    records = data['records']
+    if records:
+        for record in records:
+            prescriptions = record['prescriptions']
+
+            f.write(f"  病历ID: {record['id']}\n")
+            f.write(f"  日期: {record['date']}\n")
+            f.write(f"  望诊: {record['wang'] if record['wang'] else '无'}\n")
+            f.write(f"  闻诊: {record['wen'] if record['wen'] else '无'}\n")
+            f.write(f"  问诊: {record['wen2'] if record['wen2'] else '无'}\n")
+            f.write(f"  切诊: {record['qie'] if record['qie'] else '无'}\n")
+            f.write(f"  诊断: {record['diagnosis'] if record['diagnosis'] else '无'}\n")
+            f.write(f"  治疗方案: {record['treatment'] if record['treatment'] else '无'}\n")
+
+            if prescriptions:
+                f.write("  处方:\n")
+                for pres in prescriptions:
+                    f.write(f"    - 药品: {pres['medicine']}, 剂量: {pres['dosage']}, 用法: {pres['usage']}\n")
+            else:
+                f.write("  处方: 无\n")
+
+            f.write("-" * 30 + "\n")
+    else:
+        f.write("  病历: 无\n")
+        f.write("-" * 30 + "\n")
+
+def write_txt(f, patients):
+    """以文本格式逐个写入患者"""
+    for data in patients:
+        write_txt_patient(f, data)
+        f.write("\n" + "="*60 + "\n\n")
+
+def write_csv(f, patients):
+    """以CSV格式逐个写入患者，每张处方占一行"""
+    writer = csv.writer(f)
+    writer.writerow(CSV_HEADER)
+
+    for data in patients:
+        patient_cols = [data['id'], data['name'], data['gender'], data['age'], data['phone'], data['history']]
+        records = data['records']
+
+        if not records:
+            # 如果没有病历，只写入患者基本信息
+            writer.writerow(patient_cols + [''] * 11)
+            continue
+
+        for record in records:
+            record_cols = [
+                record['id'], record['date'],
+                record['wang'], record['wen'],
+                record['wen2'], record['qie'],
+                record['diagnosis'], record['treatment']
+            ]
+            if record['prescriptions']:
+                # 如果有处方，每张处方占一行
+                for pres in record['prescriptions']:
+                    writer.writerow(patient_cols + record_cols + [pres['medicine'], pres['dosage'], pres['usage']])
+            else:
+                # 如果没有处方，只写入病历信息
+                writer.writerow(patient_cols + record_cols + ['', '', ''])
+
+def write_json_array(f, patients):
+    """以JSON数组格式逐个写入患者，格式与 json.dump(indent=2) 相同"""
+    first = True
+    f.write("[")
+    for data in patients:
+        f.write("\n  " if first else ",\n  ")
+        first = False
+        # 每个患者单独序列化后整体缩进一级
+        f.write(json.dumps(data, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+    f.write("]" if first else "\n]")
+
+def write_json_lines(f, patients):
+    """以JSON Lines格式写入，每行一个患者"""
+    for data in patients:
+        f.write(json.dumps(data, ensure_ascii=False))
+        f.write("\n")
+
+def write_pdf(file_path, patients):
+    """将患者数据写入PDF文件（reportlab需要先生成完整的story再排版）"""
+    # 检查是否安装了reportlab
+    try:
+        from reportlab.lib.pagesizes import letter, A4
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import inch
+        from reportlab.lib import colors
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+    except ImportError:
+        raise RuntimeError("需要安装reportlab库来导出PDF文件:\npip install reportlab")
+
+    # 注册中文字体
+    try:
+        # 尝试使用系统字体
+        pdfmetrics.registerFont(TTFont('SimSun', 'simsun.ttc'))
+        font_name = 'SimSun'
+    except:
+        try:
+            # 尝试使用其他常见中文字体
+            pdfmetrics.registerFont(TTFont('MSYH', 'msyh.ttc'))
+            font_name = 'MSYH'
+        except:
+            # 如果找不到中文字体，尝试使用系统默认字体
+            font_name = 'Helvetica'
+
+    # 创建PDF文档
+    doc = SimpleDocTemplate(file_path, pagesize=A4)
+    story = []
+    styles = getSampleStyleSheet()
+
+    # 创建自定义样式以支持中文
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=1,  # 居中
+        fontName=font_name
+    )
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontName=font_name,
+        fontSize=10,
+        leading=14
+    )
+
+    # 添加标题
+    title = Paragraph("中医诊所患者数据报告", title_style)
+    story.append(title)
+    story.append(Spacer(1, 12))
+
+    # 添加每个患者的信息
+    for data in patients:
+        # 患者基本信息
+        patient_info = f"""
+        <b>患者ID:</b> {data['id']}<br/>
+        <b>姓名:</b> {data['name']}<br/>
+        <b>性别:</b> {data['gender']}<br/>
+        <b>年龄:</b> {data['age']}<br/>
+        <b>电话:</b> {data['phone']}<br/>
+        <b>病史:</b> {data['history'] if data['history'] else '无'}<br/>
+        """
+        story.append(Paragraph(patient_info, normal_style))
+        story.append(Spacer(1, 12))
+
+        if data['records']:
+            for record_data in data['records']:
+                # 病历信息
+                record_info = f"""
+                <b>病历ID:</b> {record_data['id']}<br/>
+                <b>日期:</b> {record_data['date']}<br/>
+                <b>望诊:</b> {record_data['wang'] if record_data['wang'] else '无'}<br/>
+                <b>闻诊:</b> {record_data['wen'] if record_data['wen'] else '无'}<br/>
+                <b>问诊:</b> {record_data['wen2'] if record_data['wen2'] else '无'}<br/>
+                <b>切诊:</b> {record_data['qie'] if record_data['qie'] else '无'}<br/>
+                <b>诊断:</b> {record_data['diagnosis'] if record_data['diagnosis'] else '无'}<br/>
+                <b>治疗方案:</b> {record_data['treatment'] if record_data['treatment'] else '无'}<br/>
+                """
+                story.append(Paragraph(record_info, normal_style))
+
+                # 处方信息
+                if record_data['prescriptions']:
+                    story.append(Paragraph("<b>处方:</b>", normal_style))
+                    table_data = [['药品', '剂量', '用法']]
+                    for pres in record_data['prescriptions']:
+                        table_data.append([pres['medicine'], pres['dosage'], pres['usage']])
+
+                    # 设置表格样式以支持中文
+                    table = Table(table_data)
+                    table.setStyle(TableStyle([
+                        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                        ('FONTNAME', (0, 0), (-1, 0), font_name),
+                        ('FONTNAME', (0, 1), (-1, -1), font_name),
+                        ('FONTSIZE', (0, 0), (-1, 0), 10),
+                        ('FONTSIZE', (0, 1), (-1, -1), 8),
+                        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+                    ]))
+                    story.append(table)
+                else:
+                    story.append(Paragraph("处方: 无", normal_style))
+
+                story.append(Spacer(1, 12))
+        else:
+            story.append(Paragraph("病历: 无", normal_style))
+
+        story.append(Spacer(1, 20))
+
+    # 构建PDF
+    doc.build(story)
+
+# 导出格式：(写入函数, 文件编码, open()的newline参数)，PDF由reportlab直接写文件
+WRITERS = {
+    'txt': (write_txt, 'utf-8-sig', None),
+    'csv': (write_csv, 'utf-8-sig', ''),
+    'json': (write_json_array, 'utf-8', None),
+    'jsonl': (write_json_lines, 'utf-8', None),
+}
+
+def export_to_file(file_path, fmt, patients=None):
+    """将患者数据以指定格式流式写入文件，patients 为空时导出全部患者"""
+    if patients is None:
+        patients = iter_patient_records()
+    if fmt == 'pdf':
+        write_pdf(file_path, patients)
+        return
+    writer, encoding, newline = WRITERS[fmt]
+    with open(file_path, 'w', encoding=encoding, newline=newline) as f:
+        writer(f, patients)
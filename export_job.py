@@ -0,0 +1,269 @@
+# export_job.py
+# 后台导出任务：在工作线程中导出数据，通过队列把进度传回Tk主线程显示，
+# 先写入同目录下的临时文件，完成后再原子替换为目标文件
+import os
+import queue
+import secrets
+import shutil
+import threading
+import time
+import tkinter as tk
+from tkinter import ttk, messagebox, filedialog
+from database import get_connection, get_pool
+from export_data import iter_patient_records, export_to_file
+from repositories import PatientRepository
+
+# 导出格式：(默认扩展名, 文件类型)
+EXPORT_FORMATS = {
+    "txt": (".txt", [("Text files", "*.txt"), ("All files", "*.*")]),
+    "pdf": (".pdf", [("PDF files", "*.pdf"), ("All files", "*.*")]),
+    "json": (".json", [("JSON files", "*.json"), ("All files", "*.*")]),
+    "jsonl": (".jsonl", [("JSON Lines files", "*.jsonl"), ("All files", "*.*")]),
+    "csv": (".csv", [("CSV files", "*.csv"), ("All files", "*.*")]),
+}
+
+# 进度对话框轮询队列的间隔（毫秒）
+POLL_INTERVAL = 100
+
+
+def create_temp_file(file_path):
+    """在目标文件所在目录创建空的临时文件，返回路径
+
+    不用 tempfile.mkstemp：它创建的文件权限为0600，替换后导出文件只有导出的用户能读；
+    这里与普通 open() 一样按0666减去umask创建。
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    prefix = "." + os.path.basename(file_path) + "."
+    while True:
+        temp_path = os.path.join(directory, prefix + secrets.token_hex(4) + ".tmp")
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        return temp_path
+
+
+class ExportCancelled(Exception):
+    """导出被用户取消"""
+
+
+class ExportJob:
+    """在工作线程中执行的导出任务
+
+    进度、完成、取消和错误都以事件形式放入 events 队列，由Tk主线程读取：
+    ("progress", 已导出患者数, 患者总数, 已导出行数, 每秒行数)
+    ("done", 文件路径) / ("cancelled",) / ("error", 错误信息)
+    """
+
+    def __init__(self, file_path, fmt, patient_id=None):
+        self.file_path = file_path
+        self.fmt = fmt
+        self.patient_id = patient_id
+        self.events = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="export-job", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """请求取消，工作线程在处理下一个患者前停止"""
+        self._cancel.set()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _count_patients(self):
+        if self.patient_id is not None:
+            return 1
+        conn = get_connection()
+        try:
+            return PatientRepository(conn).count()
+        finally:
+            conn.close()
+
+    def _track_progress(self, patients, total):
+        """包装患者生成器：统计进度并检查取消请求"""
+        started = time.monotonic()
+        last_report = 0
+        done = 0
+        rows = 0
+        for data in patients:
+            if self._cancel.is_set():
+                raise ExportCancelled()
+            yield data
+            done += 1
+            # 与导出查询的行数一致：每张处方一行，没有处方的病历和没有病历的患者各一行
+            rows += sum(max(1, len(r['prescriptions'])) for r in data['records']) or 1
+            now = time.monotonic()
+            if now - last_report >= POLL_INTERVAL / 1000 or done == total:
+                last_report = now
+                elapsed = now - started
+                self.events.put(("progress", done, total, rows, rows / elapsed if elapsed > 0 else 0.0))
+        if self._cancel.is_set():
+            raise ExportCancelled()
+
+    def _run(self):
+        temp_path = None
+        try:
+            # 目录不存在或不可写时也要通知对话框，所以在 try 中创建临时文件
+            temp_path = create_temp_file(self.file_path)
+            total = self._count_patients()
+            self.events.put(("progress", 0, total, 0, 0.0))
+            patients = self._track_progress(iter_patient_records(self.patient_id), total)
+            export_to_file(temp_path, self.fmt, patients)
+            if os.path.exists(self.file_path):
+                # 覆盖已有文件时保留原来的权限（与直接写入原文件相同）
+                shutil.copymode(self.file_path, temp_path)
+            os.replace(temp_path, self.file_path)
+            self.events.put(("done", self.file_path))
+        except ExportCancelled:
+            self.events.put(("cancelled",))
+        except Exception as e:
+            self.events.put(("error", str(e)))
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            get_pool().close_idle()
+
+
+class ExportProgressDialog:
+    """导出进度对话框，显示进度和速度，支持取消"""
+
+    def __init__(self, master, job):
+        self.job = job
+        self.dialog = tk.Toplevel(master)
+        self.dialog.title("正在导出")
+        self.dialog.geometry("420x160")
+        self.dialog.resizable(False, False)
+        self.dialog.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        main_frame = ttk.Frame(self.dialog)
+        main_frame.pack(fill="both", expand=True, padx=20, pady=15)
+
+        ttk.Label(main_frame, text=f"导出到: {os.path.basename(job.file_path)}", font=("微软雅黑", 10, "bold")).pack(anchor="w")
+
+        self.progress = ttk.Progressbar(main_frame, orient="horizontal", mode="determinate", maximum=100)
+        self.progress.pack(fill="x", pady=10)
+
+        self.status_label = ttk.Label(main_frame, text="正在准备...")
+        self.status_label.pack(anchor="w")
+
+        self.cancel_button = ttk.Button(main_frame, text="取消", command=self.cancel)
+        self.cancel_button.pack(pady=(10, 0))
+
+        self.dialog.after(POLL_INTERVAL, self.poll)
+
+    def cancel(self):
+        """取消导出，等待工作线程确认后关闭"""
+        self.job.cancel()
+        self.cancel_button.config(state="disabled")
+        self.status_label.config(text="正在取消...")
+
+    def poll(self):
+        """读取工作线程的事件并更新界面"""
+        try:
+            while True:
+                event = self.job.events.get_nowait()
+                kind = event[0]
+                if kind == "progress":
+                    _, done, total, rows, rate = event
+                    percent = done * 100 / total if total else 100
+                    self.progress["value"] = percent
+                    self.status_label.config(
+                        text=f"已导出 {done}/{total} 位患者（{percent:.0f}%），{rows} 行，{rate:.0f} 行/秒"
+                    )
+                elif kind == "done":
+                    self.dialog.destroy()
+                    messagebox.showinfo("成功", f"数据已导出到 {event[1]}")
+                    return
+                elif kind == "cancelled":
+                    self.dialog.destroy()
+                    messagebox.showinfo("提示", "导出已取消")
+                    return
+                elif kind == "error":
+                    self.dialog.destroy()
+                    messagebox.showerror("错误", f"导出失败: {event[1]}")
+                    return
+        except queue.Empty:
+            pass
+        self.dialog.after(POLL_INTERVAL, self.poll)
+
+
+def start_export_job(master, file_path, fmt, patient_id=None):
+    """启动后台导出任务并显示进度对话框"""
+    job = ExportJob(file_path, fmt, patient_id)
+    ExportProgressDialog(master, job)
+    job.start()
+    return job
+
+def ask_export_path(fmt):
+    """选择导出文件的保存路径"""
+    extension, filetypes = EXPORT_FORMATS[fmt]
+    return filedialog.asksaveasfilename(defaultextension=extension, filetypes=filetypes)
+
+def show_export_dialog(master):
+    """显示导出格式选择窗口，确定后在后台导出"""
+    # 创建选择格式的窗口
+    format_window = tk.Toplevel()
+    format_window.title("选择导出格式")
+    format_window.geometry("400x200")
+    format_window.transient()  # 设置为临时窗口
+    format_window.grab_set()   # 模态窗口
+
+    # 居中显示
+    format_window.geometry(f"+{format_window.winfo_screenwidth()//2-200}+{format_window.winfo_screenheight()//2-100}")
+
+    format_var = tk.StringVar(value="txt")
+    formats = list(EXPORT_FORMATS)
+
+    def confirm_export():
+        format_choice = format_var.get()
+        # 选择保存路径
+        file_path = ask_export_path(format_choice)
+        format_window.destroy()
+        if file_path:
+            start_export_job(master.winfo_toplevel(), file_path, format_choice)
+
+    # 使用ttkbootstrap样式
+    try:
+        import ttkbootstrap as tb
+
+        # 创建主框架
+        main_frame = tb.Frame(format_window)
+        main_frame.pack(fill="both", expand=True, padx=20, pady=20)
+
+        # 标题标签
+        title_label = tb.Label(main_frame, text="请选择导出格式:", font=("微软雅黑", 12, "bold"))
+        title_label.pack(pady=10)
+
+        format_combo = tb.Combobox(main_frame, textvariable=format_var, values=formats, state="readonly", width=12, font=("微软雅黑", 10))
+        format_combo.pack(pady=10)
+
+        # 按钮框架
+        button_frame = tb.Frame(main_frame)
+        button_frame.pack(pady=15)
+
+        # 确认按钮
+        tb.Button(button_frame, text="确定", command=confirm_export, bootstyle="success-outline").pack(side="left", padx=5)
+
+        # 取消按钮
+        tb.Button(button_frame, text="取消", command=format_window.destroy, bootstyle="secondary-outline").pack(side="left", padx=5)
+    except ImportError:
+        # 如果没有ttkbootstrap，则使用标准tkinter
+        ttk.Label(format_window, text="请选择导出格式:", font=("Arial", 12)).pack(pady=20)
+
+        format_combo = ttk.Combobox(format_window, textvariable=format_var, values=formats, state="readonly", width=10)
+        format_combo.pack(pady=10)
+
+        # 确认按钮
+        ttk.Button(format_window, text="确定", command=confirm_export).pack(pady=10)
+
+    # 绑定回车键
+    format_window.bind('<Return>', lambda e: confirm_export())
+    format_window.bind('<Escape>', lambda e: format_window.destroy())
+
+    # 设置焦点到下拉框
+    format_combo.focus_set()
@@ -2,7 +2,29 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import json
-from database import get_connection
+import db_executor
+from tree_binding import TreeBinding
+from repositories import FavoriteRepository, open_repository, background_write
+
+def query_folders(conn):
+    """查询全部收藏夹及其中的处方数量"""
+    return open_repository(FavoriteRepository, conn).folders()
+
+def find_folders(conn, folder_name=""):
+    """按名称查询收藏夹，按创建时间降序排列"""
+    return open_repository(FavoriteRepository, conn).find_folders(folder_name)
+
+def query_favorites(conn):
+    """查询全部收藏处方，按收藏时间降序排列"""
+    return open_repository(FavoriteRepository, conn).favorites()
+
+def query_favorites_by_folder(conn, folder_id):
+    """查询某个收藏夹下的收藏处方，按收藏时间降序排列"""
+    return open_repository(FavoriteRepository, conn).favorites_in_folder(folder_id)
+
+def query_folder_names(conn):
+    """查询全部收藏夹的 (id, 名称)"""
+    return open_repository(FavoriteRepository, conn).folder_names()
 
 class FavoriteManagementWindow:
     def __init__(self, master):
@@ -104,6 +126,11 @@ class FavoriteManagementWindow:
         # 绑定双击事件
         self.folder_tree.bind("<Double-1>", self.on_folder_double_click)
 
+        # 按收藏夹ID绑定数据，刷新时只更新有变化的行
+        self.folder_binding = TreeBinding(
+            self.folder_tree, lambda folder: (folder[0], folder[1], folder[2], folder[3], "删除"), striped=False
+        )
+
         # 加载收藏夹列表
         self.load_folders()
 
@@ -152,6 +179,9 @@ class FavoriteManagementWindow:
         
         # 绑定事件处理删除操作
         self.favorite_tree.bind("<ButtonRelease-1>", self.on_favorite_tree_click)
+        
+        # 按收藏处方ID绑定数据（行已格式化为列表显示的值）
+        self.favorite_binding = TreeBinding(self.favorite_tree, striped=False)
 
     def show_folders_view(self):
         """显示收藏夹列表视图"""
@@ -215,17 +245,14 @@ class FavoriteManagementWindow:
 
     def create_folder_with_name(self, folder_name):
         """创建新收藏夹（内部方法）"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT INTO favorite_folders (name) VALUES (?)", (folder_name,))
-            conn.commit()
-            messagebox.showinfo("成功", "收藏夹创建成功")
-            self.load_folders()
-        except Exception as e:
-            messagebox.showerror("错误", f"创建收藏夹失败: {str(e)}")
-        finally:
-            conn.close()
+        db_executor.submit(self.folder_tree, background_write, FavoriteRepository, "create_folder", folder_name,
+                           on_done=self.folder_created,
+                           on_error=lambda e: messagebox.showerror("错误", f"创建收藏夹失败: {str(e)}"))
+
+    def folder_created(self, folder_id):
+        """创建收藏夹完成"""
+        messagebox.showinfo("成功", "收藏夹创建成功")
+        self.load_folders()
 
     def delete_folder(self):
         """删除选中的收藏夹"""
@@ -234,50 +261,20 @@ class FavoriteManagementWindow:
             messagebox.showwarning("警告", "请先选择要删除的收藏夹")
             return
 
-        item = selection[0]
-        folder_id = self.folder_tree.item(item, "values")[0]
-
-        if messagebox.askyesno("确认", "确定要删除该收藏夹吗？此操作不可恢复！"):
-            conn = get_connection()
-            cursor = conn.cursor()
-            try:
-                # 先删除该收藏夹下的所有收藏处方
-                cursor.execute("DELETE FROM favorite_prescriptions WHERE folder_id = ?", (folder_id,))
-                # 再删除收藏夹
-                cursor.execute("DELETE FROM favorite_folders WHERE id = ?", (folder_id,))
-                conn.commit()
-                messagebox.showinfo("成功", "收藏夹删除成功")
-                # 根据当前视图决定刷新哪个列表
-                if self.current_view == 'folders':
-                    self.load_folders()
-                else:
-                    self.show_folders_view()  # 如果在查看某个收藏夹内容，返回列表
-            except Exception as e:
-                messagebox.showerror("错误", f"删除收藏夹失败: {str(e)}")
-            finally:
-                conn.close()
+        self.delete_folder_by_id(selection[0])
 
     def load_folders(self):
-        """加载收藏夹列表"""
-        # 清空现有数据
-        for item in self.folder_tree.get_children():
-            self.folder_tree.delete(item)
-
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT f.id, f.name, COUNT(fp.id) as prescription_count, f.created_time
-            FROM favorite_folders f
-            LEFT JOIN favorite_prescriptions fp ON f.id = fp.folder_id
-            GROUP BY f.id, f.name, f.created_time
-        """)
-        folders = cursor.fetchall()
-        conn.close()
-
-        for folder in folders:
-            # 添加操作列
-            values = (folder[0], folder[1], folder[2], folder[3], "删除")
-            self.folder_tree.insert("", "end", values=values)
+        """加载收藏夹列表（在后台查询，完成后显示）"""
+        db_executor.submit(self.folder_tree, query_folders,
+                           key=(self, "folders"), on_done=self.show_folders, on_error=self.show_query_error)
+
+    def show_folders(self, folders):
+        """把查询结果显示到收藏夹列表，只更新有变化的行"""
+        self.folder_binding.update(folders)
+
+    def show_query_error(self, error):
+        """显示查询失败的信息"""
+        messagebox.showerror("错误", f"查询收藏夹失败: {error}")
 
     def on_folder_tree_click(self, event):
         """处理收藏夹列表中的点击事件"""
@@ -293,54 +290,42 @@ class FavoriteManagementWindow:
         folder_id = self.folder_tree.item(item, "values")[0]
 
         if messagebox.askyesno("确认", "确定要删除该收藏夹吗？此操作不可恢复！"):
-            conn = get_connection()
-            cursor = conn.cursor()
-            try:
-                # 先删除该收藏夹下的所有收藏处方
-                cursor.execute("DELETE FROM favorite_prescriptions WHERE folder_id = ?", (folder_id,))
-                # 再删除收藏夹
-                cursor.execute("DELETE FROM favorite_folders WHERE id = ?", (folder_id,))
-                conn.commit()
-                messagebox.showinfo("成功", "收藏夹删除成功")
-                # 根据当前视图决定刷新哪个列表
-                if self.current_view == 'folders':
-                    self.load_folders()
-                else:
-                    self.show_folders_view()  # 如果在查看某个收藏夹内容，返回列表
-            except Exception as e:
-                messagebox.showerror("错误", f"删除收藏夹失败: {str(e)}")
-            finally:
-                conn.close()
+            # 同时删除该收藏夹下的所有收藏处方（在后台执行）
+            db_executor.submit(self.folder_tree, background_write, FavoriteRepository, "delete_folder", folder_id,
+                               on_done=self.folder_deleted,
+                               on_error=lambda e: messagebox.showerror("错误", f"删除收藏夹失败: {str(e)}"))
+
+    def folder_deleted(self, result):
+        """删除收藏夹完成"""
+        messagebox.showinfo("成功", "收藏夹删除成功")
+        # 根据当前视图决定刷新哪个列表
+        if self.current_view == 'folders':
+            self.load_folders()
+        else:
+            self.show_folders_view()  # 如果在查看某个收藏夹内容，返回列表
 
     def load_favorites(self):
-        """加载收藏处方列表"""
-        # 清空现有数据
-        for item in self.favorite_tree.get_children():
-            self.favorite_tree.delete(item)
-
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT fp.id, ff.name, fp.patient_name, fp.prescription_data, fp.created_time
-            FROM favorite_prescriptions fp
-            LEFT JOIN favorite_folders ff ON fp.folder_id = ff.id
-            ORDER BY fp.created_time DESC
-        """)
-        favorites = cursor.fetchall()
-        conn.close()
+        """加载收藏处方列表（在后台查询，完成后显示）"""
+        db_executor.submit(self.favorite_tree, query_favorites,
+                           key=(self, "favorites"), on_done=self.show_favorites, on_error=self.show_query_error)
 
+    def show_favorites(self, favorites):
+        """把全部收藏处方显示到列表，只更新有变化的行"""
+        rows = []
         for fav in favorites:
             id, folder_name, patient_name, prescription_data, created_time = fav
-            # 解析处方数据
-            try:
-                prescription_info = json.loads(prescription_data) if prescription_data else {}
-                details = self.format_prescription_details(prescription_info)
-            except:
-                details = "处方数据解析失败"
-            
             # 添加操作列
-            values = (id, folder_name or "未分类", patient_name or "未知", details, created_time, "删除")
-            item_id = self.favorite_tree.insert("", "end", values=values)
+            rows.append((id, folder_name or "未分类", patient_name or "未知",
+                         self.prescription_details(prescription_data), created_time, "删除"))
+        self.favorite_binding.update(rows)
+
+    def prescription_details(self, prescription_data):
+        """解析收藏的处方数据并格式化"""
+        try:
+            prescription_info = json.loads(prescription_data) if prescription_data else {}
+            return self.format_prescription_details(prescription_info)
+        except:
+            return "处方数据解析失败"
 
     def format_prescription_details(self, prescription_info):
         """格式化处方详情"""
@@ -367,55 +352,36 @@ class FavoriteManagementWindow:
             self.show_favorites_view(folder_id, folder_name)
 
     def load_favorites_by_folder(self, folder_id):
-        """根据收藏夹ID加载收藏处方"""
-        # 清空现有数据
-        for item in self.favorite_tree.get_children():
-            self.favorite_tree.delete(item)
-
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT fp.id, fp.patient_name, fp.prescription_data, fp.created_time
-            FROM favorite_prescriptions fp
-            WHERE fp.folder_id = ?
-            ORDER BY fp.created_time DESC
-        """, (folder_id,))
-        favorites = cursor.fetchall()
-        conn.close()
+        """根据收藏夹ID加载收藏处方（在后台查询，完成后显示）"""
+        db_executor.submit(self.favorite_tree, query_favorites_by_folder, folder_id,
+                           key=(self, "favorites"), on_done=self.show_folder_favorites, on_error=self.show_query_error)
 
+    def show_folder_favorites(self, favorites):
+        """把某个收藏夹下的收藏处方显示到列表，只更新有变化的行"""
+        rows = []
         for fav in favorites:
             id, patient_name, prescription_data, created_time = fav
-            # 解析处方数据
-            try:
-                prescription_info = json.loads(prescription_data) if prescription_data else {}
-                details = self.format_prescription_details(prescription_info)
-            except:
-                details = "处方数据解析失败"
-            
             # 添加操作列
-            values = (id, patient_name or "未知", details, created_time, "删除")
-            item_id = self.favorite_tree.insert("", "end", values=values)
+            rows.append((id, patient_name or "未知", self.prescription_details(prescription_data), created_time, "删除"))
+        self.favorite_binding.update(rows)
 
     def delete_favorite(self, item):
         """删除选中的收藏处方"""
         fav_id = self.favorite_tree.item(item, "values")[0]
 
         if messagebox.askyesno("确认", "确定要删除该收藏处方吗？此操作不可恢复！"):
-            conn = get_connection()
-            cursor = conn.cursor()
-            try:
-                cursor.execute("DELETE FROM favorite_prescriptions WHERE id = ?", (fav_id,))
-                conn.commit()
-                messagebox.showinfo("成功", "收藏处方删除成功")
-                # 刷新当前视图
-                if self.current_view == 'favorites' and self.current_folder_id:
-                    self.load_favorites_by_folder(self.current_folder_id)
-                elif self.current_view == 'folders':
-                    self.load_folders()  # 如果在收藏夹列表页，也要刷新数量
-            except Exception as e:
-                messagebox.showerror("错误", f"删除收藏处方失败: {str(e)}")
-            finally:
-                conn.close()
+            db_executor.submit(self.favorite_tree, background_write, FavoriteRepository, "delete", fav_id,
+                               on_done=self.favorite_deleted,
+                               on_error=lambda e: messagebox.showerror("错误", f"删除收藏处方失败: {str(e)}"))
+
+    def favorite_deleted(self, result):
+        """删除收藏处方完成"""
+        messagebox.showinfo("成功", "收藏处方删除成功")
+        # 刷新当前视图
+        if self.current_view == 'favorites' and self.current_folder_id:
+            self.load_favorites_by_folder(self.current_folder_id)
+        elif self.current_view == 'folders':
+            self.load_folders()  # 如果在收藏夹列表页，也要刷新数量
 
     def on_favorite_tree_click(self, event):
         """处理收藏处方列表中的点击事件"""
@@ -430,34 +396,9 @@ class FavoriteManagementWindow:
         """根据收藏夹名称搜索收藏夹"""
         folder_name = self.folder_name_search.get().strip()
 
-        # 清空现有数据
-        for item in self.folder_tree.get_children():
-            self.folder_tree.delete(item)
-
-        conn = get_connection()
-        cursor = conn.cursor()
-        query = """
-            SELECT f.id, f.name, COUNT(fp.id) as prescription_count, f.created_time
-            FROM favorite_folders f
-            LEFT JOIN favorite_prescriptions fp ON f.id = fp.folder_id
-            WHERE 1=1
-        """
-        params = []
-
-        if folder_name:
-            query += " AND f.name LIKE ?"
-            params.append(f"%{folder_name}%")
-
-        query += " GROUP BY f.id, f.name, f.created_time ORDER BY f.created_time DESC"
-
-        cursor.execute(query, params)
-        folders = cursor.fetchall()
-        conn.close()
-
-        for folder in folders:
-            # 添加操作列
-            values = (folder[0], folder[1], folder[2], folder[3], "删除")
-            self.folder_tree.insert("", "end", values=values)
+        # 新的查询会取消尚未完成的旧查询
+        db_executor.submit(self.folder_tree, find_folders, folder_name,
+                           key=(self, "folders"), on_done=self.show_folders, on_error=self.show_query_error)
 
     def reset_search(self):
         """重置查询条件"""
@@ -505,27 +446,15 @@ class AddToFavoritesDialog:
         # 收藏夹选择下拉框
         ttk.Label(folder_frame, text="收藏夹:").pack(anchor="w", padx=5, pady=5)
         
-        # 获取所有收藏夹
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name FROM favorite_folders")
-        folders = cursor.fetchall()
-        conn.close()
-
-        folder_options = [("新建收藏夹", -1)]  # 添加新建选项
-        for fid, name in folders:
-            folder_options.append((name, fid))
-
+        # 收藏夹名称 -> ID，在后台读取完成后填入下拉框
+        self.folder_ids = {}
         self.selected_folder = tk.StringVar()
-        if folder_options:
-            self.selected_folder.set(folder_options[0][0])  # 默认选择第一项
-        else:
-            self.selected_folder.set("新建收藏夹")
+        self.selected_folder.set("新建收藏夹")  # 默认选择第一项
 
         self.folder_combo = ttk.Combobox(
             folder_frame, 
             textvariable=self.selected_folder,
-            values=[option[0] for option in folder_options],
+            values=["新建收藏夹"],  # 添加新建选项
             state="readonly"
         )
         self.folder_combo.pack(fill="x", padx=5, pady=5)
@@ -546,9 +475,21 @@ class AddToFavoritesDialog:
         button_frame = ttk.Frame(self.dialog)
         button_frame.pack(fill="x", padx=10, pady=10)
 
-        ttk.Button(button_frame, text="收藏", command=self.add_to_favorites).pack(side="left", padx=5)
+        # 收藏在后台执行，完成前禁用收藏按钮
+        self.add_button = ttk.Button(button_frame, text="收藏", command=self.add_to_favorites)
+        self.add_button.pack(side="left", padx=5)
         ttk.Button(button_frame, text="取消", command=self.dialog.destroy).pack(side="left", padx=5)
 
+        # 获取所有收藏夹
+        db_executor.submit(self.folder_combo, query_folder_names, key=(self, "folders"),
+                           on_done=self.show_folder_names,
+                           on_error=lambda e: messagebox.showerror("错误", f"读取收藏夹失败: {str(e)}"))
+
+    def show_folder_names(self, folders):
+        """把收藏夹填入下拉框"""
+        self.folder_ids = {name: fid for fid, name in folders}
+        self.folder_combo['values'] = ["新建收藏夹"] + [name for fid, name in folders]
+
     def on_folder_selected(self, event):
         """当选择收藏夹时的处理"""
         if self.selected_folder.get() == "新建收藏夹":
@@ -560,51 +501,40 @@ class AddToFavoritesDialog:
         """添加到收藏夹"""
         selected_text = self.selected_folder.get()
         
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # 获取或创建收藏夹ID
-            folder_id = None
-            if selected_text == "新建收藏夹":
-                new_folder_name = self.new_folder_entry.get().strip()
-                if not new_folder_name:
-                    messagebox.showerror("错误", "请输入新收藏夹名称")
-                    return
-                
-                # 检查收藏夹是否已存在
-                cursor.execute("SELECT id FROM favorite_folders WHERE name = ?", (new_folder_name,))
-                existing = cursor.fetchone()
-                if existing:
-                    messagebox.showerror("错误", "该收藏夹名称已存在")
-                    return
-                
-                # 创建新收藏夹
-                cursor.execute("INSERT INTO favorite_folders (name) VALUES (?)", (new_folder_name,))
-                folder_id = cursor.lastrowid
-            else:
-                # 查找现有收藏夹ID
-                cursor.execute("SELECT id FROM favorite_folders WHERE name = ?", (selected_text,))
-                result = cursor.fetchone()
-                if result:
-                    folder_id = result[0]
-                else:
-                    messagebox.showerror("错误", "找不到指定的收藏夹")
-                    return
-
-            # 添加收藏处方
-            prescription_json = json.dumps(self.prescription_data, ensure_ascii=False)
-            cursor.execute("""
-                INSERT INTO favorite_prescriptions (folder_id, record_id, patient_name, prescription_data)
-                VALUES (?, ?, ?, ?)
-            """, (folder_id, self.record_id, self.patient_name, prescription_json))
+        if selected_text == "新建收藏夹":
+            new_folder_name = self.new_folder_entry.get().strip()
+            if not new_folder_name:
+                messagebox.showerror("错误", "请输入新收藏夹名称")
+                return
             
-            conn.commit()
-            messagebox.showinfo("成功", "处方已收藏")
-            self.dialog.destroy()
+            # 检查收藏夹是否已存在
+            if new_folder_name in self.folder_ids:
+                messagebox.showerror("错误", "该收藏夹名称已存在")
+                return
             
-        except Exception as e:
-            conn.rollback()
-            messagebox.showerror("错误", f"收藏失败: {str(e)}")
-        finally:
-            conn.close()
\ No newline at end of file
+            # 创建新收藏夹并添加收藏处方（同一个写操作，失败时不会留下空收藏夹）
+            args = ("add_to_new_folder", new_folder_name)
+        else:
+            # 查找现有收藏夹ID
+            folder_id = self.folder_ids.get(selected_text)
+            if folder_id is None:
+                messagebox.showerror("错误", "找不到指定的收藏夹")
+                return
+
+            # 添加收藏处方
+            args = ("add", folder_id)
+        
+        self.add_button.config(state="disabled")
+        db_executor.submit(self.dialog, background_write, FavoriteRepository, *args,
+                           self.record_id, self.patient_name, self.prescription_data,
+                           on_done=self.favorite_added, on_error=self.add_failed)
+
+    def favorite_added(self, result):
+        """收藏完成"""
+        messagebox.showinfo("成功", "处方已收藏")
+        self.dialog.destroy()
+
+    def add_failed(self, error):
+        """收藏失败"""
+        self.add_button.config(state="normal")
+        messagebox.showerror("错误", f"收藏失败: {str(error)}")
\ No newline at end of file
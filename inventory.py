@@ -0,0 +1,151 @@
+# inventory.py
+# 库存管理：扣减库存与保存处方在同一事务中完成，用条件UPDATE保证多个终端同时开药时不会超扣，
+# 每次库存变化都记录在 stock_movements 流水表中，可以按流水重放和对账
+import logging
+from database import get_connection, run_in_transaction
+from dosage import parse_dosage, stock_quantity
+
+logger = logging.getLogger(__name__)
+
+# 流水类型
+REASON_INITIAL = "initial"      # 新增药品时的初始库存
+REASON_DISPENSE = "dispense"    # 开处方扣减
+REASON_ADJUST = "adjust"        # 在药品管理中修改库存
+REASON_RECONCILE = "reconcile"  # 对账时补记的差额
+
+
+class InsufficientStock(Exception):
+    """库存不足，整个事务需要回滚"""
+
+    def __init__(self, medicine, requested, available):
+        super().__init__(f"库存不足！{medicine} 当前库存为 {available}，请求 {requested}")
+        self.medicine = medicine
+        self.requested = requested
+        self.available = available
+
+
+def parse_quantity(dosage):
+    """从剂量文字中取出数量，无法解析或为"适量"时返回None"""
+    return parse_dosage(dosage)[0]
+
+def record_movement(conn, medicine_id, medicine, change, stock_after, reason, record_id=None):
+    """写入一条库存流水"""
+    conn.execute("""
+        INSERT INTO stock_movements (medicine_id, medicine, change, stock_after, reason, record_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (medicine_id, medicine, change, stock_after, reason, record_id))
+
+def dispense(conn, prescriptions, record_id=None):
+    """按处方扣减库存，必须在保存处方的同一事务中调用
+
+    prescriptions 为 [(药品名称, 剂量), ...]，剂量可以是文字或 parse_dosage 解析出的 (数量, 单位)，
+    数量按药品表中的单位换算后（见 dosage.stock_quantity）同一药品先合并再扣减。
+    库存不足时抛出 InsufficientStock，由调用方回滚整个事务；
+    药品不存在或剂量无法解析时不扣减（与手工录入的处方兼容），剂量单位无法换算为库存单位时也不扣减并记录警告。
+    """
+    totals = {}
+    for medicine, dosage in prescriptions:
+        quantity, unit = dosage if isinstance(dosage, tuple) else parse_dosage(dosage)
+        if quantity is None or quantity <= 0:
+            continue
+        row = conn.execute("SELECT id, unit FROM medicines WHERE name = ? ORDER BY id LIMIT 1", (medicine,)).fetchone()
+        if not row:
+            continue
+        medicine_id, stock_unit = row
+        converted = stock_quantity(quantity, unit, stock_unit)
+        if converted is None:
+            logger.warning("%s 的剂量单位 %s 无法换算为库存单位 %s，未扣减库存", medicine, unit, stock_unit)
+            continue
+        total = totals.get(medicine_id, (medicine, 0))[1] + converted
+        totals[medicine_id] = (medicine, total)
+
+    for medicine_id, (medicine, quantity) in totals.items():
+        # 条件更新：读取和扣减在一条语句中完成，其他终端的扣减不会被覆盖
+        updated = conn.execute(
+            "UPDATE medicines SET stock = stock - ? WHERE id = ? AND stock >= ?",
+            (quantity, medicine_id, quantity)
+        ).rowcount
+        stock = conn.execute("SELECT stock FROM medicines WHERE id = ?", (medicine_id,)).fetchone()[0]
+        if not updated:
+            raise InsufficientStock(medicine, quantity, stock)
+        record_movement(conn, medicine_id, medicine, -quantity, stock, REASON_DISPENSE, record_id)
+
+def set_stock(conn, medicine_id, stock, reason=REASON_ADJUST):
+    """把库存设为指定数量，并记录差额"""
+    row = conn.execute("SELECT name, stock FROM medicines WHERE id = ?", (medicine_id,)).fetchone()
+    if not row:
+        return
+    name, current = row
+    conn.execute("UPDATE medicines SET stock = ? WHERE id = ?", (stock, medicine_id))
+    change = stock - (current or 0)
+    if change:
+        record_movement(conn, medicine_id, name, change, stock, reason)
+
+def apply_movements(movements):
+    """批量重放库存变化 [(药品名称, 变化量, 类型, 病历ID), ...]，全部成功或全部回滚，返回条数"""
+    def apply(conn):
+        for medicine, change, reason, record_id in movements:
+            row = conn.execute("SELECT id FROM medicines WHERE name = ? ORDER BY id LIMIT 1", (medicine,)).fetchone()
+            if not row:
+                raise ValueError(f"未找到药品 '{medicine}'")
+            medicine_id = row[0]
+            updated = conn.execute(
+                "UPDATE medicines SET stock = stock + ? WHERE id = ? AND stock + ? >= 0",
+                (change, medicine_id, change)
+            ).rowcount
+            stock = conn.execute("SELECT stock FROM medicines WHERE id = ?", (medicine_id,)).fetchone()[0]
+            if not updated:
+                raise InsufficientStock(medicine, -change, stock)
+            record_movement(conn, medicine_id, medicine, change, stock, reason, record_id)
+        return len(movements)
+    return run_in_transaction(apply)
+
+def ledger_balances(conn):
+    """按流水计算每种药品的库存 {药品ID: 数量}"""
+    return dict(conn.execute(
+        "SELECT medicine_id, SUM(change) FROM stock_movements GROUP BY medicine_id"
+    ).fetchall())
+
+def reconcile(fix=False):
+    """对比药品表库存和流水合计，返回不一致的 [(药品ID, 名称, 库存, 流水合计), ...]
+
+    fix=True 时以当前库存为准补记差额流水（例如直接修改过数据库之后）。
+    """
+    def check(conn):
+        balances = ledger_balances(conn)
+        mismatches = []
+        for medicine_id, name, stock in conn.execute("SELECT id, name, stock FROM medicines ORDER BY id").fetchall():
+            stock = stock or 0
+            balance = balances.get(medicine_id, 0)
+            if abs(stock - balance) > 1e-9:
+                mismatches.append((medicine_id, name, stock, balance))
+        if fix:
+            for medicine_id, name, stock, balance in mismatches:
+                record_movement(conn, medicine_id, name, stock - balance, stock, REASON_RECONCILE)
+        return mismatches
+    return run_in_transaction(check)
+
+def rebuild_stock():
+    """按流水重放，重新计算所有药品的库存，返回修改的药品数"""
+    def rebuild(conn):
+        balances = ledger_balances(conn)
+        changed = 0
+        for medicine_id, stock in conn.execute("SELECT id, stock FROM medicines").fetchall():
+            balance = balances.get(medicine_id, 0)
+            if abs((stock or 0) - balance) > 1e-9:
+                conn.execute("UPDATE medicines SET stock = ? WHERE id = ?", (balance, medicine_id))
+                changed += 1
+        return changed
+    return run_in_transaction(rebuild)
+
+def get_movements(medicine_id, limit=100):
+    """查询某种药品最近的库存流水"""
+    conn = get_connection()
+    try:
+        return conn.execute("""
+            SELECT id, change, stock_after, reason, record_id, created_time
+            FROM stock_movements WHERE medicine_id = ?
+            ORDER BY id DESC LIMIT ?
+        """, (medicine_id, limit)).fetchall()
+    finally:
+        conn.close()
@@ -0,0 +1,93 @@
+# live_search.py
+# 边输入边搜索：停止输入一段时间后才查询（防抖），新的输入会取消尚未完成的查询（见 db_executor），
+# 新条件只是在上次条件上继续输入（细化）且上次结果是完整的时，直接在上次的结果中过滤，不再访问数据库
+import db_executor
+from autocomplete import Debouncer
+
+# 停止输入多少毫秒后开始搜索
+LIVE_SEARCH_DELAY = 300
+
+
+def is_text_refinement(old, new):
+    """new 是否是 old 的细化：按包含关系匹配时，new 匹配的行一定也被 old 匹配"""
+    return old in new
+
+
+class LiveSearch:
+    """搜索表单的边输入边搜索
+
+    query(conn, criteria) 在后台执行，返回 (结果, 是否完整)，完整的结果必须是行列表；
+    refine(old_criteria, new_criteria) 返回判断旧结果中的行是否仍然匹配的函数，不能细化时返回 None；
+    on_results(结果) 在界面线程中显示结果。
+    """
+
+    def __init__(self, widget, key, query, on_results, refine=None, on_error=None, delay=LIVE_SEARCH_DELAY):
+        self.widget = widget
+        self.key = key
+        self.query = query
+        self.on_results = on_results
+        self.refine = refine
+        self.on_error = on_error
+        self.criteria = None    # 当前显示的结果对应的条件
+        self.rows = None        # 当前显示的完整结果，不完整时为 None
+        self._requested = None  # 正在查询的条件
+        self._get_criteria = None
+        self._debouncer = Debouncer(widget, delay, self._search_latest)
+
+    def bind(self, entries, get_criteria):
+        """输入框内容变化时自动搜索，get_criteria() 返回当前的查询条件"""
+        self._get_criteria = get_criteria
+        for entry in entries:
+            entry.bind("<KeyRelease>", lambda e: self._debouncer(), add="+")
+
+    def _search_latest(self):
+        self.search(self._get_criteria())
+
+    def search(self, criteria, force=False):
+        """按条件搜索，force=True 时一定重新查询数据库（例如点击"查询"按钮）"""
+        self._debouncer.cancel()
+        if not force:
+            if self._requested is not None and criteria == self._requested:
+                return
+            if criteria == self.criteria:
+                # 改回了当前显示的条件，只需取消未完成的查询
+                db_executor.cancel(self.key)
+                self._requested = None
+                return
+            matches = self._refinement(criteria)
+            if matches is not None:
+                db_executor.cancel(self.key)
+                self._requested = None
+                self._show(criteria, [row for row in self.rows if matches(row)], True)
+                return
+        self._requested = criteria
+        db_executor.submit(self.widget, self.query, criteria, key=self.key,
+                           on_done=lambda result: self._on_done(criteria, result), on_error=self._on_error)
+
+    def _refinement(self, criteria):
+        if self.refine is None or self.rows is None or self.criteria is None:
+            return None
+        return self.refine(self.criteria, criteria)
+
+    def _on_done(self, criteria, result):
+        self._requested = None
+        results, complete = result
+        self._show(criteria, results, complete)
+
+    def _on_error(self, error):
+        self._requested = None
+        if self.on_error is not None:
+            self.on_error(error)
+
+    def _show(self, criteria, results, complete):
+        self.criteria = criteria
+        self.rows = results if complete else None
+        self.on_results(results)
+
+    def invalidate(self):
+        """数据变化后丢弃缓存的结果，并取消未完成的查询"""
+        self._debouncer.cancel()
+        db_executor.cancel(self.key)
+        self.criteria = None
+        self.rows = None
+        self._requested = None
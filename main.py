@@ -1,11 +1,10 @@
 # main.py
+import logging
 import tkinter as tk
 from tkinter import messagebox
-import ttkbootstrap as ttk
-from ttkbootstrap import Style
 from login import show_login_window
-from patient import PatientManagementWindow
-from database import init_db
+import config
+import startup
 
 # 动态导入，避免循环导入
 def get_medical_record_window():
@@ -21,14 +20,27 @@ def get_medicine_window():
     return MedicineWindow
 
 def main():
-    # 初始化数据库
-    init_db()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    # 在后台初始化数据库，登录窗口不必等待
+    database_init = startup.start_database_init()
     
-    # 显示登录窗口
-    show_login_window(lambda: show_main_app())
+    try:
+        # 显示登录窗口
+        show_login_window(lambda: show_main_app(database_init))
+    finally:
+        startup.shutdown()
 
-def show_main_app():
+def show_main_app(database_init=None):
     """显示主应用程序窗口"""
+    # 登录成功后才需要数据库，此时初始化一般早已完成
+    if database_init is not None and not database_init.wait():
+        messagebox.showerror("错误", f"数据库初始化失败: {database_init.error}")
+        return
+    
+    import ttkbootstrap as ttk
+    from ttkbootstrap import Style
+    
     # 创建主窗口，使用ttkbootstrap样式
     root = ttk.Window(themename="superhero")
     root.title("中医诊所管理系统")
@@ -67,6 +79,7 @@ def show_main_app():
     ttk.Button(toolbar, text="收藏夹", command=lambda: show_favorite_management(content_frame), bootstyle="outline-secondary").pack(side="left", padx=2, pady=5)
     ttk.Button(toolbar, text="数据可视化", command=lambda: show_data_visualization(content_frame), bootstyle="outline-secondary").pack(side="left", padx=2, pady=5)
     ttk.Button(toolbar, text="导出", command=lambda: export_all_data(content_frame), bootstyle="outline-secondary").pack(side="left", padx=2, pady=5)
+    ttk.Button(toolbar, text="诊断", command=lambda: show_diagnostics(content_frame), bootstyle="outline-secondary").pack(side="left", padx=2, pady=5)
     
     # 默认显示患者管理界面
     show_patient_management(content_frame)
@@ -82,6 +95,7 @@ def clear_frame(frame):
 def show_patient_management(frame):
     """显示患者管理界面"""
     clear_frame(frame)
+    from patient import PatientManagementWindow
     PatientManagementWindow(frame)
 
 def show_medical_record(frame):
@@ -108,16 +122,19 @@ def show_favorite_management(frame):
     from favorite import FavoriteManagementWindow
     FavoriteManagementWindow(frame)
 
+def show_diagnostics(frame):
+    """显示诊断界面（SQL语句统计）"""
+    clear_frame(frame)
+    from diagnostics import DiagnosticsWindow
+    DiagnosticsWindow(frame)
+
 def export_all_data(frame):
-    """导出所有数据"""
-    # 导入病历窗口以使用其导出功能
-    MedicalRecordWindow = get_medical_record_window()
-    # 创建一个临时窗口实例来调用导出功能
-    temp_window = tk.Toplevel()
-    temp_window.withdraw()  # 隐藏窗口
-    medical_record_window = MedicalRecordWindow(temp_window)
-    medical_record_window.export_patient_data()
-    temp_window.destroy()
+    """导出所有数据（后台导出，不阻塞界面）"""
+    if config.API_URL:
+        messagebox.showinfo("提示", "导出需要直接读取数据库，请在运行服务器的电脑上导出")
+        return
+    from export_job import show_export_dialog
+    show_export_dialog(frame)
 
 def show_data_visualization(frame):
     """显示数据可视化界面"""
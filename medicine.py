@@ -1,7 +1,18 @@
 # medicine.py
 import tkinter as tk
 from tkinter import ttk, messagebox
-from database import get_connection
+import autocomplete
+import db_executor
+from tree_binding import TreeBinding
+from repositories import MedicineRepository, open_repository, background_write
+
+def query_medicines(conn):
+    """查询全部药品"""
+    return open_repository(MedicineRepository, conn).list()
+
+def find_medicines(conn, name="", usage=""):
+    """按名称（可输入拼音）和用法查询药品"""
+    return open_repository(MedicineRepository, conn).find(name, usage)
 
 class MedicineWindow:
     def __init__(self, master):
@@ -10,6 +21,9 @@ class MedicineWindow:
         # 创建药品表单
         self.create_medicine_form()
         
+        # 创建药品列表（只创建一次，刷新时只更新有变化的行）
+        self.create_medicine_list()
+        
         # 加载药品数据
         self.load_medicines()
     
@@ -65,28 +79,22 @@ class MedicineWindow:
         btn_frame = ttk.Frame(form_frame)
         btn_frame.grid(row=2, column=0, columnspan=6, pady=10)
         
-        ttk.Button(btn_frame, text="保存", command=self.save_medicine).pack(side="left", padx=5)
+        # 保存在后台执行，完成前禁用保存按钮
+        self.save_button = ttk.Button(btn_frame, text="保存", command=self.save_medicine)
+        self.save_button.pack(side="left", padx=5)
         ttk.Button(btn_frame, text="清空", command=self.clear_form).pack(side="left", padx=5)
     
     def load_medicines(self):
-        """加载药品数据"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, stock, unit, usage FROM medicines")
-        medicines = cursor.fetchall()
-        conn.close()
-        
-        # 创建药品列表
-        self.create_medicine_list(medicines)
+        """加载药品数据（在后台查询，完成后显示）"""
+        db_executor.submit(self.name_entry, query_medicines,
+                           key=(self, "medicines"), on_done=self.show_medicines, on_error=self.show_query_error)
     
-    def create_medicine_list(self, medicines):
+    def show_query_error(self, error):
+        """显示查询失败的信息"""
+        messagebox.showerror("错误", f"查询药品失败: {error}")
+    
+    def create_medicine_list(self):
         """创建药品列表"""
-        # 如果已有列表，先清空
-        for widget in self.master.winfo_children():
-            if widget != self.name_entry.master and widget != self.name_search.master:  # 保留表单部分
-                widget.destroy()
-        
-        # 创建新列表
         list_frame = ttk.LabelFrame(self.master, text="药品列表")
         list_frame.pack(fill="both", expand=True, padx=10, pady=5)
         
@@ -135,19 +143,12 @@ class MedicineWindow:
         # 绑定点击事件
         self.tree.bind("<ButtonRelease-1>", self.on_tree_click)
         
-        # 添加数据
-        for index, medicine in enumerate(medicines):
-            # 添加操作按钮的文本
-            medicine_with_actions = medicine + ("修改", "删除")
-            item_id = self.tree.insert("", "end", values=medicine_with_actions)
-            # 根据行号设置交替颜色
-            if index % 2 == 0:
-                self.tree.item(item_id, tags=("evenrow",))
-            else:
-                self.tree.item(item_id, tags=("oddrow",))
-        
-        # 强制更新UI以确保样式生效
-        self.master.update_idletasks()
+        # 按药品ID绑定数据
+        self.binding = TreeBinding(self.tree, lambda medicine: tuple(medicine) + ("修改", "删除"))
+    
+    def show_medicines(self, medicines):
+        """把查询结果显示到药品列表，只更新有变化的行"""
+        self.binding.update(medicines)
     
     def save_medicine(self):
         """保存药品信息"""
@@ -165,30 +166,28 @@ class MedicineWindow:
             messagebox.showerror("错误", "库存必须是数字")
             return
         
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # 检查是否已存在同名药品
-        cursor.execute("SELECT id FROM medicines WHERE name = ?", (name,))
-        existing = cursor.fetchone()
+        stock = int(stock) if stock else 0
         
-        if existing:
-            # 更新药品
-            cursor.execute("""
-                UPDATE medicines SET stock = ?, unit = ?, usage = ?
-                WHERE id = ?
-            """, (int(stock) if stock else 0, unit, usage, existing[0]))
-            messagebox.showinfo("成功", "药品信息已更新")
-        else:
-            # 新增药品
-            cursor.execute("""
-                INSERT INTO medicines (name, stock, unit, usage)
-                VALUES (?, ?, ?, ?)
-            """, (name, int(stock) if stock else 0, unit, usage))
+        # 已存在同名药品时修改库存并记录流水，否则新增药品，初始库存记为期初流水
+        self.save_button.config(state="disabled")
+        db_executor.submit(self.tree, background_write, MedicineRepository, "save", name, stock, unit, usage,
+                           on_done=self.medicine_saved, on_error=self.save_failed)
+    
+    def save_failed(self, error):
+        """保存失败"""
+        self.save_button.config(state="normal")
+        messagebox.showerror("错误", f"保存失败: {str(error)}")
+    
+    def medicine_saved(self, created):
+        """保存完成，created 表示是否新增了药品"""
+        self.save_button.config(state="normal")
+        if created:
             messagebox.showinfo("成功", "药品信息已保存")
+        else:
+            messagebox.showinfo("成功", "药品信息已更新")
         
-        conn.commit()
-        conn.close()
+        # 新增的药品需要出现在自动完成候选中
+        autocomplete.invalidate_medicine_index()
         
         # 刷新列表
         self.load_medicines()
@@ -256,51 +255,25 @@ class MedicineWindow:
     def delete_medicine(self, medicine_id):
         """删除药品"""
         if messagebox.askyesno("确认", "确定要删除该药品吗？"):
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            try:
-                cursor.execute("DELETE FROM medicines WHERE id = ?", (medicine_id,))
-                conn.commit()
-                messagebox.showinfo("成功", "药品已删除")
-                # 重新加载药品列表
-                self.load_medicines()
-            except Exception as e:
-                messagebox.showerror("错误", f"删除失败: {str(e)}")
-            finally:
-                conn.close()
+            db_executor.submit(self.tree, background_write, MedicineRepository, "delete", medicine_id,
+                               on_done=self.medicine_deleted,
+                               on_error=lambda e: messagebox.showerror("错误", f"删除失败: {str(e)}"))
+    
+    def medicine_deleted(self, result):
+        """删除完成"""
+        autocomplete.invalidate_medicine_index()
+        messagebox.showinfo("成功", "药品已删除")
+        # 重新加载药品列表
+        self.load_medicines()
     
     def search_medicines(self):
         """根据条件查询药品"""
         name = self.name_search.get().strip()
         usage = self.usage_search.get().strip()
         
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # 构建查询条件
-        conditions = []
-        params = []
-        
-        if name:
-            conditions.append("name LIKE ?")
-            params.append(f"%{name}%")
-        
-        if usage:
-            conditions.append("usage LIKE ?")
-            params.append(f"%{usage}%")
-        
-        if conditions:
-            query = f"SELECT id, name, stock, unit, usage FROM medicines WHERE {' AND '.join(conditions)}"
-        else:
-            query = "SELECT id, name, stock, unit, usage FROM medicines"
-        
-        cursor.execute(query, params)
-        medicines = cursor.fetchall()
-        conn.close()
-        
-        # 重新创建列表
-        self.create_medicine_list(medicines)
+        # 新的查询会取消尚未完成的旧查询
+        db_executor.submit(self.name_entry, find_medicines, name, usage,
+                           key=(self, "medicines"), on_done=self.show_medicines, on_error=self.show_query_error)
     
     def reset_search(self):
         """重置查询条件"""
@@ -0,0 +1,406 @@
+# migrations.py
+# 数据库结构迁移：按版本号顺序执行，已执行的版本记录在 schema_version 表中，
+# 全部迁移完成后把结构指纹写入 PRAGMA user_version，之后启动时只需读取一次即可确认结构是最新的
+import logging
+import sqlite3
+import zlib
+
+logger = logging.getLogger(__name__)
+
+def _add_column_if_missing(conn, table, column, definition):
+    """如果表中缺少某列则添加（兼容旧版本数据库）"""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        logger.info("已为%s表添加%s列", table, column)
+
+def _base_schema(conn):
+    """基础表结构，与随程序发布的 clinic.db 完全一致（包括 UNIQUE 约束和默认值）"""
+    # 患者表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        gender TEXT,
+        age INTEGER,
+        phone TEXT UNIQUE,
+        history TEXT
+    )
+    ''')
+
+    # 病历表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS medical_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        date TEXT,
+        wang TEXT,        -- 望诊
+        wen TEXT,         -- 闻诊
+        wen2 TEXT,        -- 问诊
+        qie TEXT,         -- 切诊
+        diagnosis TEXT,
+        treatment TEXT,
+        FOREIGN KEY (patient_id) REFERENCES patients (id)
+    )
+    ''')
+
+    # 处方表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS prescriptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        record_id INTEGER,
+        medicine TEXT,
+        dosage TEXT,
+        usage TEXT,
+        FOREIGN KEY (record_id) REFERENCES medical_records (id)
+    )
+    ''')
+
+    # 药品表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS medicines (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        price REAL,
+        stock INTEGER DEFAULT 0,
+        unit TEXT DEFAULT '',
+        usage TEXT DEFAULT ''
+    )
+    ''')
+    _add_column_if_missing(conn, "medicines", "usage", "TEXT DEFAULT ''")
+    _add_column_if_missing(conn, "medicines", "price", "REAL")
+
+    # 收藏夹表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS favorite_folders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # 收藏处方表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS favorite_prescriptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        folder_id INTEGER,
+        record_id INTEGER,
+        patient_name TEXT,
+        prescription_data TEXT,  -- JSON格式存储处方数据
+        created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (folder_id) REFERENCES favorite_folders (id),
+        FOREIGN KEY (record_id) REFERENCES medical_records (id)
+    )
+    ''')
+
+# 全文索引：(索引表, 原表, 索引列)，使用外部内容表，不重复保存原文
+FULL_TEXT_INDEXES = [
+    ("patients_fts", "patients", ("name", "phone", "history")),
+    ("medical_records_fts", "medical_records", ("wang", "wen", "wen2", "qie", "diagnosis", "treatment")),
+]
+
+def _full_text_index(conn):
+    """创建trigram分词的FTS5全文索引及同步触发器，并用现有数据建立索引"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x, tokenize = 'trigram')")
+        conn.execute("DROP TABLE temp.fts5_probe")
+    except sqlite3.OperationalError as e:
+        # SQLite未编译FTS5或版本低于3.34（不支持trigram），搜索会退回LIKE
+        logger.warning("跳过全文索引: %s", e)
+        return
+
+    for fts, table, columns in FULL_TEXT_INDEXES:
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"new.{c}" for c in columns)
+        old_values = ", ".join(f"old.{c}" for c in columns)
+        conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {column_list}, content = '{table}', content_rowid = 'id', tokenize = 'trigram'
+        )
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        """)
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+def _backfill_name_pinyin(conn):
+    """为已有的患者和药品生成拼音索引（写入时用到第10版添加的 source 列）"""
+    from pinyin_index import sync_name_index
+    _add_column_if_missing(conn, "name_pinyin", "source", "TEXT")
+    count = sync_name_index(conn)
+    logger.info("已生成%d条拼音索引", count)
+
+def _dosage_columns(conn):
+    """为处方表添加剂量数量和单位列，并分批解析已有处方"""
+    from dosage import backfill
+    _add_column_if_missing(conn, "prescriptions", "dosage_qty", "REAL")
+    _add_column_if_missing(conn, "prescriptions", "dosage_unit", "TEXT")
+    count = backfill(conn)
+    logger.info("已解析%d条处方剂量", count)
+
+def _pinyin_source(conn):
+    """记录拼音索引的生成方式，已有索引按有无全拼推断，再按本机的生成方式更新过期的索引"""
+    from pinyin_index import sync_name_index, SOURCE_GB2312, SOURCE_PYPINYIN
+    _add_column_if_missing(conn, "name_pinyin", "source", "TEXT")
+    conn.execute(
+        "UPDATE name_pinyin SET source = CASE WHEN full = '' THEN ? ELSE ? END WHERE source IS NULL",
+        (SOURCE_GB2312, SOURCE_PYPINYIN)
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_name_pinyin_source ON name_pinyin (source)")
+    count = sync_name_index(conn)
+    logger.info("已更新%d条拼音索引", count)
+
+# 就诊数量汇总表：(表名, 键列, 由日期计算键的表达式模板)
+VISIT_ROLLUPS = [
+    ("visits_daily", "day", "{}"),
+    ("visits_monthly", "month", "strftime('%Y-%m', {})"),
+    ("visits_yearly", "year", "strftime('%Y', {})"),
+]
+
+def _visit_rollups(conn):
+    """创建每日/每月/每年就诊数汇总表和维护触发器，并用现有病历生成汇总"""
+    from rollups import rebuild_rollups
+    increments = []
+    decrements = []
+    for table, key, template in VISIT_ROLLUPS:
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            {key} TEXT PRIMARY KEY,
+            visits INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """)
+        new_key = template.format("new.date")
+        old_key = template.format("old.date")
+        increments.append(f"""
+            INSERT INTO {table} ({key}, visits) SELECT {new_key}, 1 WHERE {new_key} IS NOT NULL
+            ON CONFLICT ({key}) DO UPDATE SET visits = visits + 1;""")
+        decrements.append(f"""
+            UPDATE {table} SET visits = visits - 1 WHERE {key} = {old_key};
+            DELETE FROM {table} WHERE {key} = {old_key} AND visits <= 0;""")
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS visit_rollups_insert AFTER INSERT ON medical_records BEGIN
+        {"".join(increments)}
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS visit_rollups_delete AFTER DELETE ON medical_records BEGIN
+        {"".join(decrements)}
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS visit_rollups_update AFTER UPDATE OF date ON medical_records
+    WHEN old.date IS NOT new.date BEGIN
+        {"".join(decrements)}
+        {"".join(increments)}
+    END
+    """)
+    rebuild_rollups(conn)
+
+# 维护数据版本号的表（medical_records 在版本8中已添加），服务器据此生成ETag
+VERSIONED_TABLES = ["patients", "prescriptions", "medicines", "favorite_folders", "favorite_prescriptions"]
+
+def _table_versions(conn):
+    """为其余的表添加数据版本号和维护触发器"""
+    for table in VERSIONED_TABLES:
+        conn.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES (?, 0)", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS data_version_{table}_{event.lower()} AFTER {event} ON {table} BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = '{table}';
+            END
+            """)
+
+# 迁移列表：(版本号, 说明, 步骤)，步骤可以是SQL语句或接收连接的函数
+# 已发布的迁移不要修改，新的结构变更请追加新版本
+MIGRATIONS = [
+    (1, "基础表结构", [_base_schema]),
+    (2, "常用查询索引", [
+        # 按患者加载病历、导出时按患者分组并按日期排序
+        "CREATE INDEX IF NOT EXISTS idx_medical_records_patient_date ON medical_records (patient_id, date)",
+        # 病历列表按日期排序、按日期查询、统计图表
+        "CREATE INDEX IF NOT EXISTS idx_medical_records_date ON medical_records (date)",
+        # 按病历查询处方、处方与病历关联
+        "CREATE INDEX IF NOT EXISTS idx_prescriptions_record_id ON prescriptions (record_id)",
+        # 按药品统计处方
+        "CREATE INDEX IF NOT EXISTS idx_prescriptions_medicine ON prescriptions (medicine)",
+        # 按姓名和电话查找已有患者
+        "CREATE INDEX IF NOT EXISTS idx_patients_name_phone ON patients (name, phone)",
+        # 按药品名称查询库存
+        "CREATE INDEX IF NOT EXISTS idx_medicines_name ON medicines (name)",
+        # 按收藏夹加载收藏处方
+        "CREATE INDEX IF NOT EXISTS idx_favorite_prescriptions_folder ON favorite_prescriptions (folder_id, created_time)",
+    ]),
+    (3, "患者和病历全文索引", [_full_text_index]),
+    (4, "姓名和药品拼音索引", [
+        # 拼音在程序中计算（可选依赖pypinyin），新增和修改名称时由写入方同步更新
+        """
+        CREATE TABLE IF NOT EXISTS name_pinyin (
+            kind TEXT NOT NULL,       -- patient / medicine
+            ref_id INTEGER NOT NULL,  -- 患者或药品ID
+            name TEXT,                -- 生成索引时的名称，用于发现过期的索引
+            initials TEXT NOT NULL,   -- 拼音首字母，如 zs
+            full TEXT NOT NULL,       -- 全拼，如 zhangsan
+            PRIMARY KEY (kind, ref_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_name_pinyin_initials ON name_pinyin (kind, initials)",
+        "CREATE INDEX IF NOT EXISTS idx_name_pinyin_full ON name_pinyin (kind, full)",
+        # 删除时不需要计算拼音，直接用触发器清理
+        """
+        CREATE TRIGGER IF NOT EXISTS name_pinyin_patient_delete AFTER DELETE ON patients BEGIN
+            DELETE FROM name_pinyin WHERE kind = 'patient' AND ref_id = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS name_pinyin_medicine_delete AFTER DELETE ON medicines BEGIN
+            DELETE FROM name_pinyin WHERE kind = 'medicine' AND ref_id = old.id;
+        END
+        """,
+        _backfill_name_pinyin,
+    ]),
+    (5, "库存流水", [
+        """
+        CREATE TABLE IF NOT EXISTS stock_movements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            medicine_id INTEGER NOT NULL,
+            medicine TEXT,            -- 药品名称（药品删除后流水仍可查看）
+            change REAL NOT NULL,     -- 库存变化量，扣减为负数
+            stock_after REAL,         -- 变化后的库存
+            reason TEXT NOT NULL,     -- initial / dispense / adjust / reconcile
+            record_id INTEGER,        -- 开处方扣减时对应的病历
+            created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (medicine_id) REFERENCES medicines (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_stock_movements_medicine ON stock_movements (medicine_id, id)",
+        # 现有库存记为期初流水，使流水合计与库存一致
+        """
+        INSERT INTO stock_movements (medicine_id, medicine, change, stock_after, reason)
+        SELECT id, name, COALESCE(stock, 0), COALESCE(stock, 0), 'initial' FROM medicines
+        """,
+    ]),
+    (6, "处方剂量数量和单位", [_dosage_columns]),
+    (7, "就诊数量汇总表", [_visit_rollups]),
+    (8, "数据版本号", [
+        # 表数据每次变化时版本号加一，用于判断统计结果的缓存是否过期
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+        "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('medical_records', 0)",
+        """
+        CREATE TRIGGER IF NOT EXISTS data_version_records_insert AFTER INSERT ON medical_records BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'medical_records';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS data_version_records_delete AFTER DELETE ON medical_records BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'medical_records';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS data_version_records_update AFTER UPDATE ON medical_records BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'medical_records';
+        END
+        """,
+    ]),
+    (9, "全部表的数据版本号", [_table_versions]),
+    (10, "拼音索引的生成方式", [_pinyin_source]),
+]
+
+def latest_version():
+    """返回最新的迁移版本号"""
+    return max(version for version, _, _ in MIGRATIONS)
+
+def _ensure_version_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.commit()
+
+def current_version(conn):
+    """返回数据库当前已应用的最高版本号，未初始化时为0"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if not exists:
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def schema_fingerprint():
+    """根据全部迁移的版本、说明和步骤计算结构指纹（非零的31位整数，可存入 PRAGMA user_version）"""
+    parts = []
+    for version, description, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+        parts.append(f"{version}:{description}")
+        for step in steps:
+            parts.append(step.__name__ if callable(step) else " ".join(step.split()))
+    return zlib.crc32("\n".join(parts).encode("utf-8")) & 0x7FFFFFFF or 1
+
+def stored_fingerprint(conn):
+    """返回数据库中记录的结构指纹，新数据库为0"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def is_up_to_date(conn):
+    """数据库结构是否已是最新（只读取文件头，不加锁、不访问任何表）"""
+    return stored_fingerprint(conn) == schema_fingerprint()
+
+def migrate(conn):
+    """执行所有未应用的迁移，返回本次应用的版本号列表"""
+    if is_up_to_date(conn):
+        return []
+
+    applied = []
+    current = current_version(conn)
+    if current < latest_version():
+        _ensure_version_table(conn)
+        for version, description, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version <= current:
+                continue
+            # 每个迁移在单独的写事务中执行，多个终端同时启动时只有一个会真正执行
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                done = conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone()
+                if done:
+                    conn.rollback()
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+                conn.commit()
+            except BaseException:
+                # 迁移函数中的任何异常（包括 Ctrl+C）都不能留下未结束的写事务
+                conn.rollback()
+                raise
+            applied.append(version)
+            logger.info("已应用数据库迁移 %d: %s", version, description)
+
+    # 记录指纹，下次启动时直接跳过；旧数据库（已迁移但未记录指纹）只在这里写一次
+    conn.execute(f"PRAGMA user_version = {schema_fingerprint()}")
+    conn.commit()
+    return applied
@@ -1,7 +1,93 @@
 # patient.py
 import tkinter as tk
 from tkinter import ttk, messagebox
-from database import get_connection
+import config
+from virtual_list import KeysetPager, ListPager, VirtualTreeview
+import search
+import pinyin_index
+import autocomplete
+import inventory
+import db_executor
+from live_search import LiveSearch, is_text_refinement
+from dosage import parse_dosage, is_unmeasured, stock_quantity
+from repositories import PatientRepository, RecordRepository, MedicineRepository, open_repository, background_write
+from repositories import HISTORY_PREVIEW_LENGTH
+
+# 每次从数据库读取的患者行数
+PATIENT_PAGE_SIZE = 100
+# 新建患者时，停止输入多少毫秒后检查是否为已有患者
+EXISTING_PATIENT_DELAY = 500
+# 边输入边搜索时，匹配的患者不超过该数量就全部读入内存，继续输入时直接在结果中过滤
+LIVE_SEARCH_MEMORY_LIMIT = 2000
+
+def find_patient_history(conn, name, phone):
+    """查询同名同电话患者的病史，没有该患者时返回None"""
+    existing = open_repository(PatientRepository, conn).find_by_name_phone(name, phone)
+    return existing[1] if existing else None
+
+def get_patient_history(conn, patient_id):
+    """查询患者的完整病史"""
+    return open_repository(PatientRepository, conn).get_history(patient_id)
+
+def find_medicine(conn, name):
+    """按名称查找药品，返回 (id, 库存, 单位, 用法)，不存在时返回None"""
+    return open_repository(MedicineRepository, conn).get_by_name(name)
+
+def create_patient_pager(criteria=None):
+    """创建按ID分页的患者数据源，criteria为查询条件（见 PatientRepository），页在后台读取"""
+    def query(conn, method, *args):
+        return getattr(open_repository(PatientRepository, conn), method)(*args, criteria=criteria)
+    
+    def fetch_page(conn, after_id, limit):
+        # 病史只取前若干个字符，完整内容在编辑时再加载
+        return query(conn, "page", after_id, limit)
+    
+    return KeysetPager(fetch_page, lambda conn: query(conn, "count"),
+                       lambda conn, position: query(conn, "id_at", position), page_size=PATIENT_PAGE_SIZE)
+
+def live_search_patients(conn, criteria):
+    """边输入边搜索的查询，返回 (结果, 是否完整)
+
+    关键词搜索或匹配的患者不多时返回全部行，否则返回已读取第一页的 KeysetPager。
+    """
+    patients = open_repository(PatientRepository, conn)
+    filters = {field: criteria[field] for field in ("name", "phone", "age")}
+    if criteria["keyword"]:
+        rows = patients.search(criteria["keyword"], filters)
+        return rows, len(rows) < search.SEARCH_LIMIT
+    pager = create_patient_pager(filters)
+    # 在后台预先读取总数和第一页，显示时不再访问数据库（数据源尚未交给界面，可以直接保存）
+    pager.store(pager.load(conn, [0]))
+    if pager.total > LIVE_SEARCH_MEMORY_LIMIT:
+        return pager, False
+    return patients.list(filters), True
+
+def refine_patient_search(old, new):
+    """新条件是在旧条件上继续输入时，返回判断旧结果中的行是否仍然匹配的函数，否则返回None"""
+    if new["keyword"] != old["keyword"]:
+        return None
+    if old["age"] and new["age"] != old["age"]:
+        return None
+    for field in ("name", "phone"):
+        if not is_text_refinement(old[field], new[field]):
+            return None
+    if new["name"] != old["name"] and pinyin_index.is_pinyin_query(new["name"]):
+        # 拼音匹配无法在内存中判断
+        return None
+    
+    # 只需检查变化了的条件，旧结果已满足其余条件（LIKE和全文索引都不区分英文大小写）
+    checks = []
+    if new["name"] != old["name"]:
+        checks.append((1, new["name"].casefold()))
+    if new["phone"] != old["phone"]:
+        checks.append((4, new["phone"].casefold()))
+    age = new["age"] if new["age"] != old["age"] else None
+    
+    def matches(row):
+        if age is not None and str(row[3]) != age:
+            return False
+        return all(text in str(row[index] or "").casefold() for index, text in checks)
+    return matches
 
 class PatientManagementWindow:
     def __init__(self, master):
@@ -16,6 +102,16 @@ class PatientManagementWindow:
         # 创建患者列表区域
         self.create_patient_list()
         
+        # 输入查询条件时自动搜索（输入停顿后才查询）
+        self.live_search = LiveSearch(
+            self.tree, (self, "patients"), live_search_patients, self.show_search_results,
+            refine=refine_patient_search, on_error=self.show_query_error
+        )
+        self.live_search.bind(
+            [self.name_search, self.phone_search, self.age_search, self.keyword_search],
+            self.get_search_criteria
+        )
+        
         # 加载患者数据
         self.load_patients()
     
@@ -46,9 +142,15 @@ class PatientManagementWindow:
         self.age_search = ttk.Entry(search_frame, width=10, font=("微软雅黑", 10))
         self.age_search.grid(row=0, column=5, padx=5, pady=10)
 
+        # 关键词查询（姓名、手机号、病史全文检索）
+        ttk.Label(search_frame, text="关键词:", font=("微软雅黑", 10, "bold")).grid(row=0, column=6, padx=5, pady=10, sticky="e")
+        self.keyword_search = ttk.Entry(search_frame, width=20, font=("微软雅黑", 10))
+        self.keyword_search.grid(row=0, column=7, padx=5, pady=10)
+        self.keyword_search.bind("<Return>", lambda e: self.search_patients())
+
         # 查询按钮
         btn_frame = ttk.Frame(search_frame)
-        btn_frame.grid(row=0, column=6, columnspan=2, padx=5, pady=10)
+        btn_frame.grid(row=0, column=8, columnspan=2, padx=5, pady=10)
         
         ttk.Button(btn_frame, text="查询", command=self.search_patients).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="重置", command=self.reset_search).pack(side="left", padx=5)
@@ -83,13 +185,22 @@ class PatientManagementWindow:
         self.tree.column("export", width=70, anchor="center")
         
         # 添加滚动条
-        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar = ttk.Scrollbar(list_frame, orient="vertical")
+        
+        # 患者总数
+        self.total_label = ttk.Label(list_frame, text="", font=("微软雅黑", 9))
         
         # 布局
+        self.total_label.pack(side="bottom", anchor="e", padx=5)
         self.tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
+        # 虚拟列表：只在Treeview中保留可见的行，滚动时按需分页加载
+        self.virtual_list = VirtualTreeview(
+            self.tree, scrollbar, self.format_patient_row,
+            row_height=25, on_total_changed=self.update_total_label, on_error=self.show_query_error
+        )
+        
         # 配置样式以添加交替行颜色
         style = ttk.Style()
         # 定义样式，注意在ttk中需要使用配置方式
@@ -110,91 +221,57 @@ class PatientManagementWindow:
         # 绑定左键点击事件 - 仅选择行（不再自动跳转）
         self.tree.bind("<ButtonRelease-1>", self.on_tree_click)
 
-    def load_patients(self):
-        """加载患者数据到列表"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, gender, age, phone, history FROM patients")
-        patients = cursor.fetchall()
-        conn.close()
-        
-        # 清空现有数据
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # 添加数据
-        for index, patient in enumerate(patients):
-            # 确保病史字段不为None
-            patient_list = list(patient)
-            if patient_list[5] is None:  # 病史字段为None时设为空字符串
-                patient_list[5] = ""
-            # 添加操作按钮的文本（修改、删除和导出）
-            patient_with_action = tuple(patient_list) + ("修改", "删除", "导出")
-            item_id = self.tree.insert("", "end", values=patient_with_action)
-            # 根据行号设置交替颜色
-            if index % 2 == 0:
-                self.tree.item(item_id, tags=("evenrow",))
-            else:
-                self.tree.item(item_id, tags=("oddrow",))
-        
-        # 强制更新UI以确保样式生效
-        self.master.update_idletasks()
-
-    def search_patients(self):
-        """根据条件查询患者"""
-        name = self.name_search.get().strip()
-        phone = self.phone_search.get().strip()
-        age = self.age_search.get().strip()
+    def format_patient_row(self, patient):
+        """把患者数据行转换为列表显示的值"""
+        patient_list = list(patient)
+        # 确保病史字段不为None
+        if patient_list[5] is None:  # 病史字段为None时设为空字符串
+            patient_list[5] = ""
+        elif len(patient_list[5]) > HISTORY_PREVIEW_LENGTH and search.HIGHLIGHT_START not in patient_list[5]:
+            # 查询时多取了一个字符，超出说明病史被截断；关键词搜索的匹配片段原样显示
+            patient_list[5] = patient_list[5][:HISTORY_PREVIEW_LENGTH] + "..."
+        # 添加操作按钮的文本（修改、删除和导出）
+        return tuple(patient_list) + ("修改", "删除", "导出")
 
-        conn = get_connection()
-        cursor = conn.cursor()
+    def update_total_label(self, total):
+        """更新患者总数显示"""
+        self.total_label.config(text=f"共 {total} 位患者")
 
-        # 构建查询条件
-        conditions = []
-        params = []
+    def with_patient_history(self, patient_id, callback):
+        """在后台查询患者的完整病史，完成后调用 callback(病史)"""
+        db_executor.submit(self.tree, get_patient_history, patient_id, key=(self, "history"),
+                           on_done=callback, on_error=self.show_query_error)
 
-        if name:
-            conditions.append("name LIKE ?")
-            params.append(f"%{name}%")
+    def load_patients(self):
+        """加载患者数据到列表（数据变化后调用，有查询条件时重新查询）"""
+        self.live_search.invalidate()
+        criteria = self.get_search_criteria()
+        if any(criteria.values()):
+            self.live_search.search(criteria, force=True)
+        else:
+            self.virtual_list.set_pager(create_patient_pager(), keep_position=True)
 
-        if phone:
-            conditions.append("phone LIKE ?")
-            params.append(f"%{phone}%")
+    def get_search_criteria(self):
+        """返回查询表单中的条件"""
+        return {
+            "name": self.name_search.get().strip(),
+            "phone": self.phone_search.get().strip(),
+            "age": self.age_search.get().strip(),
+            "keyword": self.keyword_search.get().strip(),
+        }
 
-        if age:
-            conditions.append("age = ?")
-            params.append(age)
+    def search_patients(self):
+        """根据条件查询患者"""
+        self.live_search.search(self.get_search_criteria(), force=True)
 
-        if conditions:
-            query = f"SELECT id, name, gender, age, phone, history FROM patients WHERE {' AND '.join(conditions)}"
-        else:
-            query = "SELECT id, name, gender, age, phone, history FROM patients"
+    def show_search_results(self, results):
+        """显示查询结果（行列表或分页数据源），只更新有变化的行"""
+        pager = ListPager(results) if isinstance(results, list) else results
+        self.virtual_list.set_pager(pager)
 
-        cursor.execute(query, params)
-        patients = cursor.fetchall()
-        conn.close()
-        
-        # 清空现有数据
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # 添加查询结果
-        for index, patient in enumerate(patients):
-            # 确保病史字段不为None
-            patient_list = list(patient)
-            if patient_list[5] is None:  # 病史字段为None时设为空字符串
-                patient_list[5] = ""
-            # 添加操作按钮的文本（修改、删除和导出）
-            patient_with_action = tuple(patient_list) + ("修改", "删除", "导出")
-            item_id = self.tree.insert("", "end", values=patient_with_action)
-            # 根据行号设置交替颜色
-            if index % 2 == 0:
-                self.tree.item(item_id, tags=("evenrow",))
-            else:
-                self.tree.item(item_id, tags=("oddrow",))
-        
-        # 强制更新UI以确保样式生效
-        self.master.update_idletasks()
+    def show_query_error(self, error):
+        """显示查询失败的信息"""
+        messagebox.showerror("错误", f"查询患者失败: {error}")
 
     def on_tree_click(self, event):
         """处理树形视图点击事件"""
@@ -206,18 +283,21 @@ class PatientManagementWindow:
             # 选中该行
             self.tree.selection_set(row)
             
-            # 获取该行的数据
+            # 获取该行的数据（正在加载的占位行没有数据）
             values = self.tree.item(row, "values")
+            if not values or not values[0]:
+                return
             patient_id = values[0]
             patient_name = values[1]
             patient_gender = values[2]
             patient_age = values[3]
             patient_phone = values[4]
-            patient_history = values[5]
             
             # 根据点击的列执行相应操作
             if col == "#7":  # 修改列
-                self.open_edit_window(patient_id, patient_name, patient_gender, patient_age, patient_phone, patient_history)
+                # 列表中只有病史摘要，编辑时加载完整病史
+                self.with_patient_history(patient_id, lambda patient_history: self.open_edit_window(
+                    patient_id, patient_name, patient_gender, patient_age, patient_phone, patient_history))
             elif col == "#8":  # 删除列
                 self.delete_patient(patient_id)
             elif col == "#9":  # 导出列
@@ -231,15 +311,24 @@ class PatientManagementWindow:
         if item:
             self.tree.selection_set(item)
             values = self.tree.item(item, "values")
+            if not values or not values[0]:
+                return
             
-            # 将行数据转换为字符串格式（不包含操作列）
-            row_str = "\t".join([str(v) for v in values[:6]])  # 只复制前6列数据
-            self.master.clipboard_clear()  # 清空剪贴板
-            self.master.clipboard_append(row_str)  # 添加到剪贴板
-            messagebox.showinfo("提示", "已复制行信息到剪贴板")
+            # 将行数据转换为字符串格式（不包含操作列，病史使用完整内容）
+            self.with_patient_history(values[0], lambda history: self.copy_values(list(values[:5]) + [history]))
+    
+    def copy_values(self, row_values):
+        """把一行的值复制到剪贴板"""
+        row_str = "\t".join([str(v) for v in row_values])  # 只复制前6列数据
+        self.master.clipboard_clear()  # 清空剪贴板
+        self.master.clipboard_append(row_str)  # 添加到剪贴板
+        messagebox.showinfo("提示", "已复制行信息到剪贴板")
     
     def export_single_patient(self, patient_id):
         """导出单个患者的信息，包括病历和处方"""
+        if config.API_URL:
+            messagebox.showinfo("提示", "导出需要直接读取数据库，请在运行服务器的电脑上导出")
+            return
         from tkinter import filedialog
         
         # 选择保存路径
@@ -253,63 +342,13 @@ class PatientManagementWindow:
             return
         
         try:
+            # 一次性获取患者信息、病历和处方
+            from export_data import load_patient_records, write_txt_patient
+            patients = load_patient_records(patient_id, newest_first=True)
+            
             with open(file_path, 'w', encoding='utf-8-sig') as f:
-                # 获取患者信息
-                conn = get_connection()
-                cursor = conn.cursor()
-                
-                # 查询患者基本信息
-                cursor.execute("SELECT id, name, gender, age, phone, history FROM patients WHERE id = ?", (patient_id,))
-                patient = cursor.fetchone()
-                
-                if patient:
-                    f.write(f"患者ID: {patient[0]}\n")
-                    f.write(f"姓名: {patient[1]}\n")
-                    f.write(f"性别: {patient[2]}\n")
-                    f.write(f"年龄: {patient[3]}\n")
-                    f.write(f"电话: {patient[4]}\n")
-                    f.write(f"病史: {patient[5] if patient[5] else '无'}\n")
-                    f.write("-" * 50 + "\n")
-                    
-                    # 查询患者的病历信息
-                    cursor.execute("""
-                        SELECT id, date, wang, wen, wen2, qie, diagnosis, treatment
-                        FROM medical_records WHERE patient_id = ?
-                        ORDER BY date DESC
-                    """, (patient_id,))
-                    records = cursor.fetchall()
-                    
-                    if records:
-                        for record in records:
-                            f.write(f"  病历ID: {record[0]}\n")
-                            f.write(f"  日期: {record[1]}\n")
-                            f.write(f"  望诊: {record[2] if record[2] else '无'}\n")
-                            f.write(f"  闻诊: {record[3] if record[3] else '无'}\n")
-                            f.write(f"  问诊: {record[4] if record[4] else '无'}\n")
-                            f.write(f"  切诊: {record[5] if record[5] else '无'}\n")
-                            f.write(f"  诊断: {record[6] if record[6] else '无'}\n")
-                            f.write(f"  治疗方案: {record[7] if record[7] else '无'}\n")
-                            
-                            # 查询该病历的处方
-                            cursor.execute("""
-                                SELECT medicine, dosage, usage
-                                FROM prescriptions WHERE record_id = ?
-                            """, (record[0],))
-                            prescriptions = cursor.fetchall()
-                            
-                            if prescriptions:
-                                f.write("  处方:\n")
-                                for pres in prescriptions:
-                                    f.write(f"    - 药品: {pres[0]}, 剂量: {pres[1]}, 用法: {pres[2]}\n")
-                            else:
-                                f.write("  处方: 无\n")
-                            
-                            f.write("-" * 30 + "\n")
-                    else:
-                        f.write("  病历: 无\n")
-                        f.write("-" * 30 + "\n")
-                    
-                    conn.close()
+                if patients:
+                    write_txt_patient(f, patients[0])
                     
                 messagebox.showinfo("成功", f"患者信息已导出到 {file_path}")
         except Exception as e:
@@ -321,6 +360,8 @@ class PatientManagementWindow:
         if selection:
             item = selection[0]
             values = self.tree.item(item, "values")
+            if not values or not values[0]:
+                return
             
             patient_id = values[0]  # ID列的索引是0
             
@@ -334,6 +375,7 @@ class PatientManagementWindow:
         self.name_search.delete(0, tk.END)
         self.phone_search.delete(0, tk.END)
         self.age_search.delete(0, tk.END)
+        self.keyword_search.delete(0, tk.END)
         self.load_patients()
 
     def open_create_window(self):
@@ -343,19 +385,16 @@ class PatientManagementWindow:
     def delete_patient(self, patient_id):
         """删除患者"""
         if messagebox.askyesno("确认", "确定要删除该患者吗？"):
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            try:
-                cursor.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
-                conn.commit()
-                messagebox.showinfo("成功", "患者已删除")
-                # 重新加载患者列表
-                self.load_patients()
-            except Exception as e:
-                messagebox.showerror("错误", f"删除失败: {str(e)}")
-            finally:
-                conn.close()
+            # 删除在后台执行，完成后再提示并重新加载患者列表
+            db_executor.submit(self.tree, background_write, PatientRepository, "delete", patient_id,
+                               on_done=self.patient_deleted,
+                               on_error=lambda e: messagebox.showerror("错误", f"删除失败: {str(e)}"))
+
+    def patient_deleted(self, result):
+        """删除完成"""
+        messagebox.showinfo("成功", "患者已删除")
+        # 重新加载患者列表
+        self.load_patients()
 
     def show_action_menu(self, patient_id, patient_name, patient_gender, patient_age, patient_phone, patient_history):
         """显示操作菜单"""
@@ -389,8 +428,11 @@ class CreatePatientWindow:
         self.master.geometry("1200x700")  # 调整窗口尺寸
         self.master.resizable(True, True)
         
-        # 防抖变量
-        self.debounce_timer = None
+        # 输入姓名和电话时检查是否为已有患者（防抖，输入停顿后才查询）
+        self.existing_patient_check = autocomplete.Debouncer(
+            self.master, EXISTING_PATIENT_DELAY, self._perform_check_existing_patient
+        )
+        self.checked_patient = None
         
         # 创建主框架
         main_frame = ttk.Frame(self.master)
@@ -597,7 +639,9 @@ class CreatePatientWindow:
         btn_frame = ttk.Frame(main_frame)
         btn_frame.pack(pady=10)
         
-        ttk.Button(btn_frame, text="保存", command=self.save_patient_and_record).pack(side="left", padx=5)
+        # 保存在后台执行，完成前禁用保存按钮
+        self.save_button = ttk.Button(btn_frame, text="保存", command=self.save_patient_and_record)
+        self.save_button.pack(side="left", padx=5)
         ttk.Button(btn_frame, text="清空", command=self.clear_form).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="取消", command=self.master.destroy).pack(side="left", padx=5)
         
@@ -613,27 +657,28 @@ class CreatePatientWindow:
         self.setup_entry_undo(self.usage_entry)
     
     def on_medicine_selected(self, *args):
-        """当药品选择发生变化时，更新库存和用法显示"""
+        """当药品选择发生变化时，更新库存和用法显示（药品在后台查询）"""
         medicine_name = self.medicine_var.get().strip()
         if medicine_name:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT stock, unit, usage FROM medicines WHERE name = ?", (medicine_name,))
-            result = cursor.fetchone()
-            conn.close()
-            
-            if result:
-                stock, unit, usage = result
-                self.stock_label.config(text=f"库存: {stock}{unit}")
-                # 自动填充用法字段
-                if usage:
-                    self.usage_entry.delete(0, tk.END)
-                    self.usage_entry.insert(0, usage)
-            else:
-                self.stock_label.config(text="未找到药品")
+            db_executor.submit(self.stock_label, find_medicine, medicine_name, key=(self, "medicine"),
+                               on_done=self.show_medicine_stock,
+                               on_error=lambda e: self.stock_label.config(text="查询库存失败"))
         else:
+            db_executor.cancel((self, "medicine"))
             self.stock_label.config(text="")
     
+    def show_medicine_stock(self, result):
+        """显示药品的库存，并自动填充用法"""
+        if result:
+            _, stock, unit, usage = result
+            self.stock_label.config(text=f"库存: {stock}{unit}")
+            # 自动填充用法字段
+            if usage:
+                self.usage_entry.delete(0, tk.END)
+                self.usage_entry.insert(0, usage)
+        else:
+            self.stock_label.config(text="未找到药品")
+    
     def on_dosage_change(self, event):
         """当剂量发生变化时，更新库存显示"""
         self.on_medicine_selected()
@@ -814,38 +859,39 @@ class CreatePatientWindow:
     
     def load_medicines(self):
         """加载药品列表到下拉框"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM medicines")
-        medicines = cursor.fetchall()
-        conn.close()
-        
-        # 填充药品下拉框
-        medicine_names = [med[0] for med in medicines]
-        self.medicine_combo['values'] = medicine_names
+        # 候选来自共享的自动完成索引，药品新增或删除后索引失效，下次输入时重建
+        self.medicine_combo['values'] = autocomplete.get_medicine_index().complete("")
         
         # 设置自动完成
-        self.setup_autocomplete(self.medicine_combo, medicine_names)
+        self.setup_autocomplete(self.medicine_combo)
     
-    def setup_autocomplete(self, combobox, choices):
+    def setup_autocomplete(self, combobox):
         """设置下拉框的自动完成功能"""
-        def autocomplete(event):
-            if event.keysym not in ['Up', 'Down', 'Left', 'Right', 'Return', 'Tab']:
-                text = combobox.get().lower()
-                if text:
-                    # 查找匹配的选项
-                    matches = [choice for choice in choices if text in choice.lower()]
-                    if matches:
-                        # 设置下拉框的值为匹配项
-                        combobox['values'] = matches
-                        combobox.event_generate('<Down>')  # 显示下拉列表
-                else:
-                    # 如果输入为空，显示所有选项
-                    combobox['values'] = choices
+        def update_choices():
+            text = combobox.get()
+            # 匹配名称前缀、拼音首字母/全拼前缀，不足时再匹配名称中间的文字
+            matches = autocomplete.get_medicine_index().complete(text, autocomplete.AUTOCOMPLETE_LIMIT)
+            if list(combobox['values']) == matches:
+                return
+            combobox['values'] = matches
+            if text and matches:
+                combobox.event_generate('<Down>')  # 显示下拉列表
+        
+        debounced = autocomplete.Debouncer(combobox, autocomplete.AUTOCOMPLETE_DELAY, update_choices)
+        
+        def on_key_release(event):
+            if event.keysym not in ['Up', 'Down', 'Left', 'Right', 'Return', 'Tab', 'Escape']:
+                debounced()
+        
+        def on_focus_in(event):
+            # 重新获得焦点时刷新候选，包含其他窗口新增的药品
+            if not combobox.get():
+                combobox['values'] = autocomplete.get_medicine_index().complete("")
         
         # 绑定事件
-        combobox.bind('<KeyRelease>', autocomplete)
-        combobox.bind('<FocusIn>', lambda e: combobox['values'] == choices)
+        combobox.bind('<KeyRelease>', on_key_release)
+        combobox.bind('<FocusIn>', on_focus_in)
+        combobox.bind('<Destroy>', lambda e: debounced.cancel(), add="+")
     
     def add_medicine_to_list(self):
         """添加药品到处方列表"""
@@ -857,19 +903,26 @@ class CreatePatientWindow:
             messagebox.showerror("错误", "请选择药品")
             return
         
-        # 检查药品是否存在于药品表中
-        if not self.is_medicine_exists(medicine):
-            messagebox.showerror("错误", f"药品 '{medicine}' 不存在，请从已有药品中选择")
-            return
-        
         if not dosage:
             dosage = "适量"
         
         if not usage:
             usage = ""  # 如果没有输入用法，保存为空
         
+        # 在后台查询药品，确认药品存在且库存足够后再加入处方列表
+        db_executor.submit(self.prescription_tree, find_medicine, medicine, key=(self, "add_medicine"),
+                           on_done=lambda result: self.add_checked_medicine(medicine, dosage, usage, result),
+                           on_error=lambda e: messagebox.showerror("错误", f"查询药品失败: {str(e)}"))
+    
+    def add_checked_medicine(self, medicine, dosage, usage, result):
+        """药品查询完成后检查并加入处方列表，result 为 find_medicine 的结果"""
+        # 检查药品是否存在于药品表中
+        if not result:
+            messagebox.showerror("错误", f"药品 '{medicine}' 不存在，请从已有药品中选择")
+            return
+        
         # 检查库存是否足够
-        if not self.check_medicine_stock(medicine, dosage):
+        if not self.check_medicine_stock(medicine, dosage, result):
             return
         
         # 添加到列表
@@ -891,49 +944,29 @@ class CreatePatientWindow:
         self.dosage_entry.delete(0, tk.END)
         self.usage_entry.delete(0, tk.END)
     
-    def check_medicine_stock(self, medicine_name, dosage):
-        """检查药品库存是否足够"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # 查询药品库存信息
-            cursor.execute("SELECT stock, unit FROM medicines WHERE name = ?", (medicine_name,))
-            result = cursor.fetchone()
-            
-            if not result:
-                messagebox.showerror("错误", f"未找到药品 '{medicine_name}'")
-                return False
-            
-            stock, unit = result
-            
-            # 尝试解析剂量，提取数字部分
-            try:
-                # 提取剂量中的数字部分
-                dosage_number = float(''.join([c for c in dosage if c.isdigit() or c == '.']).strip())
-            except ValueError:
-                messagebox.showerror("错误", f"剂量格式不正确: {dosage}")
-                return False
-            
-            if dosage_number > stock:
-                messagebox.showerror("错误", f"库存不足！{medicine_name} 当前库存为 {stock}{unit}，请求 {dosage_number}{unit}")
-                return False
-            
+    def check_medicine_stock(self, medicine_name, dosage, medicine):
+        """检查药品库存是否足够，medicine 为 find_medicine 查到的药品"""
+        _, stock, unit, _ = medicine
+        
+        # 解析剂量中的数量，"适量"等不定量的剂量不检查库存
+        dosage_number, dosage_unit = parse_dosage(dosage)
+        if dosage_number is None:
+            if is_unmeasured(dosage):
+                return True
+            messagebox.showerror("错误", f"剂量格式不正确: {dosage}")
+            return False
+        
+        # 换算为库存单位，无法换算时保存处方但不扣减库存
+        dosage_number = stock_quantity(dosage_number, dosage_unit, unit)
+        if dosage_number is None:
+            messagebox.showwarning("警告", f"{medicine_name} 的库存单位为{unit}，剂量 {dosage} 无法换算，保存时不扣减库存")
             return True
-        finally:
-            conn.close()
-    
-    def is_medicine_exists(self, medicine_name):
-        """检查药品是否存在于药品表中"""
-        conn = get_connection()
-        cursor = conn.cursor()
         
-        try:
-            cursor.execute("SELECT COUNT(*) FROM medicines WHERE name = ?", (medicine_name,))
-            count = cursor.fetchone()[0]
-            return count > 0
-        finally:
-            conn.close()
+        if dosage_number > stock:
+            messagebox.showerror("错误", f"库存不足！{medicine_name} 当前库存为 {stock}{unit}，请求 {dosage_number}{unit}")
+            return False
+        
+        return True
     
     def save_patient_and_record(self):
         """保存患者、病历和处方信息"""
@@ -969,109 +1002,37 @@ class CreatePatientWindow:
             self.diagnosis_text.focus_set()  # 将焦点设置到诊断输入框
             return
         
-        conn = get_connection()
-        cursor = conn.cursor()
+        patient = {"name": name, "gender": gender, "age": age, "phone": phone, "history": history}
+        record = {"date": date, "wang": wang, "wen": wen, "wen2": wen2, "qie": qie,
+                  "diagnosis": diagnosis, "treatment": treatment}
+        items = [self.prescription_tree.item(item, "values") for item in self.prescription_tree.get_children()]
         
-        try:
-            # 检查是否已存在同名患者（姓名和电话都匹配）
-            cursor.execute("SELECT id, history FROM patients WHERE name = ? AND phone = ?", (name, phone))
-            existing = cursor.fetchone()
-            
-            if existing:
-                # 更新患者信息，但保留原有病史（如果新输入的病史为空）
-                patient_id = existing[0]
-                existing_history = existing[1] or ""
-                
-                # 如果新输入的病史为空，使用原有病史
-                if not history.strip():
-                    history = existing_history
-                
-                cursor.execute("""
-                    UPDATE patients SET gender = ?, age = ?, phone = ?, history = ?
-                    WHERE id = ?
-                """, (gender, age, phone, history, patient_id))
-                
-                messagebox.showinfo("成功", "患者信息已更新，病历信息已保存")
-            else:
-                # 新增患者
-                cursor.execute("""
-                    INSERT INTO patients (name, gender, age, phone, history)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (name, gender, age, phone, history))
-                patient_id = cursor.lastrowid
-                messagebox.showinfo("成功", "患者信息已保存")
-            
-            # 保存病历
-            cursor.execute("""
-                INSERT INTO medical_records (patient_id, date, wang, wen, wen2, qie, diagnosis, treatment)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (patient_id, date, wang, wen, wen2, qie, diagnosis, treatment))
-            
-            # 获取新插入的病历ID
-            record_id = cursor.lastrowid
-            
-            # 保存处方
-            prescriptions_to_update = []
-            for item in self.prescription_tree.get_children():
-                values = self.prescription_tree.item(item, "values")
-                medicine, dosage, usage = values
-                cursor.execute("""
-                    INSERT INTO prescriptions (record_id, medicine, dosage, usage)
-                    VALUES (?, ?, ?, ?)
-                """, (record_id, medicine, dosage, usage))
-                
-                # 记录需要更新库存的药品信息
-                prescriptions_to_update.append((medicine, dosage))
-            
-            conn.commit()
-            
-            # 提交处方信息后，再更新药品库存
-            for medicine, dosage in prescriptions_to_update:
-                self.update_medicine_stock(medicine, dosage)
-            
-            messagebox.showinfo("成功", "患者、病历和处方信息已保存")
-            
-            # 关闭窗口
-            self.master.destroy()
-            
-            # 刷新父窗口的患者列表
-            self.parent_window.load_patients()
-            
-        except Exception as e:
-            conn.rollback()
-            messagebox.showerror("错误", f"保存失败: {str(e)}")
-        finally:
-            conn.close()
+        # 同名同电话的患者已存在时更新其信息；库存不足时患者、病历和处方一起回滚。
+        # 写入在后台执行，完成前禁用保存按钮，避免重复保存
+        self.save_button.config(state="disabled")
+        db_executor.submit(self.master, background_write, RecordRepository, "add_visit", patient, record, items,
+                           on_done=self.record_saved, on_error=self.save_failed)
     
-    def update_medicine_stock(self, medicine_name, dosage):
-        """更新药品库存"""
-        try:
-            # 尝试解析剂量中的数字部分
-            dosage_number = float(''.join([c for c in dosage if c.isdigit() or c == '.']).strip())
-        except ValueError:
-            # 如果无法解析剂量，跳过库存更新
-            return
+    def record_saved(self, result):
+        """保存完成"""
+        # 处方使用次数变化，自动完成的排序需要更新
+        autocomplete.invalidate_medicine_index()
         
-        conn = get_connection()
-        cursor = conn.cursor()
+        messagebox.showinfo("成功", "患者、病历和处方信息已保存")
         
-        try:
-            # 获取当前库存
-            cursor.execute("SELECT stock FROM medicines WHERE name = ?", (medicine_name,))
-            result = cursor.fetchone()
-            
-            if result:
-                current_stock = result[0]
-                new_stock = max(0, current_stock - dosage_number)  # 防止库存变为负数
-                
-                # 更新库存
-                cursor.execute("UPDATE medicines SET stock = ? WHERE name = ?", (new_stock, medicine_name))
-                conn.commit()
-        except Exception as e:
-            # 发生错误时不中断主要流程
-            print(f"更新库存失败: {e}")
-        finally:
-            conn.close()
+        # 关闭窗口
+        self.master.destroy()
+        
+        # 刷新父窗口的患者列表
+        self.parent_window.load_patients()
+    
+    def save_failed(self, error):
+        """保存失败，所有修改已撤销"""
+        self.save_button.config(state="normal")
+        if isinstance(error, inventory.InsufficientStock):
+            messagebox.showerror("错误", f"{error}，未保存任何信息")
+        else:
+            messagebox.showerror("错误", f"保存失败: {str(error)}")
     
     def clear_form(self):
         """清空表单"""
@@ -1100,52 +1061,31 @@ class CreatePatientWindow:
             self.prescription_tree.delete(item)
     
     def check_existing_patient(self, event=None):
-        """检查是否已存在相同姓名和电话的患者"""
-        # 打印调试信息，确认事件被触发
-        print(f"check_existing_patient triggered. Name: '{self.name_entry.get().strip()}', Phone: '{self.phone_entry.get().strip()}'")
-        
-        # 直接执行检查，不再使用防抖
-        self._perform_check_existing_patient()
+        """检查是否已存在相同姓名和电话的患者（输入停顿后才查询）"""
+        self.existing_patient_check()
     
     def _perform_check_existing_patient(self):
-        """实际执行检查的方法"""
+        """实际执行检查的方法，查询在后台执行"""
         name = self.name_entry.get().strip()
         phone = self.phone_entry.get().strip()
         
-        print(f"_perform_check_existing_patient called. Name: '{name}', Phone: '{phone}'")
-        
-        # 只有当姓名和电话都填写完整时才检查
-        if name and phone:
-            conn = get_connection()
-            cursor = conn.cursor()
-            try:
-                cursor.execute("SELECT history FROM patients WHERE name = ? AND phone = ?", (name, phone))
-                existing = cursor.fetchone()
-                print(f"Database query result: {existing}")
-                
-                if existing and existing[0]:  # 如果找到了现有患者且有病史
-                    print(f"Found existing patient history: {existing[0][:50]}...")
-                    # 自动填充病史
-                    self.history_text.delete("1.0", tk.END)
-                    self.history_text.insert("1.0", existing[0])
-                    
-                    # 提示信息
-                    messagebox.showinfo("提示", "检测到该患者已存在，病史已自动填充")
-                else:
-                    print("No existing patient found or no history")
-                    # 如果没有找到现有患者，且病史文本框中有内容，询问是否清空
-                    current_history = self.history_text.get("1.0", "end").strip()
-                    if current_history:
-                        # 可以选择保留当前病史或清空
-                        pass  # 暂时不处理
-            except Exception as e:
-                print(f"查询患者信息时出错: {e}")
-            finally:
-                conn.close()
-        else:
-            print("Name or phone is empty, skipping query")
-            # 如果姓名或电话为空，不清空病史（可能用户正在输入）
-            pass
+        # 只有当姓名和电话都填写完整时才检查，同样的姓名和电话只提示一次
+        if not (name and phone) or (name, phone) == self.checked_patient:
+            db_executor.cancel((self, "existing_patient"))
+            return
+        db_executor.submit(self.history_text, find_patient_history, name, phone,
+                           key=(self, "existing_patient"),
+                           on_done=lambda history: self.fill_existing_history(name, phone, history))
+    
+    def fill_existing_history(self, name, phone, history):
+        """找到现有患者且有病史时自动填充病史"""
+        self.checked_patient = (name, phone)
+        if history:
+            self.history_text.delete("1.0", tk.END)
+            self.history_text.insert("1.0", history)
+            
+            # 提示信息
+            messagebox.showinfo("提示", "检测到该患者已存在，病史已自动填充")
 
 class EditPatientWindow:
     def __init__(self, master, parent_window, patient_id, patient_name, patient_gender, patient_age, patient_phone, patient_history):
@@ -1196,7 +1136,9 @@ class EditPatientWindow:
         btn_frame = ttk.Frame(form_frame)
         btn_frame.grid(row=2, column=0, columnspan=8, pady=5)
         
-        ttk.Button(btn_frame, text="保存", command=self.save_patient).pack(side="left", padx=5)
+        # 保存在后台执行，完成前禁用保存按钮
+        self.save_button = ttk.Button(btn_frame, text="保存", command=self.save_patient)
+        self.save_button.pack(side="left", padx=5)
         ttk.Button(btn_frame, text="清空", command=self.clear_form).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="取消", command=self.master.destroy).pack(side="left", padx=5)
     
@@ -1227,24 +1169,23 @@ class EditPatientWindow:
             self.phone_entry.focus_set()  # 将焦点设置到电话输入框
             return
 
-        conn = get_connection()
-        cursor = conn.cursor()
+        # 更新患者信息（在后台执行）
+        self.save_button.config(state="disabled")
+        db_executor.submit(self.master, background_write, PatientRepository, "update",
+                           self.patient_id, name, gender, age, phone, history,
+                           on_done=self.patient_saved, on_error=self.save_failed)
 
-        try:
-            # 更新患者信息
-            cursor.execute("""
-                UPDATE patients SET name = ?, gender = ?, age = ?, phone = ?, history = ?
-                WHERE id = ?
-            """, (name, gender, age, phone, history, self.patient_id))
-            conn.commit()
-            messagebox.showinfo("成功", "患者信息已更新")
-            
-            # 关闭窗口
-            self.master.destroy()
-            
-            # 刷新父窗口的患者列表
-            self.parent_window.load_patients()
-        except Exception as e:
-            messagebox.showerror("错误", f"更新失败: {str(e)}")
-        finally:
-            conn.close()
+    def patient_saved(self, result):
+        """更新完成"""
+        messagebox.showinfo("成功", "患者信息已更新")
+        
+        # 关闭窗口
+        self.master.destroy()
+        
+        # 刷新父窗口的患者列表
+        self.parent_window.load_patients()
+
+    def save_failed(self, error):
+        """更新失败"""
+        self.save_button.config(state="normal")
+        messagebox.showerror("错误", f"更新失败: {str(error)}")
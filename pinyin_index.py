@@ -0,0 +1,190 @@
+# pinyin_index.py
+# 拼音索引：为患者姓名和药品名称预先计算拼音首字母和全拼，保存在 name_pinyin 表中，
+# 输入"zs"可以找到"张三"，输入"hq"或"huangqi"可以找到"黄芪"，按前缀范围查询走索引。
+# 每行记录生成方式（source），安装pypinyin之前生成的只有首字母的索引在启动时重新生成（见 refresh_stale_index）
+import importlib.util
+import logging
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+# pypinyin导入时要加载拼音字典，第一次计算拼音时才导入（见 _load_pypinyin）
+_pypinyin = None
+
+# 索引的名称类别：类别 -> (原表, 名称列)
+KINDS = {
+    "patient": ("patients", "name"),
+    "medicine": ("medicines", "name"),
+}
+
+# 前缀查询默认返回的条数
+LOOKUP_LIMIT = 50
+
+# 拼音的生成方式，按效果从差到好排列：gb2312 只有一级汉字的首字母，pypinyin 有首字母和全拼
+SOURCE_GB2312 = "gb2312"
+SOURCE_PYPINYIN = "pypinyin"
+SOURCES = (SOURCE_GB2312, SOURCE_PYPINYIN)
+
+# GB2312一级汉字按拼音排序，每个首字母对应的起始编码
+_GB2312_INITIALS = [
+    (0xB0A1, "a"), (0xB0C5, "b"), (0xB2C1, "c"), (0xB4EE, "d"), (0xB6EA, "e"),
+    (0xB7A2, "f"), (0xB8C1, "g"), (0xB9FE, "h"), (0xBBF7, "j"), (0xBFA6, "k"),
+    (0xC0AC, "l"), (0xC2E8, "m"), (0xC4C3, "n"), (0xC5B6, "o"), (0xC5BE, "p"),
+    (0xC6DA, "q"), (0xC8BB, "r"), (0xC8F6, "s"), (0xCBFA, "t"), (0xCDDA, "w"),
+    (0xCEF4, "x"), (0xD1B9, "y"), (0xD4D1, "z"),
+]
+_GB2312_LEVEL1_END = 0xD7F9
+
+def _gb2312_initial(char):
+    """根据GB2312编码返回汉字的拼音首字母，二级汉字和其他字符返回空字符串"""
+    if char.isascii():
+        return char.lower() if char.isalnum() else ""
+    try:
+        encoded = char.encode("gb2312")
+    except UnicodeEncodeError:
+        return ""
+    if len(encoded) != 2:
+        return ""
+    code = (encoded[0] << 8) + encoded[1]
+    if code < _GB2312_INITIALS[0][0] or code > _GB2312_LEVEL1_END:
+        return ""
+    initial = ""
+    for start, letter in _GB2312_INITIALS:
+        if code < start:
+            break
+        initial = letter
+    return initial
+
+def _load_pypinyin():
+    """导入pypinyin，未安装时返回False"""
+    global _pypinyin
+    if _pypinyin is None:
+        try:
+            import pypinyin
+            _pypinyin = pypinyin
+        except ImportError:
+            # 没有安装pypinyin时只能根据GB2312编码得到一级汉字的首字母，不支持全拼
+            _pypinyin = False
+    return _pypinyin
+
+def current_source():
+    """本机生成拼音的方式（只检查pypinyin是否已安装，不导入）"""
+    if _pypinyin is None:
+        available = importlib.util.find_spec("pypinyin") is not None
+    else:
+        available = bool(_pypinyin)
+    return SOURCE_PYPINYIN if available else SOURCE_GB2312
+
+def _worse_sources(source):
+    """比 source 效果差、需要重新生成的生成方式"""
+    return SOURCES[:SOURCES.index(source)]
+
+def to_pinyin(name):
+    """返回名称的 (首字母, 全拼)，都为小写且不含分隔符，没有pypinyin时全拼为空字符串"""
+    name = name or ""
+    pypinyin = _load_pypinyin()
+    if not pypinyin:
+        return "".join(_gb2312_initial(c) for c in name), ""
+    syllables = [s.lower() for s in pypinyin.lazy_pinyin(name, style=pypinyin.Style.NORMAL)]
+    syllables = ["".join(c for c in s if c.isalnum()) for s in syllables]
+    syllables = [s for s in syllables if s]
+    initials = "".join(s[0] for s in syllables)
+    return initials, "".join(syllables)
+
+def is_pinyin_query(text):
+    """输入是否为拼音（只包含英文字母）"""
+    return bool(text) and text.isascii() and text.isalpha()
+
+def _prefix_range(prefix):
+    """前缀查询的范围 [lower, upper)，可以使用B树索引"""
+    prefix = prefix.lower()
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def update_name_index(conn, kind, ref_id, name):
+    """新增或修改名称后更新拼音索引，与名称的写入在同一事务中执行"""
+    initials, full = to_pinyin(name)
+    source = SOURCE_PYPINYIN if _load_pypinyin() else SOURCE_GB2312
+    conn.execute(
+        "INSERT OR REPLACE INTO name_pinyin (kind, ref_id, name, initials, full, source) VALUES (?, ?, ?, ?, ?, ?)",
+        (kind, ref_id, name, initials, full, source)
+    )
+
+def sync_name_index(conn, kind=None):
+    """补全缺失或过期的拼音索引（名称在其他地方被修改，或由比本机差的方式生成），返回更新的条数"""
+    worse = _worse_sources(current_source())
+    stale = f" OR n.source IN ({', '.join('?' * len(worse))})" if worse else ""
+    updated = 0
+    for index_kind, (table, column) in KINDS.items():
+        if kind is not None and index_kind != kind:
+            continue
+        rows = conn.execute(f"""
+            SELECT t.id, t.{column} FROM {table} t
+            LEFT JOIN name_pinyin n ON n.kind = ? AND n.ref_id = t.id
+            WHERE n.name IS NOT t.{column}{stale}
+        """, (index_kind,) + worse).fetchall()
+        for ref_id, name in rows:
+            update_name_index(conn, index_kind, ref_id, name)
+        updated += len(rows)
+    return updated
+
+def refresh_stale_index(conn):
+    """启动时调用：本机的生成方式比已有索引好（例如后来安装了pypinyin）时重新生成这些索引，返回更新的条数
+
+    本机没有pypinyin时不访问数据库；有pypinyin时只按 source 索引查一行，没有过期的索引就直接返回。
+    """
+    worse = _worse_sources(current_source())
+    if not worse:
+        return 0
+    exists = conn.execute(
+        f"SELECT 1 FROM name_pinyin WHERE source IN ({', '.join('?' * len(worse))}) LIMIT 1", worse
+    ).fetchone()
+    if not exists:
+        return 0
+    # 已安装但无法导入时不重新生成，否则每次启动都会重复一遍
+    if not _load_pypinyin():
+        return 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        count = sync_name_index(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    logger.info("已重新生成%d条拼音索引", count)
+    return count
+
+def prefix_condition(kind, id_column, prefix):
+    """生成按拼音前缀过滤的条件，返回 (条件, 参数列表)，id_column 为原表主键列"""
+    lower, upper = _prefix_range(prefix)
+    condition = f"""{id_column} IN (
+        SELECT ref_id FROM name_pinyin WHERE kind = ? AND initials >= ? AND initials < ?
+        UNION
+        SELECT ref_id FROM name_pinyin WHERE kind = ? AND full >= ? AND full < ?
+    )"""
+    return condition, [kind, lower, upper, kind, lower, upper]
+
+def lookup(kind, prefix, limit=LOOKUP_LIMIT):
+    """按拼音首字母或全拼前缀查找名称，返回 [(id, 名称), ...]
+
+    依次查找首字母完全相同、首字母前缀匹配、全拼前缀匹配的名称，
+    每次查询都是带LIMIT的索引范围扫描，不需要对所有匹配结果排序。
+    """
+    if not is_pinyin_query(prefix):
+        return []
+    lower, upper = _prefix_range(prefix)
+    queries = [
+        ("SELECT ref_id, name FROM name_pinyin WHERE kind = ? AND initials = ? LIMIT ?", (kind, lower)),
+        ("SELECT ref_id, name FROM name_pinyin WHERE kind = ? AND initials >= ? AND initials < ? ORDER BY initials LIMIT ?", (kind, lower, upper)),
+        ("SELECT ref_id, name FROM name_pinyin WHERE kind = ? AND full >= ? AND full < ? ORDER BY full LIMIT ?", (kind, lower, upper)),
+    ]
+    results = {}
+    conn = get_connection()
+    try:
+        for sql, params in queries:
+            for ref_id, name in conn.execute(sql, params + (limit,)):
+                results.setdefault(ref_id, name)
+            if len(results) >= limit:
+                break
+    finally:
+        conn.close()
+    return list(results.items())[:limit]
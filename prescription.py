@@ -1,7 +1,21 @@
 # prescription.py
 import tkinter as tk
 from tkinter import ttk, messagebox
-from database import get_connection
+import db_executor
+from tree_binding import TreeBinding
+from repositories import PrescriptionRepository, open_repository
+
+def query_prescriptions(conn, record_id=None):
+    """查询处方列表，指定病历时只查询该病历的处方，按就诊日期降序排列（最后一列为处方ID）"""
+    return open_repository(PrescriptionRepository, conn).list(record_id)
+
+def find_prescriptions(conn, patient_name="", record_id="", date=""):
+    """按患者姓名、病历ID和日期查询处方"""
+    return open_repository(PrescriptionRepository, conn).find(patient_name, record_id, date)
+
+def record_prescriptions(conn, record_id):
+    """查询病历的全部处方，返回 (药品, 剂量, 用法) 列表"""
+    return open_repository(PrescriptionRepository, conn).for_record(record_id)
 
 class PrescriptionWindow:
     def __init__(self, master, record_id=None):
@@ -100,51 +114,17 @@ class PrescriptionWindow:
         style.configure("Treeview.OddRow", background="white", foreground="black")
         style.configure("Treeview.Heading", font=("微软雅黑", 10, "bold"), background="#2c3e50", foreground="white")
         
+        # 按处方ID绑定数据（同一病历有多条处方，病历ID不能作为主键）
+        self.binding = TreeBinding(self.prescription_tree, self.format_prescription_row,
+                                   key=lambda pres: pres[6], striped=False)
+        
         # 绑定右键事件 - 复制行信息到剪贴板
         self.prescription_tree.bind("<Button-3>", self.copy_row_to_clipboard)
 
     def load_prescription(self):
-        """加载处方数据"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # 如果有特定病历ID，则只加载该病历的处方
-        if self.record_id:
-            cursor.execute("""
-                SELECT p.record_id, p.medicine, p.dosage, p.usage, mr.date, pt.name
-                FROM prescriptions p
-                JOIN medical_records mr ON p.record_id = mr.id
-                JOIN patients pt ON mr.patient_id = pt.id
-                WHERE p.record_id = ?
-                ORDER BY mr.date DESC
-            """, (self.record_id,))
-        else:
-            cursor.execute("""
-                SELECT p.record_id, p.medicine, p.dosage, p.usage, mr.date, pt.name
-                FROM prescriptions p
-                JOIN medical_records mr ON p.record_id = mr.id
-                JOIN patients pt ON mr.patient_id = pt.id
-                ORDER BY mr.date DESC
-            """)
-        
-        prescriptions = cursor.fetchall()
-        conn.close()
-        
-        # 清空现有数据
-        for item in self.prescription_tree.get_children():
-            self.prescription_tree.delete(item)
-        
-        # 添加数据 - 注意顺序：record_id, patient_name, date, medicine, dosage, usage
-        for pres in prescriptions:
-            # 重新组织数据以匹配列标题顺序
-            record_id = pres[0]
-            medicine = pres[1]
-            dosage = pres[2]
-            usage = pres[3]
-            date = pres[4]
-            patient_name = pres[5]
-            
-            self.prescription_tree.insert("", "end", values=(record_id, patient_name, date, medicine, dosage, usage))
+        """加载处方数据（在后台查询，完成后显示）"""
+        db_executor.submit(self.prescription_tree, query_prescriptions, self.record_id,
+                           key=(self, "prescriptions"), on_done=self.show_prescriptions, on_error=self.show_query_error)
     
     def search_prescriptions(self):
         """根据条件查询处方"""
@@ -152,56 +132,22 @@ class PrescriptionWindow:
         record_id = self.record_id_search.get().strip()
         date = self.date_search.get().strip()
 
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        # 构建查询条件
-        conditions = []
-        params = []
+        # 新的查询会取消尚未完成的旧查询
+        db_executor.submit(self.prescription_tree, find_prescriptions, patient_name, record_id, date,
+                           key=(self, "prescriptions"), on_done=self.show_prescriptions, on_error=self.show_query_error)
 
-        if patient_name:
-            conditions.append("pt.name LIKE ?")
-            params.append(f"%{patient_name}%")
+    def format_prescription_row(self, pres):
+        """把处方数据行转换为列表显示的值，顺序：record_id, patient_name, date, medicine, dosage, usage"""
+        record_id, medicine, dosage, usage, date, patient_name = pres[:6]
+        return (record_id, patient_name, date, medicine, dosage, usage)
 
-        if record_id:
-            conditions.append("p.record_id = ?")
-            params.append(record_id)
+    def show_prescriptions(self, prescriptions):
+        """把查询结果显示到处方列表，只更新有变化的行"""
+        self.binding.update(prescriptions)
 
-        if date:
-            conditions.append("mr.date = ?")
-            params.append(date)
-
-        query = """
-            SELECT p.record_id, p.medicine, p.dosage, p.usage, mr.date, pt.name
-            FROM prescriptions p
-            JOIN medical_records mr ON p.record_id = mr.id
-            JOIN patients pt ON mr.patient_id = pt.id
-        """
-        
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-
-        query += " ORDER BY mr.date DESC"
-
-        cursor.execute(query, params)
-        prescriptions = cursor.fetchall()
-        conn.close()
-        
-        # 清空现有数据
-        for item in self.prescription_tree.get_children():
-            self.prescription_tree.delete(item)
-        
-        # 添加查询结果 - 注意顺序：record_id, patient_name, date, medicine, dosage, usage
-        for pres in prescriptions:
-            # 重新组织数据以匹配列标题顺序
-            record_id = pres[0]
-            medicine = pres[1]
-            dosage = pres[2]
-            usage = pres[3]
-            date = pres[4]
-            patient_name = pres[5]
-            
-            self.prescription_tree.insert("", "end", values=(record_id, patient_name, date, medicine, dosage, usage))
+    def show_query_error(self, error):
+        """显示查询失败的信息"""
+        messagebox.showerror("错误", f"查询处方失败: {error}")
 
     def reset_search(self):
         """重置查询条件"""
@@ -238,17 +184,14 @@ class PrescriptionWindow:
         patient_name = item_values[1]
         selected_medicine = item_values[3]  # 选中的药品名称
         
-        # 获取该病历的所有处方信息（不只是选中的那一个）
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT p.medicine, p.dosage, p.usage
-            FROM prescriptions p
-            WHERE p.record_id = ?
-        """, (record_id,))
-        prescriptions = cursor.fetchall()
-        conn.close()
-        
+        # 在后台获取该病历的所有处方信息（不只是选中的那一个）
+        db_executor.submit(self.prescription_tree, record_prescriptions, record_id, key=(self, "favorite"),
+                           on_done=lambda prescriptions: self.confirm_favorite(
+                               record_id, patient_name, selected_medicine, prescriptions),
+                           on_error=lambda e: messagebox.showerror("错误", f"查询处方失败: {str(e)}"))
+
+    def confirm_favorite(self, record_id, patient_name, selected_medicine, prescriptions):
+        """确认后打开收藏对话框，prescriptions 为该病历的全部处方"""
         if not prescriptions:
             messagebox.showwarning("警告", "未找到相关处方信息")
             return
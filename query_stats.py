@@ -0,0 +1,298 @@
+# query_stats.py
+# SQL执行统计和慢查询日志：连接池中的连接（见 database.InstrumentedConnection）执行的每条语句
+# 都按SQL文本累计次数、耗时（含读取结果的时间）、返回行数、出错次数和调用位置；
+# 单次耗时超过 config.DB_SLOW_QUERY_MS 的语句写入滚动的慢查询日志，并附上执行计划（EXPLAIN QUERY PLAN）。
+# 诊断窗口（见 diagnostics.py）和服务器的 /api/metrics 按总耗时列出最耗时的语句。
+#
+# 调用位置为调用栈上第一个不属于数据访问层的函数，例如 PatientManagementWindow.load_patients；
+# 后台执行器、写队列和服务器会把提交请求的位置带到执行查询的线程（见 call_context）。
+import functools
+import logging
+import re
+import sqlite3
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from time import perf_counter
+import config
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("query_stats.slow")
+
+# 查找调用位置时跳过的模块（数据访问层和标准库中转发调用的模块）
+INTERNAL_MODULES = {
+    __name__, "database", "db_executor", "write_queue", "repositories", "search", "pinyin_index", "inventory",
+    "dosage", "api_client", "live_search", "virtual_list", "tree_binding",
+    "threading", "concurrent.futures.thread", "contextlib", "functools",
+}
+
+# 最多统计的不同语句数，超出后新的语句合并计入一项，避免拼接出的SQL无限增长
+MAX_STATEMENTS = 1000
+OTHER_STATEMENTS = "（其他语句）"
+
+# 每条语句保留的调用位置数
+MAX_SITES = 20
+
+# 需要查看执行计划的语句
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_statements = {}            # SQL -> 统计
+_plans = {}                 # SQL -> 执行计划（慢查询时记录）
+_lock = threading.RLock()   # 可重入：游标释放时（Execution.__del__）可能正好在持有锁的代码中
+_context = threading.local()
+_slow_log_ready = False
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize(sql):
+    """合并空白，作为统计的键"""
+    return re.sub(r"\s+", " ", sql).strip()
+
+@contextmanager
+def call_context(site):
+    """在其中执行的语句都记为 site 发起的（把调用位置带到执行查询的线程）"""
+    previous = getattr(_context, "site", None)
+    _context.site = site
+    try:
+        yield
+    finally:
+        _context.site = previous
+
+def call_site():
+    """当前语句的调用位置：call_context 设置的位置，否则为调用栈上第一个不属于数据访问层的函数"""
+    site = getattr(_context, "site", None)
+    if site:
+        return site
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module not in INTERNAL_MODULES:
+            name = getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+            return name if "." in name else f"{module}.{name}"
+        frame = frame.f_back
+    return threading.current_thread().name
+
+def _entry(sql):
+    """取得语句的统计项（需持有 _lock）"""
+    entry = _statements.get(sql)
+    if entry is None:
+        if len(_statements) >= MAX_STATEMENTS:
+            sql = OTHER_STATEMENTS
+            entry = _statements.get(sql)
+        if entry is None:
+            entry = _statements[sql] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "errors": 0,
+                                        "sites": Counter(), "params": ()}
+    return entry
+
+def _slow_log():
+    """第一次记录慢查询时再打开日志文件"""
+    global _slow_log_ready
+    if not _slow_log_ready:
+        with _lock:
+            if not _slow_log_ready:
+                handler = RotatingFileHandler(config.DB_SLOW_QUERY_LOG, maxBytes=config.DB_SLOW_QUERY_LOG_BYTES,
+                                              backupCount=config.DB_SLOW_QUERY_LOG_BACKUPS, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                slow_logger.addHandler(handler)
+                slow_logger.setLevel(logging.INFO)
+                slow_logger.propagate = False
+                _slow_log_ready = True
+    return slow_logger
+
+def explain(conn, sql, params=()):
+    """返回语句的执行计划，每行按层级缩进，例如 ["SEARCH patients USING INDEX ..."]"""
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    # 直接调用基类方法，执行计划本身不计入统计
+    rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+class Execution:
+    """一次语句执行，读取结果的时间和行数也计入这次执行
+
+    读取结果时只累加在本对象上，结果读完或不再使用时（游标执行下一条语句或被释放）才计入统计，
+    逐行读取时不用每行都加锁。
+    """
+
+    __slots__ = ("sql", "params", "site", "elapsed_ms", "logged", "pending_ms", "pending_rows")
+
+    def __init__(self, sql, params, site):
+        self.sql = sql
+        self.params = params
+        self.site = site
+        self.elapsed_ms = 0.0
+        self.logged = False
+        self.pending_ms = 0.0
+        self.pending_rows = 0
+
+    def started(self, elapsed_ms, conn, error=False):
+        """语句执行完第一步（或出错）"""
+        self.elapsed_ms = elapsed_ms
+        with _lock:
+            entry = _entry(self.sql)
+            entry["calls"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["params"] = self.params
+            if error:
+                entry["errors"] += 1
+            if len(entry["sites"]) < MAX_SITES or self.site in entry["sites"]:
+                entry["sites"][self.site] += 1
+        self._check_slow(conn)
+
+    def fetched(self, elapsed_ms, rows, conn):
+        """读取了 rows 行结果"""
+        self.elapsed_ms += elapsed_ms
+        self.pending_ms += elapsed_ms
+        self.pending_rows += rows
+        self._check_slow(conn)
+
+    def flush(self):
+        """把读取结果的时间和行数计入统计"""
+        if not self.pending_ms and not self.pending_rows:
+            return
+        with _lock:
+            entry = _entry(self.sql)
+            entry["total_ms"] += self.pending_ms
+            entry["rows"] += self.pending_rows
+            entry["max_ms"] = max(entry["max_ms"], self.elapsed_ms)
+        self.pending_ms = 0.0
+        self.pending_rows = 0
+
+    def __del__(self):
+        self.flush()
+
+    def _check_slow(self, conn):
+        if self.logged or self.elapsed_ms < config.DB_SLOW_QUERY_MS:
+            return
+        # 每次执行只记录一次（读取结果期间超过阈值时立即记录，不等结果读完）
+        self.logged = True
+        plan = None
+        if config.DB_SLOW_QUERY_EXPLAIN:
+            try:
+                plan = explain(conn, self.sql, self.params)
+            except sqlite3.Error as e:
+                plan = [f"（无法获取执行计划: {e}）"]
+            with _lock:
+                _plans[self.sql] = plan
+        message = [f"慢查询 {self.elapsed_ms:.1f} ms，调用位置 {self.site}", f"  SQL: {self.sql}"]
+        if config.DB_SLOW_QUERY_PARAMS:
+            message.append(f"  参数: {self.params!r:.500}")
+        if plan:
+            message.append("  执行计划:")
+            message.extend("    " + line for line in plan)
+        try:
+            _slow_log().info("\n".join(message))
+        except OSError as e:
+            logger.warning("无法写入慢查询日志: %s", e)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """记录执行和读取耗时的游标"""
+
+    _execution = None
+
+    def execute(self, sql, parameters=()):
+        execution = self._execution = Execution(normalize(sql), parameters, call_site())
+        started = perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except sqlite3.Error:
+            execution.started((perf_counter() - started) * 1000, self.connection, error=True)
+            raise
+        execution.started((perf_counter() - started) * 1000, self.connection)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        execution = self._execution = Execution(normalize(sql), (), call_site())
+        started = perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except sqlite3.Error:
+            execution.started((perf_counter() - started) * 1000, self.connection, error=True)
+            raise
+        execution.started((perf_counter() - started) * 1000, self.connection)
+        if self.rowcount > 0:
+            execution.fetched(0.0, self.rowcount, self.connection)
+        return self
+
+    def _fetched(self, started, rows, finished):
+        execution = self._execution
+        if execution is not None:
+            execution.fetched((perf_counter() - started) * 1000, rows, self.connection)
+            if finished:
+                execution.flush()
+
+    def fetchone(self):
+        started = perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(started, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        # 逐行读取是最频繁的调用，不经过 _fetched
+        started = perf_counter()
+        row = sqlite3.Cursor.fetchone(self)
+        execution = self._execution
+        if execution is not None:
+            elapsed_ms = (perf_counter() - started) * 1000
+            execution.elapsed_ms += elapsed_ms
+            execution.pending_ms += elapsed_ms
+            if row is None:
+                execution.flush()
+            else:
+                execution.pending_rows += 1
+            if not execution.logged and execution.elapsed_ms >= config.DB_SLOW_QUERY_MS:
+                execution._check_slow(self.connection)
+        if row is None:
+            raise StopIteration
+        return row
+
+
+def top_statements(limit=50, key="total_ms"):
+    """按 key（total_ms / max_ms / calls / rows）从大到小返回语句统计"""
+    with _lock:
+        items = [(sql, dict(entry, sites=entry["sites"].most_common(5)), _plans.get(sql))
+                 for sql, entry in _statements.items()]
+    items.sort(key=lambda item: item[1][key], reverse=True)
+    result = []
+    for sql, entry, plan in items[:limit]:
+        entry.pop("params")
+        entry["sql"] = sql
+        entry["avg_ms"] = entry["total_ms"] / entry["calls"] if entry["calls"] else 0.0
+        entry["plan"] = plan
+        result.append(entry)
+    return result
+
+def statement_params(sql):
+    """语句最近一次执行的参数（查看执行计划时使用）"""
+    with _lock:
+        entry = _statements.get(sql)
+        return entry["params"] if entry else ()
+
+def reset():
+    """清空统计"""
+    with _lock:
+        _statements.clear()
+        _plans.clear()
@@ -0,0 +1,499 @@
+# repositories.py
+# 数据访问层：患者、病历、处方、药品和收藏的SQL都集中在对应的仓库类中，
+# 界面、后台执行器、导出和性能测试使用同一套查询，优化一处即可。
+# 仓库不管理连接和事务：构造时传入连接，写操作由调用方提交或回滚（例如 database.transaction()）；
+# 写操作交给写队列（见 write_queue.py），与其他写操作合并提交：窗口把 background_write() 提交到
+# 后台执行器（见 db_executor.py），等待写入时界面不会停止响应；不在界面线程中的代码可以直接调用 run_write()。
+# SQL尽量写成固定文本的类常量，sqlite3 按SQL文本缓存编译好的语句，重复执行时不再重新编译；
+# 列表按主键分页（keyset），按ID读取时分批绑定参数。
+# 服务器模式下（见 api_server.py）窗口拿到的是HTTP会话而不是数据库连接，
+# 通过 open_repository() 取得的是 api_client 中方法相同的远程仓库。
+import json
+import config
+import inventory
+import pinyin_index
+import search
+import write_queue
+from database import connect
+from dosage import parse_dosage
+
+# 按ID批量读取时每条语句绑定的ID个数（低于SQLite的变量数上限）
+ID_BATCH_SIZE = 500
+
+# 分页查询默认的每页行数
+PAGE_SIZE = 100
+
+# 列表中病史列只显示前若干个字符，完整病史在需要时再查询；
+# 查询时多取一个字符，显示时据此判断病史是否被截断
+HISTORY_PREVIEW_LENGTH = 50
+
+
+def open_repository(cls, conn):
+    """返回 conn 对应的仓库：数据库连接为 cls(conn)，服务器会话为对应的远程仓库"""
+    opener = getattr(conn, "open_repository", None)
+    return opener(cls) if opener is not None else cls(conn)
+
+def call_repository(conn, cls, method, *args):
+    """写队列中执行的写操作：cls(conn).method(*args)"""
+    return getattr(cls(conn), method)(*args)
+
+def run_write(cls, method, *args):
+    """执行仓库的写方法并提交，返回其结果，失败时抛出写方法的异常（修改已撤销）
+
+    单机模式交给写队列执行；服务器模式发送到服务器，由服务器上的写队列执行。
+    """
+    if config.API_URL:
+        session = connect()
+        try:
+            return getattr(open_repository(cls, session), method)(*args)
+        finally:
+            session.close()
+    return write_queue.execute(call_repository, cls, method, *args)
+
+def background_write(conn, cls, method, *args):
+    """在后台执行器中执行的 run_write：db_executor.submit(widget, background_write, cls, method, *args, ...)
+
+    服务器模式下通过执行器的会话发送到服务器。
+    """
+    if config.API_URL:
+        return getattr(open_repository(cls, conn), method)(*args)
+    return write_queue.execute(call_repository, cls, method, *args)
+
+def where_clause(conditions):
+    """把条件列表拼成 WHERE 子句，没有条件时返回空字符串"""
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+class Repository:
+    """仓库基类"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def _all(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchall()
+
+    def _one(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchone()
+
+    def _value(self, sql, params=(), default=None):
+        row = self._one(sql, params)
+        return row[0] if row else default
+
+    def _by_ids(self, sql, ids):
+        """按ID分批查询，sql 中的 {ids} 替换为占位符"""
+        ids = list(ids)
+        rows = []
+        for start in range(0, len(ids), ID_BATCH_SIZE):
+            batch = ids[start:start + ID_BATCH_SIZE]
+            rows.extend(self._all(sql.format(ids=", ".join("?" * len(batch))), batch))
+        return rows
+
+
+class PatientRepository(Repository):
+    """患者
+
+    列表行为 (id, 姓名, 性别, 年龄, 电话, 病史前若干字)；
+    criteria 为查询条件 {"name": 姓名或拼音, "phone": 电话, "age": 年龄}，可以只包含其中几项。
+    """
+
+    COLUMNS = "p.id, p.name, p.gender, p.age, p.phone, substr(p.history, 1, ?)"
+
+    def filters(self, criteria=None):
+        """根据姓名（可输入拼音）、手机号和年龄构建查询条件，返回 (条件列表, 参数列表)"""
+        criteria = criteria or {}
+        age = criteria.get("age")
+        # 姓名和手机号足够长时走全文索引
+        conditions = []
+        params = []
+
+        for column in ("name", "phone"):
+            text = criteria.get(column)
+            if not text:
+                continue
+            if column == "name" and pinyin_index.is_pinyin_query(text):
+                # 输入拼音首字母或全拼时按拼音索引查找，同时保留对英文姓名的匹配
+                condition, condition_params = pinyin_index.prefix_condition("patient", "p.id", text)
+                condition = f"(p.name LIKE ? OR {condition})"
+                condition_params = [f"%{text}%"] + condition_params
+            else:
+                condition, condition_params = search.column_filter(self.conn, "patients", column, text)
+            conditions.append(condition)
+            params.extend(condition_params)
+
+        if age:
+            conditions.append("p.age = ?")
+            params.append(age)
+        return conditions, params
+
+    def search(self, keyword, criteria=None):
+        """按关键词搜索患者，返回 (id, 姓名, 性别, 年龄, 电话, 病史匹配片段) 的列表，按相关度排序"""
+        conditions, params = self.filters(criteria)
+        return [row[:6] for row in search.search_patients(keyword, conditions, params, conn=self.conn)]
+
+    def list(self, criteria=None):
+        """按ID顺序返回全部匹配的患者"""
+        conditions, params = self.filters(criteria)
+        return self._all(f"SELECT {self.COLUMNS} FROM patients p {where_clause(conditions)} ORDER BY p.id",
+                         [HISTORY_PREVIEW_LENGTH + 1] + params)
+
+    def page(self, after_id=None, limit=PAGE_SIZE, criteria=None):
+        """按ID顺序读取一页，after_id 为上一页最后一位患者的ID"""
+        conditions, params = self.filters(criteria)
+        params = [HISTORY_PREVIEW_LENGTH + 1] + params
+        if after_id is not None:
+            conditions.append("p.id > ?")
+            params.append(after_id)
+        return self._all(f"SELECT {self.COLUMNS} FROM patients p {where_clause(conditions)} ORDER BY p.id LIMIT ?",
+                         params + [limit])
+
+    def count(self, criteria=None):
+        conditions, params = self.filters(criteria)
+        return self._value(f"SELECT COUNT(*) FROM patients p {where_clause(conditions)}", params)
+
+    def id_at(self, position, criteria=None):
+        """按ID顺序第 position 位患者的ID（跳转到列表中间时用），超出范围时返回None"""
+        conditions, params = self.filters(criteria)
+        return self._value(f"SELECT p.id FROM patients p {where_clause(conditions)} ORDER BY p.id LIMIT 1 OFFSET ?",
+                           params + [position])
+
+    def get_many(self, patient_ids):
+        """按ID读取多位患者的完整信息 (id, 姓名, 性别, 年龄, 电话, 病史)"""
+        return self._by_ids("SELECT id, name, gender, age, phone, history FROM patients WHERE id IN ({ids})",
+                            patient_ids)
+
+    def get_history(self, patient_id):
+        """患者的完整病史"""
+        return self._value("SELECT history FROM patients WHERE id = ?", (patient_id,)) or ""
+
+    def find_by_name_phone(self, name, phone):
+        """按姓名和电话查找患者，返回 (id, 病史)，没有该患者时返回None"""
+        return self._one("SELECT id, history FROM patients WHERE name = ? AND phone = ?", (name, phone))
+
+    def add(self, name, gender, age, phone, history):
+        """新增患者，返回ID"""
+        patient_id = self.conn.execute("""
+            INSERT INTO patients (name, gender, age, phone, history)
+            VALUES (?, ?, ?, ?, ?)
+        """, (name, gender, age, phone, history)).lastrowid
+        pinyin_index.update_name_index(self.conn, "patient", patient_id, name)
+        return patient_id
+
+    def update(self, patient_id, name, gender, age, phone, history):
+        self.conn.execute("""
+            UPDATE patients SET name = ?, gender = ?, age = ?, phone = ?, history = ?
+            WHERE id = ?
+        """, (name, gender, age, phone, history, patient_id))
+        pinyin_index.update_name_index(self.conn, "patient", patient_id, name)
+
+    def update_details(self, patient_id, gender, age, phone, history):
+        """修改姓名以外的信息（姓名不变，拼音索引不需要更新）"""
+        self.conn.execute("""
+            UPDATE patients SET gender = ?, age = ?, phone = ?, history = ?
+            WHERE id = ?
+        """, (gender, age, phone, history, patient_id))
+
+    def delete(self, patient_id):
+        self.conn.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
+
+
+class RecordRepository(Repository):
+    """病历
+
+    列表行为 (id, 患者姓名, 日期, 诊断, 治疗方案)，按日期降序排列。
+    """
+
+    LIST_SQL = """
+        SELECT mr.id, p.name, mr.date, mr.diagnosis, mr.treatment
+        FROM medical_records mr
+        JOIN patients p ON mr.patient_id = p.id
+    """
+
+    def list(self, patient_id=None):
+        """全部病历，指定患者时只返回该患者的病历"""
+        if patient_id:
+            return self._all(self.LIST_SQL + " WHERE mr.patient_id = ? ORDER BY mr.date DESC", (patient_id,))
+        return self._all(self.LIST_SQL + " ORDER BY mr.date DESC")
+
+    def page(self, after=None, limit=PAGE_SIZE):
+        """按日期降序读取一页，after 为上一页最后一行的 (日期, id)"""
+        if after is None:
+            return self._all(self.LIST_SQL + " ORDER BY mr.date DESC, mr.id DESC LIMIT ?", (limit,))
+        return self._all(self.LIST_SQL + " WHERE (mr.date, mr.id) < (?, ?) ORDER BY mr.date DESC, mr.id DESC LIMIT ?",
+                         (after[0], after[1], limit))
+
+    def find(self, name="", phone="", date="", keyword=""):
+        """按患者姓名、电话、日期和关键词查询病历
+
+        有关键词时按相关度排序，每行最后多一列高亮的匹配片段；否则按时间降序排列。
+        """
+        # 姓名和电话足够长时走全文索引
+        conditions = []
+        params = []
+
+        for column, text in (("name", name), ("phone", phone)):
+            if text:
+                condition, condition_params = search.column_filter(self.conn, "patients", column, text)
+                conditions.append(condition)
+                params.extend(condition_params)
+
+        if date:
+            conditions.append("mr.date = ?")
+            params.append(date)
+
+        if keyword:
+            return [row[:6] for row in search.search_records(keyword, conditions, params, conn=self.conn)]
+        return self._all(f"{self.LIST_SQL} {where_clause(conditions)} ORDER BY mr.date DESC", params)
+
+    def add(self, patient_id, date, wang, wen, wen2, qie, diagnosis, treatment):
+        """新增病历，返回ID"""
+        return self.conn.execute("""
+            INSERT INTO medical_records (patient_id, date, wang, wen, wen2, qie, diagnosis, treatment)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (patient_id, date, wang, wen, wen2, qie, diagnosis, treatment)).lastrowid
+
+    def add_visit(self, patient, record, items):
+        """保存一次就诊：患者、病历和处方，并按处方扣减库存，返回病历ID
+
+        patient 为 {"name", "gender", "age", "phone", "history"}，姓名和电话都相同的患者已存在时更新其信息
+        （新输入的病史为空时保留原有病史）；record 为 {"date", "wang", "wen", "wen2", "qie", "diagnosis", "treatment"}；
+        items 为 (药品, 剂量, 用法)。库存不足时抛出 inventory.InsufficientStock，由调用方回滚整个事务。
+        """
+        patients = PatientRepository(self.conn)
+        existing = patients.find_by_name_phone(patient["name"], patient["phone"])
+        if existing:
+            patient_id = existing[0]
+            history = patient["history"] or existing[1] or ""
+            patients.update_details(patient_id, patient["gender"], patient["age"], patient["phone"], history)
+        else:
+            patient_id = patients.add(patient["name"], patient["gender"], patient["age"], patient["phone"],
+                                      patient["history"])
+        record_id = self.add(patient_id, record["date"], record["wang"], record["wen"], record["wen2"], record["qie"],
+                             record["diagnosis"], record["treatment"])
+        inventory.dispense(self.conn, PrescriptionRepository(self.conn).add_many(record_id, items), record_id)
+        return record_id
+
+
+class PrescriptionRepository(Repository):
+    """处方
+
+    列表行为 (病历ID, 药品, 剂量, 用法, 病历日期, 患者姓名, 处方ID)，按病历日期降序排列。
+    """
+
+    LIST_SQL = """
+        SELECT p.record_id, p.medicine, p.dosage, p.usage, mr.date, pt.name, p.id
+        FROM prescriptions p
+        JOIN medical_records mr ON p.record_id = mr.id
+        JOIN patients pt ON mr.patient_id = pt.id
+    """
+
+    def list(self, record_id=None):
+        """全部处方，指定病历时只返回该病历的处方"""
+        if record_id:
+            return self._all(self.LIST_SQL + " WHERE p.record_id = ? ORDER BY mr.date DESC", (record_id,))
+        return self._all(self.LIST_SQL + " ORDER BY mr.date DESC")
+
+    def page(self, after=None, limit=PAGE_SIZE):
+        """按病历日期降序读取一页，after 为上一页最后一行的 (日期, 处方ID)"""
+        if after is None:
+            return self._all(self.LIST_SQL + " ORDER BY mr.date DESC, p.id DESC LIMIT ?", (limit,))
+        return self._all(self.LIST_SQL + " WHERE (mr.date, p.id) < (?, ?) ORDER BY mr.date DESC, p.id DESC LIMIT ?",
+                         (after[0], after[1], limit))
+
+    def find(self, patient_name="", record_id="", date=""):
+        """按患者姓名、病历ID和日期查询处方"""
+        conditions = []
+        params = []
+
+        if patient_name:
+            conditions.append("pt.name LIKE ?")
+            params.append(f"%{patient_name}%")
+
+        if record_id:
+            conditions.append("p.record_id = ?")
+            params.append(record_id)
+
+        if date:
+            conditions.append("mr.date = ?")
+            params.append(date)
+
+        return self._all(f"{self.LIST_SQL} {where_clause(conditions)} ORDER BY mr.date DESC", params)
+
+    def for_record(self, record_id):
+        """一条病历的处方 (药品, 剂量, 用法)，按开方顺序排列"""
+        return self._all("SELECT medicine, dosage, usage FROM prescriptions WHERE record_id = ? ORDER BY id",
+                         (record_id,))
+
+    def for_records(self, record_ids):
+        """多条病历的处方 (病历ID, 药品, 剂量, 用法)，按病历和开方顺序排列"""
+        rows = self._by_ids("SELECT record_id, medicine, dosage, usage, id FROM prescriptions "
+                            "WHERE record_id IN ({ids})", record_ids)
+        return [row[:4] for row in sorted(rows, key=lambda row: (row[0], row[4]))]
+
+    def add_many(self, record_id, items):
+        """为病历写入处方，items 为 (药品, 剂量, 用法)
+
+        写入时解析一次剂量，返回可以计量的 (药品, (数量, 单位)) 列表，用于扣减库存。
+        """
+        rows = []
+        measured = []
+        for medicine, dosage, usage in items:
+            dosage_qty, dosage_unit = parse_dosage(dosage)
+            rows.append((record_id, medicine, dosage, usage, dosage_qty, dosage_unit))
+            if dosage_qty is not None:
+                measured.append((medicine, (dosage_qty, dosage_unit)))
+        self.conn.executemany("""
+            INSERT INTO prescriptions (record_id, medicine, dosage, usage, dosage_qty, dosage_unit)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        return measured
+
+
+class MedicineRepository(Repository):
+    """药品
+
+    列表行为 (id, 名称, 库存, 单位, 用法)。
+    """
+
+    LIST_SQL = "SELECT id, name, stock, unit, usage FROM medicines"
+
+    def list(self):
+        return self._all(self.LIST_SQL)
+
+    def find(self, name="", usage=""):
+        """按名称（可输入拼音）和用法查询药品"""
+        conditions = []
+        params = []
+
+        if name and pinyin_index.is_pinyin_query(name):
+            # 输入拼音时同时匹配名称和拼音首字母/全拼前缀
+            condition, condition_params = pinyin_index.prefix_condition("medicine", "id", name)
+            conditions.append(f"(name LIKE ? OR {condition})")
+            params.extend([f"%{name}%"] + condition_params)
+        elif name:
+            conditions.append("name LIKE ?")
+            params.append(f"%{name}%")
+
+        if usage:
+            conditions.append("usage LIKE ?")
+            params.append(f"%{usage}%")
+
+        return self._all(f"{self.LIST_SQL} {where_clause(conditions)}", params)
+
+    def get_by_name(self, name):
+        """按名称查找药品，返回 (id, 库存, 单位, 用法)，不存在时返回None"""
+        return self._one("SELECT id, stock, unit, usage FROM medicines WHERE name = ?", (name,))
+
+    def exists(self, name):
+        return self._one("SELECT 1 FROM medicines WHERE name = ?", (name,)) is not None
+
+    def add(self, name, stock, unit, usage):
+        """新增药品，初始库存记为期初流水，返回ID"""
+        medicine_id = self.conn.execute("""
+            INSERT INTO medicines (name, stock, unit, usage)
+            VALUES (?, ?, ?, ?)
+        """, (name, stock, unit, usage)).lastrowid
+        pinyin_index.update_name_index(self.conn, "medicine", medicine_id, name)
+        inventory.record_movement(self.conn, medicine_id, name, stock, stock, inventory.REASON_INITIAL)
+        return medicine_id
+
+    def update(self, medicine_id, stock, unit, usage):
+        """修改药品信息，库存变化记入流水"""
+        self.conn.execute("UPDATE medicines SET unit = ?, usage = ? WHERE id = ?", (unit, usage, medicine_id))
+        inventory.set_stock(self.conn, medicine_id, stock)
+
+    def save(self, name, stock, unit, usage):
+        """按名称保存药品：已有同名药品时修改，否则新增，返回是否为新增"""
+        existing = self.get_by_name(name)
+        if existing:
+            self.update(existing[0], stock, unit, usage)
+            return False
+        self.add(name, stock, unit, usage)
+        return True
+
+    def delete(self, medicine_id):
+        self.conn.execute("DELETE FROM medicines WHERE id = ?", (medicine_id,))
+
+    def autocomplete_entries(self):
+        """自动完成的候选 (名称, 处方使用次数, 拼音首字母, 全拼)"""
+        names = [row[0] for row in self.conn.execute("SELECT name FROM medicines")]
+        usage = dict(self._all("SELECT medicine, COUNT(*) FROM prescriptions GROUP BY medicine"))
+        keys = {name: (initials, full) for name, initials, full in
+                self._all("SELECT name, initials, full FROM name_pinyin WHERE kind = 'medicine'")}
+        return [(name, usage.get(name, 0)) + keys.get(name, ()) for name in names]
+
+
+class FavoriteRepository(Repository):
+    """收藏夹和收藏的处方
+
+    收藏夹行为 (id, 名称, 处方数量, 创建时间)。
+    """
+
+    FOLDERS_SQL = """
+        SELECT f.id, f.name, COUNT(fp.id) as prescription_count, f.created_time
+        FROM favorite_folders f
+        LEFT JOIN favorite_prescriptions fp ON f.id = fp.folder_id
+    """
+
+    def folders(self):
+        """全部收藏夹及其中的处方数量"""
+        return self._all(self.FOLDERS_SQL + " GROUP BY f.id, f.name, f.created_time")
+
+    def find_folders(self, folder_name=""):
+        """按名称查询收藏夹，按创建时间降序排列"""
+        conditions = ["f.name LIKE ?"] if folder_name else []
+        params = [f"%{folder_name}%"] if folder_name else []
+        return self._all(f"""
+            {self.FOLDERS_SQL} {where_clause(conditions)}
+            GROUP BY f.id, f.name, f.created_time
+            ORDER BY f.created_time DESC
+        """, params)
+
+    def folder_names(self):
+        """全部收藏夹的 (id, 名称)"""
+        return self._all("SELECT id, name FROM favorite_folders")
+
+    def folder_id(self, name):
+        """按名称查找收藏夹ID，不存在时返回None"""
+        return self._value("SELECT id FROM favorite_folders WHERE name = ?", (name,))
+
+    def create_folder(self, name):
+        """新建收藏夹，返回ID"""
+        return self.conn.execute("INSERT INTO favorite_folders (name) VALUES (?)", (name,)).lastrowid
+
+    def delete_folder(self, folder_id):
+        """删除收藏夹及其中的收藏"""
+        self.conn.execute("DELETE FROM favorite_prescriptions WHERE folder_id = ?", (folder_id,))
+        self.conn.execute("DELETE FROM favorite_folders WHERE id = ?", (folder_id,))
+
+    def favorites(self):
+        """全部收藏 (id, 收藏夹名称, 患者姓名, 处方JSON, 收藏时间)，按收藏时间降序排列"""
+        return self._all("""
+            SELECT fp.id, ff.name, fp.patient_name, fp.prescription_data, fp.created_time
+            FROM favorite_prescriptions fp
+            LEFT JOIN favorite_folders ff ON fp.folder_id = ff.id
+            ORDER BY fp.created_time DESC
+        """)
+
+    def favorites_in_folder(self, folder_id):
+        """一个收藏夹中的收藏 (id, 患者姓名, 处方JSON, 收藏时间)，按收藏时间降序排列"""
+        return self._all("""
+            SELECT fp.id, fp.patient_name, fp.prescription_data, fp.created_time
+            FROM favorite_prescriptions fp
+            WHERE fp.folder_id = ?
+            ORDER BY fp.created_time DESC
+        """, (folder_id,))
+
+    def add(self, folder_id, record_id, patient_name, prescription_data):
+        """收藏处方，prescription_data 保存为JSON，返回ID"""
+        return self.conn.execute("""
+            INSERT INTO favorite_prescriptions (folder_id, record_id, patient_name, prescription_data)
+            VALUES (?, ?, ?, ?)
+        """, (folder_id, record_id, patient_name, json.dumps(prescription_data, ensure_ascii=False))).lastrowid
+
+    def add_to_new_folder(self, folder_name, record_id, patient_name, prescription_data):
+        """新建收藏夹并把处方收藏到其中，返回收藏的ID"""
+        return self.add(self.create_folder(folder_name), record_id, patient_name, prescription_data)
+
+    def delete(self, favorite_id):
+        self.conn.execute("DELETE FROM favorite_prescriptions WHERE id = ?", (favorite_id,))
@@ -0,0 +1,103 @@
+# rollups.py
+# 就诊数量汇总表：visits_daily / visits_monthly / visits_yearly 由 medical_records 上的触发器
+# 增量维护（见 migrations.py），统计图表只需按范围读取几百行汇总数据，不再扫描整个病历表
+#
+# 汇总表与病历不一致时（例如关闭触发器导入数据后）可以重建：
+#     python rollups.py            重建全部汇总表
+#     python rollups.py --check    只检查是否一致
+import sys
+from database import get_connection, run_in_transaction
+
+# 汇总表：(表名, 键列, 由病历日期计算键的表达式)
+ROLLUPS = [
+    ("visits_daily", "day", "date"),
+    ("visits_monthly", "month", "strftime('%Y-%m', date)"),
+    ("visits_yearly", "year", "strftime('%Y', date)"),
+]
+
+def rebuild_rollups(conn):
+    """根据病历表重新计算所有汇总表，返回 {表名: 行数}"""
+    counts = {}
+    for table, key, expression in ROLLUPS:
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"""
+            INSERT INTO {table} ({key}, visits)
+            SELECT {expression}, COUNT(*) FROM medical_records
+            WHERE {expression} IS NOT NULL
+            GROUP BY {expression}
+        """)
+        counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    return counts
+
+def check_rollups(conn):
+    """对比汇总表和病历表，返回不一致的 [(表名, 键, 汇总值, 实际值), ...]"""
+    mismatches = []
+    for table, key, expression in ROLLUPS:
+        actual = dict(conn.execute(f"""
+            SELECT {expression}, COUNT(*) FROM medical_records
+            WHERE {expression} IS NOT NULL
+            GROUP BY {expression}
+        """).fetchall())
+        stored = dict(conn.execute(f"SELECT {key}, visits FROM {table}").fetchall())
+        for value in sorted(set(actual) | set(stored)):
+            if actual.get(value, 0) != stored.get(value, 0):
+                mismatches.append((table, value, stored.get(value, 0), actual.get(value, 0)))
+    return mismatches
+
+def _query(sql, params=()):
+    conn = get_connection()
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+def data_version(name="medical_records"):
+    """返回表的数据版本号，表中数据每次变化都会加一（由触发器维护）"""
+    rows = _query("SELECT version FROM data_versions WHERE name = ?", (name,))
+    return rows[0][0] if rows else 0
+
+def daily_visits(days=30):
+    """最近 days 天每天的就诊数 [(日期, 数量), ...]"""
+    return _query("""
+        SELECT day, visits FROM visits_daily
+        WHERE day >= date('now', ?)
+        ORDER BY day
+    """, (f"-{days} days",))
+
+def monthly_visits(months=None):
+    """每月就诊数 [(月份, 数量), ...]
+
+    months 为空时返回全部月份；否则统计从 months 个月前的当天开始的数据，
+    第一个月只包含该日期之后的就诊，由每日汇总按月合计得到。
+    """
+    if months is None:
+        return _query("SELECT month, visits FROM visits_monthly ORDER BY month")
+    return _query("""
+        SELECT substr(day, 1, 7) AS month, SUM(visits) FROM visits_daily
+        WHERE day >= date('now', ?)
+        GROUP BY month
+        ORDER BY month
+    """, (f"-{months} months",))
+
+def yearly_visits():
+    """每年就诊数 [(年份, 数量), ...]"""
+    return _query("SELECT year, visits FROM visits_yearly ORDER BY year")
+
+
+if __name__ == "__main__":
+    from database import init_db
+    init_db()
+    if "--check" in sys.argv[1:]:
+        conn = get_connection()
+        try:
+            mismatches = check_rollups(conn)
+        finally:
+            conn.close()
+        for table, value, stored, actual in mismatches:
+            print(f"{table} {value}: 汇总 {stored}，实际 {actual}")
+        print("汇总表一致" if not mismatches else f"共 {len(mismatches)} 处不一致")
+        sys.exit(1 if mismatches else 0)
+    counts = run_in_transaction(rebuild_rollups)
+    for table, count in counts.items():
+        print(f"{table}: {count} 行")
+    print("汇总表已重建")
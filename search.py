@@ -0,0 +1,166 @@
+# search.py
+# 全文检索：患者（姓名、电话、病史）和病历（望闻问切、诊断、治疗方案）的FTS5索引，
+# 使用trigram分词支持中文任意子串匹配，索引由触发器与原表保持同步（见 migrations.py）
+from database import get_connection
+
+# trigram分词至少需要3个字符才能使用索引，更短的关键词改用LIKE
+MIN_MATCH_LENGTH = 3
+# 搜索结果的最大条数
+SEARCH_LIMIT = 500
+# 摘要中高亮关键词的标记（Treeview不支持富文本）
+HIGHLIGHT_START = "【"
+HIGHLIGHT_END = "】"
+# 摘要包含的分词数量
+SNIPPET_TOKENS = 12
+
+# 搜索范围：(全文索引表, 原表别名, 索引列, bm25列权重, 摘要列)
+SCOPES = {
+    "patients": ("patients_fts", "p", ("name", "phone", "history"), (10.0, 5.0, 1.0), 2),
+    "records": ("medical_records_fts", "mr", ("wang", "wen", "wen2", "qie", "diagnosis", "treatment"), (1.0, 1.0, 1.0, 1.0, 3.0, 2.0), -1),
+}
+
+# 各范围返回的列，最后两列为摘要和排名（排名越小越相关）
+SELECT_COLUMNS = {
+    "patients": "p.id, p.name, p.gender, p.age, p.phone",
+    "records": "mr.id, p.name, mr.date, mr.diagnosis, mr.treatment",
+}
+
+FROM_CLAUSES = {
+    "patients": "patients p",
+    "records": "medical_records mr JOIN patients p ON mr.patient_id = p.id",
+}
+
+# 不使用全文索引时代替摘要显示的内容
+PREVIEW = {
+    "patients": "COALESCE(p.history, '')",
+    "records": "COALESCE(NULLIF(mr.diagnosis, ''), NULLIF(mr.treatment, ''), NULLIF(mr.wen2, ''), '')",
+}
+
+# 不使用全文索引时摘要显示的字符数；患者病史多取一个字符，列表显示时据此判断是否被截断（见 patient.format_patient_row）
+PREVIEW_LENGTH = {
+    "patients": 50 + 1,
+    "records": 50,
+}
+
+# 不使用全文索引时的默认顺序
+DEFAULT_ORDER = {
+    "patients": "p.id",
+    "records": "mr.date DESC",
+}
+
+def fts_available(conn, scope="patients"):
+    """全文索引表是否存在（SQLite未编译FTS5时迁移会跳过建表）"""
+    table = SCOPES[scope][0]
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+def quote_term(term):
+    """把关键词转为FTS5短语，避免引号、星号等被当作查询语法"""
+    return '"' + term.replace('"', '""') + '"'
+
+def split_terms(text):
+    """按空白拆分关键词，返回 (可用全文索引的关键词, 过短的关键词)"""
+    terms = text.split()
+    long_terms = [t for t in terms if len(t) >= MIN_MATCH_LENGTH]
+    short_terms = [t for t in terms if len(t) < MIN_MATCH_LENGTH]
+    return long_terms, short_terms
+
+def build_match(terms, columns=None):
+    """生成MATCH表达式，多个关键词之间为AND，columns限定匹配的列"""
+    expression = " AND ".join(quote_term(t) for t in terms)
+    if columns:
+        expression = "{" + " ".join(columns) + "} : (" + expression + ")"
+    return expression
+
+def like_condition(alias, columns, term):
+    """生成在多列中做子串匹配的LIKE条件"""
+    condition = "(" + " OR ".join(f"{alias}.{c} LIKE ?" for c in columns) + ")"
+    return condition, [f"%{term}%"] * len(columns)
+
+def column_filter(conn, scope, column, text):
+    """生成单列子串过滤条件，关键词足够长时走全文索引，否则退回LIKE
+
+    返回 (条件, 参数列表)，条件引用原表别名（患者为 p，病历为 mr）。
+    """
+    table, alias, columns, _, _ = SCOPES[scope]
+    if len(text) >= MIN_MATCH_LENGTH and fts_available(conn, scope):
+        return (
+            f"{alias}.id IN (SELECT rowid FROM {table} WHERE {table} MATCH ?)",
+            [build_match([text], [column])]
+        )
+    return f"{alias}.{column} LIKE ?", [f"%{text}%"]
+
+def search(scope, text, conditions=(), params=(), limit=SEARCH_LIMIT, conn=None):
+    """在患者（scope="patients"）或病历（scope="records"）中搜索关键词
+
+    返回按相关度排序的行：患者为 (id, 姓名, 性别, 年龄, 电话, 病史摘要, 排名)，
+    病历为 (id, 患者姓名, 日期, 诊断, 治疗方案, 匹配摘要, 排名)。
+    conditions/params 为附加的过滤条件，可引用别名 p（患者）和 mr（病历）。
+    conn 为空时从连接池取连接。
+    """
+    table, alias, columns, weights, snippet_column = SCOPES[scope]
+    conditions = list(conditions)
+    params = list(params)
+    long_terms, short_terms = split_terms(text)
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        use_fts = bool(long_terms) and fts_available(conn, scope)
+        if not use_fts:
+            # 关键词都太短或没有全文索引：逐个关键词做LIKE匹配
+            short_terms = long_terms + short_terms
+        for term in short_terms:
+            condition, like_params = like_condition(alias, columns, term)
+            conditions.append(condition)
+            params.extend(like_params)
+
+        if use_fts:
+            weight_args = ", ".join(str(w) for w in weights)
+            conditions = [f"{table} MATCH ?", f"{alias}.id = {table}.rowid"] + conditions
+            query = f"""
+                SELECT {SELECT_COLUMNS[scope]},
+                       snippet({table}, {snippet_column}, ?, ?, '…', {SNIPPET_TOKENS}),
+                       bm25({table}, {weight_args}) AS rank
+                FROM {table}, {FROM_CLAUSES[scope]}
+                WHERE {' AND '.join(conditions)}
+                ORDER BY rank
+                LIMIT ?
+            """
+            args = [HIGHLIGHT_START, HIGHLIGHT_END, build_match(long_terms)] + params + [limit]
+        else:
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            query = f"""
+                SELECT {SELECT_COLUMNS[scope]}, substr({PREVIEW[scope]}, 1, {PREVIEW_LENGTH[scope]}), 0 AS rank
+                FROM {FROM_CLAUSES[scope]}
+                {where}
+                ORDER BY {DEFAULT_ORDER[scope]}
+                LIMIT ?
+            """
+            args = params + [limit]
+        return conn.execute(query, args).fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+
+def search_patients(text, conditions=(), params=(), limit=SEARCH_LIMIT, conn=None):
+    """按关键词搜索患者的姓名、电话和病史"""
+    return search("patients", text, conditions, params, limit, conn)
+
+def search_records(text, conditions=(), params=(), limit=SEARCH_LIMIT, conn=None):
+    """按关键词搜索病历的望闻问切、诊断和治疗方案"""
+    return search("records", text, conditions, params, limit, conn)
+
+def rebuild_index():
+    """根据原表重建全文索引（索引与数据不一致时使用）"""
+    conn = get_connection()
+    try:
+        with conn:
+            for scope in SCOPES:
+                table = SCOPES[scope][0]
+                if fts_available(conn, scope):
+                    conn.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+    finally:
+        conn.close()
@@ -0,0 +1,61 @@
+# startup.py
+# 启动流程：登录窗口先显示，数据库初始化（迁移、WAL检查点线程）在后台线程中进行，
+# 登录成功后再等待初始化完成；耗时的模块（matplotlib、reportlab等）都在第一次使用时才导入。
+# 服务器模式（config.API_URL）下数据库由 api_server.py 初始化，这里只检查能否连接服务器
+import threading
+import config
+from database import init_db, start_checkpointer, stop_checkpointer
+from db_executor import shutdown_executor
+from write_queue import stop_write_queue
+
+
+class DatabaseInitializer:
+    """在后台线程中初始化数据库"""
+
+    def __init__(self):
+        self.error = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="db-init", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            if config.API_URL:
+                from api_client import get_client
+                get_client().check()
+                return
+            init_db()
+            # 启动后台WAL检查点
+            start_checkpointer()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done.set()
+
+    def is_done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """等待初始化完成，返回是否成功（超时也视为未成功）"""
+        if not self._done.wait(timeout):
+            return False
+        return self.error is None
+
+
+def start_database_init():
+    """开始后台初始化数据库，返回 DatabaseInitializer"""
+    return DatabaseInitializer().start()
+
+def shutdown():
+    """退出程序前停止后台线程"""
+    shutdown_executor()
+    # 先写完排队中的写操作，再做最后一次检查点
+    stop_write_queue()
+    stop_checkpointer()
+    if config.API_URL:
+        from api_client import close_client
+        close_client()
@@ -0,0 +1,74 @@
+# test_dosage.py
+# 剂量解析的表格测试：python -m unittest discover tests
+import unittest
+from dosage import parse_dosage, stock_quantity
+
+# (剂量, 期望的 (数量, 单位))
+PARSE_CASES = [
+    ("10g", (10, "克")),
+    ("10 克", (10, "克")),
+    ("500mg", (0.5, "克")),
+    ("0.5kg", (500, "克")),
+    ("10-15克", (15, "克")),
+    ("10g（后下）", (10, "克")),
+    ("三钱", (9, "克")),
+    ("3钱半", (10.5, "克")),
+    ("一两", (30, "克")),
+    ("一两半", (45, "克")),
+    ("五十两", (1500, "克")),
+    ("十二克", (12, "克")),
+    ("一百克", (100, "克")),
+    ("一百零五克", (105, "克")),
+    ("一百二十克", (120, "克")),
+    ("两千克", (2000, "克")),
+    ("2千克", (2000, "克")),
+    ("两包", (2, "包")),
+    ("半袋", (0.5, "袋")),
+    ("3", (3, None)),
+    ("十", (10, None)),
+    ("3勺", (3, "勺")),
+    ("适量", (None, None)),
+    ("少许", (None, None)),
+    ("", (None, None)),
+    (None, (None, None)),
+    # 数字没有解析完整时整个剂量无法识别，不能把剩下的部分当作单位
+    ("一万克", (None, None)),
+    ("百克", (None, None)),
+    ("一二克", (None, None)),
+    ("十十克", (None, None)),
+]
+
+# (数量, 单位, 库存单位, 期望的库存数量)
+STOCK_CASES = [
+    (10, "克", "克", 10),
+    (30, "克", "两", 1),
+    (2, None, "包", 2),
+    (2, "包", "包", 2),
+    (0.5, "克", "粒", None),
+    (None, None, "克", None),
+]
+
+
+class ParseDosageTest(unittest.TestCase):
+    def test_parse_dosage(self):
+        for text, expected in PARSE_CASES:
+            with self.subTest(text=text):
+                quantity, unit = parse_dosage(text)
+                self.assertEqual(unit, expected[1])
+                if expected[0] is None:
+                    self.assertIsNone(quantity)
+                else:
+                    self.assertAlmostEqual(quantity, expected[0])
+
+    def test_stock_quantity(self):
+        for quantity, unit, stock_unit, expected in STOCK_CASES:
+            with self.subTest(quantity=quantity, unit=unit, stock_unit=stock_unit):
+                result = stock_quantity(quantity, unit, stock_unit)
+                if expected is None:
+                    self.assertIsNone(result)
+                else:
+                    self.assertAlmostEqual(result, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
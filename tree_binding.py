@@ -0,0 +1,85 @@
+# tree_binding.py
+# Treeview 数据绑定：行以主键作为 iid 插入，刷新时与上次显示的数据比较，
+# 只删除消失的行、插入新增的行、修改有变化的行，不再清空后重新插入全部行；
+# 选中状态和滚动位置因此也能保留下来。每次刷新都统计发出的Tcl调用次数，便于比较刷新代价
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# 一次刷新的结果：插入、修改、删除、移动的行数，以及发出的Tcl调用次数
+RefreshStats = namedtuple("RefreshStats", "inserted updated deleted moved tcl_calls")
+
+
+class TreeBinding:
+    """把行列表绑定到 Treeview 的顶层行
+
+    format_row(row) 把数据行转换为 values，key(row) 返回行的主键（默认为第一列）；
+    striped 为 True 时按行号设置 evenrow/oddrow 交替颜色。
+    """
+
+    def __init__(self, tree, format_row=None, key=None, striped=True):
+        self.tree = tree
+        self.format_row = format_row or tuple
+        self.key = key or (lambda row: row[0])
+        self.striped = striped
+        self._items = {}   # iid -> (values, tags)
+        self._order = []   # 当前显示顺序
+        self.tcl_calls = 0          # 累计的Tcl调用次数
+        self.last_refresh = None    # 最近一次刷新的 RefreshStats
+
+    def _call(self, method, *args, **kwargs):
+        # Treeview 的 insert/item/delete/move 各对应一次Tcl调用
+        self.tcl_calls += 1
+        return method(*args, **kwargs)
+
+    def tags_for(self, index):
+        if not self.striped:
+            return ()
+        return ("evenrow",) if index % 2 == 0 else ("oddrow",)
+
+    def update(self, rows, start=0):
+        """显示新的结果集，start 为第一行的行号（用于交替颜色），返回 RefreshStats"""
+        calls_before = self.tcl_calls
+        new_items = []
+        for index, row in enumerate(rows):
+            iid = str(self.key(row))
+            new_items.append((iid, tuple(self.format_row(row)), self.tags_for(start + index)))
+        new_ids = {iid for iid, _, _ in new_items}
+
+        removed = [iid for iid in self._order if iid not in new_ids]
+        if removed:
+            self._call(self.tree.delete, *removed)
+        order = [iid for iid in self._order if iid in new_ids]
+
+        inserted = updated = moved = 0
+        for index, (iid, values, tags) in enumerate(new_items):
+            old = self._items.get(iid)
+            if old is None:
+                # 插入时直接设置交替行颜色，不再逐行调用 item()
+                self._call(self.tree.insert, "", index, iid=iid, values=values, tags=tags)
+                order.insert(index, iid)
+                inserted += 1
+                continue
+            if old != (values, tags):
+                self._call(self.tree.item, iid, values=values, tags=tags)
+                updated += 1
+            if order[index] != iid:
+                # 顺序变化（例如按相关度重新排序）时才移动
+                order.remove(iid)
+                order.insert(index, iid)
+                self._call(self.tree.move, iid, "", index)
+                moved += 1
+
+        self._items = {iid: (values, tags) for iid, values, tags in new_items}
+        self._order = order
+        self.last_refresh = RefreshStats(inserted, updated, len(removed), moved, self.tcl_calls - calls_before)
+        logger.debug("刷新 %s: %s", self.tree, self.last_refresh)
+        return self.last_refresh
+
+    def clear(self):
+        """删除全部行"""
+        if self._order:
+            self._call(self.tree.delete, *self._order)
+        self._items = {}
+        self._order = []
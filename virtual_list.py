@@ -0,0 +1,283 @@
+# virtual_list.py
+# 虚拟列表：按主键分页（keyset）读取数据，Treeview中只保留当前可见的行，
+# 滚动时替换可见窗口的内容，行数再多也只占用固定的Tcl内存
+from collections import OrderedDict
+import db_executor
+from tree_binding import TreeBinding
+
+# 尚未加载的行显示的文字
+LOADING_TEXT = "正在加载..."
+
+def load_pages(conn, pager, pages):
+    """后台查询：读取分页数据源的指定页（见 KeysetPager.load）"""
+    return pager.load(conn, pages)
+
+
+class KeysetPager:
+    """按主键顺序分页读取数据的模型
+
+    fetch_page(conn, after_key, limit) 返回主键大于 after_key 的前 limit 行（after_key 为 None 时从头开始），
+    每行第一列必须是主键；count(conn) 返回总行数；
+    key_at(conn, position) 返回第 position 行（从0开始）的主键，用于直接跳转到未加载过的位置。
+
+    读取数据库的 load() 在后台线程中执行（见 db_executor），结果由界面线程交给 store()；
+    界面线程只通过 total、missing_pages() 和 get_rows() 使用已加载的数据，不访问数据库。
+    """
+
+    def __init__(self, fetch_page, count, key_at, page_size=100, max_cached_pages=8):
+        self.fetch_page = fetch_page
+        self.count = count
+        self.key_at = key_at
+        self.page_size = page_size
+        self.max_cached_pages = max_cached_pages
+        self._pages = OrderedDict()   # 页号 -> 行列表（LRU）
+        self._after_keys = {0: None}  # 页号 -> 该页之前最后一行的主键
+        self._total = None
+        self._generation = 0          # invalidate() 后，之前开始的 load() 结果作废
+
+    @property
+    def total(self):
+        """总行数，尚未加载时为None"""
+        return self._total
+
+    def invalidate(self):
+        """数据变化后清空缓存"""
+        self._pages.clear()
+        self._after_keys = {0: None}
+        self._total = None
+        self._generation += 1
+
+    def _page_range(self, offset, limit, prefetch, total):
+        if limit <= 0 or offset >= total:
+            return range(0)
+        end = min(offset + limit, total)
+        first_page = max(0, offset - prefetch) // self.page_size
+        last_page = (min(end + prefetch, total) - 1) // self.page_size
+        return range(first_page, last_page + 1)
+
+    def missing_pages(self, offset, limit, prefetch=0):
+        """显示从 offset 开始的 limit 行（以及前后 prefetch 行）还需要加载的页"""
+        # 总行数未知时先按可见窗口加载，超出总行数的页在 load() 中跳过
+        total = self._total if self._total is not None else offset + limit
+        return [page for page in self._page_range(offset, limit, prefetch, total) if page not in self._pages]
+
+    def load(self, conn, pages):
+        """在后台线程中读取总行数和指定的页，返回交给 store() 的结果，不修改缓存"""
+        generation = self._generation
+        total = self._total if self._total is not None else self.count(conn)
+        loaded = {}
+        for page in sorted(pages):
+            if page and page * self.page_size >= total:
+                continue
+            if page in self._after_keys:
+                key = self._after_keys[page]
+            else:
+                previous = loaded[page - 1][1] if page - 1 in loaded else self._pages.get(page - 1)
+                if previous is not None and len(previous) == self.page_size:
+                    key = previous[-1][0]
+                else:
+                    # 跳转到未加载过的位置：用OFFSET只查主键，代价远小于查整行
+                    key = self.key_at(conn, page * self.page_size - 1)
+            loaded[page] = (key, self.fetch_page(conn, key, self.page_size))
+        return generation, total, loaded
+
+    def store(self, result):
+        """在界面线程中保存 load() 的结果，返回是否有效（期间调用过 invalidate() 时作废）"""
+        generation, total, loaded = result
+        if generation != self._generation:
+            return False
+        self._total = total
+        for page, (key, rows) in loaded.items():
+            self._after_keys[page] = key
+            if len(rows) == self.page_size:
+                self._after_keys[page + 1] = rows[-1][0]
+            self._pages[page] = rows
+            self._pages.move_to_end(page)
+        while len(self._pages) > self.max_cached_pages:
+            self._pages.popitem(last=False)
+        return True
+
+    def get_rows(self, offset, limit, prefetch=0):
+        """返回从 offset 开始的 limit 行，尚未加载的行为None"""
+        if self._total is None:
+            return []
+        end = min(offset + limit, self._total)
+        rows = []
+        for page in self._page_range(offset, limit, 0, self._total):
+            page_start = page * self.page_size
+            start = max(offset - page_start, 0)
+            stop = end - page_start
+            page_rows = self._pages.get(page)
+            if page_rows is None:
+                rows.extend([None] * (min(stop, self.page_size) - start))
+                continue
+            self._pages.move_to_end(page)
+            rows.extend(page_rows[start:min(stop, len(page_rows))])
+        return rows
+
+
+class ListPager:
+    """已全部读入内存的行（例如按相关度排序的搜索结果），接口与 KeysetPager 相同"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    @property
+    def total(self):
+        return len(self.rows)
+
+    def invalidate(self):
+        pass
+
+    def missing_pages(self, offset, limit, prefetch=0):
+        return []
+
+    def get_rows(self, offset, limit, prefetch=0):
+        return self.rows[offset:offset + max(limit, 0)]
+
+
+class VirtualTreeview:
+    """把 KeysetPager 绑定到 Treeview 和滚动条上
+
+    Treeview 中只插入当前可见的行，滚动条按总行数计算位置；
+    format_row(row) 把数据行转换为 Treeview 的 values。
+    未加载的页在后台读取（db_executor），期间显示占位行，读取完成后再刷新；
+    切换数据源时保留原来的行，直到新数据读取完成。
+    """
+
+    def __init__(self, tree, scrollbar, format_row, row_height=25, prefetch=50, on_total_changed=None,
+                 on_error=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.format_row = format_row
+        self.row_height = row_height
+        self.prefetch = prefetch
+        self.on_total_changed = on_total_changed
+        self.on_error = on_error
+        self.pager = None
+        self.top = 0
+        self._visible = int(tree.cget("height"))
+        self.binding = TreeBinding(tree, self._format_row, key=self._row_key)
+
+        # 滚动完全由虚拟列表控制
+        self.scrollbar.configure(command=self.on_scrollbar)
+        self.tree.configure(yscrollcommand=lambda first, last: None)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_by(3))
+        self.tree.bind("<Up>", self.on_key_up)
+        self.tree.bind("<Down>", self.on_key_down)
+        self.tree.bind("<Prior>", lambda e: self.scroll_by(-self._visible))
+        self.tree.bind("<Next>", lambda e: self.scroll_by(self._visible))
+        self.tree.bind("<Configure>", self.on_configure)
+
+    @staticmethod
+    def _row_key(row):
+        # 占位行为 (None, 行号)
+        return row[0] if row[0] is not None else f"loading-{row[1]}"
+
+    def _format_row(self, row):
+        if row[0] is None:
+            columns = len(self.tree.cget("columns"))
+            return ("", LOADING_TEXT) + ("",) * max(0, columns - 2)
+        return self.format_row(row)
+
+    def set_pager(self, pager, keep_position=False):
+        """切换数据源（例如查询条件变化），可选择保持当前滚动位置"""
+        self.pager = pager
+        if not keep_position:
+            self.top = 0
+        if pager.total is not None and self.on_total_changed:
+            self.on_total_changed(pager.total)
+        self.render()
+
+    def refresh(self):
+        """数据变化后重新加载当前位置"""
+        if self.pager is not None:
+            self.pager.invalidate()
+            self.set_pager(self.pager, keep_position=True)
+
+    def render(self):
+        """用当前可见窗口的数据更新Treeview内容，缺少的页提交到后台读取"""
+        if self.pager is None:
+            return
+        missing = self.pager.missing_pages(self.top, self._visible, self.prefetch)
+        if missing:
+            pager = self.pager
+            db_executor.submit(self.tree, load_pages, pager, tuple(missing), key=(self, "page"),
+                               on_done=lambda result: self.on_loaded(pager, result), on_error=self.on_error)
+        total = self.pager.total
+        if total is None:
+            # 总行数未知（刚切换数据源），保留原来的行直到读取完成
+            return
+        self.top = max(0, min(self.top, total - self._visible))
+        rows = self.pager.get_rows(self.top, self._visible)
+        rows = [row if row is not None else (None, self.top + index) for index, row in enumerate(rows)]
+
+        # 只更新有变化的行，仍在可见窗口中的行（及其选中状态）保持不动
+        self.binding.update(rows, start=self.top)
+
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + len(rows)) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def on_loaded(self, pager, result):
+        """后台读取完成（界面线程）"""
+        if pager is not self.pager:
+            return
+        total = pager.total
+        if not pager.store(result):
+            return
+        if pager.total != total and self.on_total_changed:
+            self.on_total_changed(pager.total)
+        self.render()
+
+    def scroll_to(self, top):
+        if self.pager is None or self.pager.total is None:
+            return
+        top = max(0, min(int(top), self.pager.total - self._visible))
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    def scroll_by(self, rows):
+        self.scroll_to(self.top + rows)
+        return "break"
+
+    def on_scrollbar(self, *args):
+        if self.pager is None or self.pager.total is None:
+            return
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * self.pager.total)
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= self._visible
+            self.scroll_by(amount)
+
+    def on_mousewheel(self, event):
+        return self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def on_key_up(self, event):
+        children = self.tree.get_children()
+        if children and self.tree.focus() == children[0] and self.top > 0:
+            self.scroll_by(-1)
+            self.tree.focus(self.tree.get_children()[0])
+            self.tree.selection_set(self.tree.focus())
+            return "break"
+
+    def on_key_down(self, event):
+        children = self.tree.get_children()
+        if children and self.tree.focus() == children[-1]:
+            self.scroll_by(1)
+            self.tree.focus(self.tree.get_children()[-1])
+            self.tree.selection_set(self.tree.focus())
+            return "break"
+
+    def on_configure(self, event):
+        # 窗口大小变化时重新计算可见行数（减去标题行）
+        visible = max(1, event.height // self.row_height - 1)
+        if visible != self._visible:
+            self._visible = visible
+            self.render()
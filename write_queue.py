@@ -0,0 +1,220 @@
+# write_queue.py
+# 单写线程：写操作排队交给一个专门的线程执行，同时排队的多个写操作合并到一个事务中提交（组提交），
+# 同一进程内的写不再互相争抢数据库锁，也不再各自等待一次磁盘同步。
+# 服务器模式下各终端的写都发送到服务器（见 api_server.py），由服务器上的这个队列执行。
+#
+# 写操作形如 func(conn, *args)，不要自己提交或回滚；submit() 返回 Future，execute() 等待结果。
+# 每个写操作在自己的保存点中执行，失败时只撤销它自己的修改（异常交给调用方），同一批的其他操作照常提交。
+# 整批提交遇到数据库忙（例如其他程序正在写）时会回滚后整批重新执行，所以写操作只应修改数据库。
+import logging
+import math
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import config
+import query_stats
+from database import get_connection, is_busy_error
+
+logger = logging.getLogger(__name__)
+
+# 计算耗时分位数时保留的最近样本数
+LATENCY_SAMPLES = 500
+
+
+class WriteOp:
+    """排队中的一个写操作"""
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.future = Future()
+        self.queued = time.perf_counter()
+        self.site = query_stats.call_site()     # 语句统计中记为提交写操作的位置
+
+
+def percentile(samples, fraction):
+    """最近邻法求分位数，samples 已排序"""
+    if not samples:
+        return 0.0
+    return samples[max(0, math.ceil(fraction * len(samples)) - 1)]
+
+def summarize(samples):
+    """耗时样本（毫秒）的汇总"""
+    ordered = sorted(samples)
+    return {
+        "avg": sum(ordered) / len(ordered) if ordered else 0.0,
+        "p50": percentile(ordered, 0.50),
+        "p90": percentile(ordered, 0.90),
+        "p99": percentile(ordered, 0.99),
+        "max": ordered[-1] if ordered else 0.0,
+    }
+
+
+class WriteQueue:
+    """写队列和执行写操作的线程，第一次提交时启动线程"""
+
+    def __init__(self, batch_max=None):
+        self.batch_max = config.DB_WRITE_BATCH_MAX if batch_max is None else batch_max
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+        self._commit_ms = deque(maxlen=LATENCY_SAMPLES)   # 每批从开始事务到提交完成的耗时
+        self._wait_ms = deque(maxlen=LATENCY_SAMPLES)     # 每个操作从提交到得到结果的耗时
+        self._counts = {"batches": 0, "operations": 0, "failed": 0, "retries": 0, "largest_batch": 0}
+
+    def submit(self, func, *args):
+        """提交写操作 func(conn, *args)，返回 Future，结果或异常在所在批次提交后设置"""
+        op = WriteOp(func, args)
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("写队列已停止")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+            if threading.current_thread() is self._thread:
+                # 在写线程中等待自己的结果会永远等下去
+                raise RuntimeError("写操作中不能再提交写操作")
+            self._queue.put(op)
+        return op.future
+
+    def execute(self, func, *args, timeout=None):
+        """提交写操作并等待结果，写操作的异常原样抛出"""
+        return self.submit(func, *args).result(timeout)
+
+    def stop(self, timeout=None):
+        """不再接受新的写操作，等待已排队的写操作完成"""
+        with self._lock:
+            self._stopped = True
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            # 执行上一批期间排队的操作合并为一批
+            batch = [op]
+            stopping = False
+            while len(batch) < self.batch_max:
+                try:
+                    op = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op is None:
+                    stopping = True
+                    break
+                batch.append(op)
+            self._commit_batch(batch)
+            if stopping:
+                return
+
+    def _commit_batch(self, batch):
+        """在一个事务中执行一批写操作并提交，然后把各自的结果交给调用方"""
+        attempt = 0
+        while True:
+            conn = get_connection()
+            started = time.perf_counter()
+            try:
+                outcomes = self._apply(conn, batch)
+                conn.commit()
+                break
+            except Exception as e:
+                conn.rollback()
+                if isinstance(e, sqlite3.OperationalError) and is_busy_error(e) and attempt < config.DB_BUSY_RETRIES:
+                    attempt += 1
+                    self._count("retries")
+                    time.sleep(config.DB_BUSY_BACKOFF * (2 ** (attempt - 1)))
+                    continue
+                logger.warning("写入失败，本批 %d 个写操作全部回滚: %s", len(batch), e)
+                outcomes = [e] * len(batch)
+                break
+            finally:
+                conn.close()
+
+        finished = time.perf_counter()
+        with self._lock:
+            self._commit_ms.append((finished - started) * 1000)
+            self._counts["batches"] += 1
+            self._counts["operations"] += len(batch)
+            self._counts["largest_batch"] = max(self._counts["largest_batch"], len(batch))
+            for op, outcome in zip(batch, outcomes):
+                self._wait_ms.append((finished - op.queued) * 1000)
+                if isinstance(outcome, Exception):
+                    self._counts["failed"] += 1
+        for op, outcome in zip(batch, outcomes):
+            if isinstance(outcome, Exception):
+                op.future.set_exception(outcome)
+            else:
+                op.future.set_result(outcome[0])
+
+    @staticmethod
+    def _apply(conn, batch):
+        """执行一批写操作，返回每个操作的 (结果,) 或异常；数据库忙等导致整批失败的异常直接抛出"""
+        conn.execute("BEGIN IMMEDIATE")
+        outcomes = []
+        for op in batch:
+            conn.execute("SAVEPOINT write_op")
+            try:
+                with query_stats.call_context(op.site):
+                    result = op.func(conn, *op.args)
+            except Exception as e:
+                if isinstance(e, sqlite3.OperationalError) and is_busy_error(e):
+                    raise
+                conn.execute("ROLLBACK TO write_op")
+                conn.execute("RELEASE write_op")
+                outcomes.append(e)
+            else:
+                conn.execute("RELEASE write_op")
+                outcomes.append((result,))
+        return outcomes
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def get_stats(self):
+        """队列长度、批次和操作数、每批提交耗时和每个操作的等待耗时（毫秒）"""
+        with self._lock:
+            stats = dict(self._counts)
+            stats["queue_depth"] = self._queue.qsize()
+            stats["avg_batch"] = stats["operations"] / stats["batches"] if stats["batches"] else 0.0
+            stats["commit_ms"] = summarize(self._commit_ms)
+            stats["wait_ms"] = summarize(self._wait_ms)
+        return stats
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+def get_write_queue():
+    """返回全局共用的写队列"""
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteQueue()
+        return _write_queue
+
+def submit(func, *args):
+    return get_write_queue().submit(func, *args)
+
+def execute(func, *args, timeout=None):
+    return get_write_queue().execute(func, *args, timeout=timeout)
+
+def get_write_stats():
+    return get_write_queue().get_stats()
+
+def stop_write_queue():
+    """程序退出前调用：等待已排队的写操作完成"""
+    global _write_queue
+    with _write_queue_lock:
+        write_queue, _write_queue = _write_queue, None
+    if write_queue is not None:
+        write_queue.stop()